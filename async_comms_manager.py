@@ -0,0 +1,288 @@
+import asyncio
+import queue
+import threading
+import time
+from comms_manager import CommsManager
+
+
+class AsyncCommsManager(CommsManager):
+    """ Alternative to CommsManager, driving every Tello from a single asyncio event loop rather than threads.
+
+        CommsManager uses one OS thread per Tello, plus receive and status threads.  AsyncCommsManager instead runs one
+        event loop (in a single background thread) with datagram endpoints for the control and status ports, and a
+        lightweight task per Tello to manage its command_queue - allowing hundreds of Tellos, e.g. in a simulator.
+
+        The public methods (init_tellos, queue_command, wait_sync, get_tello, close_connections) are identical to
+        CommsManager, and remain blocking calls intended to be made from outside the event loop, e.g. by FlyTello.
+    """
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def close_connections(self):
+        """ Close all comms and stop the event loop - to tidy up before exiting """
+        self.terminate_comms = True
+        if self.rc_stream is not None:
+            self.rc_stream.close()
+        self._run(self._close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        for tello in self.tellos:
+            tello.log.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.scheduler.close()
+        self.journal.close()
+
+    #
+    # PRIVATE HELPER METHODS
+    #
+
+    def _open_comms(self):
+        """ Start the event loop in its own thread, and open the control endpoint ready for communicating with Tellos.
+
+            The status endpoint is only opened if requested in init_tellos.
+        """
+
+        # Event loop, running in its own thread, which performs all network communication with the Tellos
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever)
+        self.loop_thread.daemon = True
+        self.loop_thread.start()
+
+        # The command_handler task for each Tello, and the Event used to wake each task when a response is received
+        self.command_handler_tasks = []
+        self.response_events = {}
+        # Event set when each barrier command (FanOut) is released, for the tasks waiting on it
+        self.fan_out_events = {}
+
+        # Endpoint for primary bi-directional communication with Tello, and (not activated here) for status messages
+        self.control_transport = self._run(self._open_endpoint(self.control_port, self._handle_response))
+        self.status_transport = None
+
+    def _run(self, coro):
+        """ Run a coroutine on the event loop from another thread, blocking until it completes.
+
+            :param coro: The coroutine to run.
+            :return: The result of the coroutine.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def _open_endpoint(self, port, handler):
+        """ Open a UDP endpoint bound to the specified port, passing each datagram received to handler.
+
+            :param port: Local port number to bind to.
+            :param handler: Function called as handler(data, ip) for each datagram received.
+            :return: The asyncio DatagramTransport for the endpoint.
+        """
+        transport, _ = await self.loop.create_datagram_endpoint(lambda: _DatagramProtocol(self, handler),
+                                                                local_addr=(self.local_ip or '0.0.0.0', port))
+        return transport
+
+    async def _close(self):
+        """ Cancel each command_handler task, which will otherwise be awaiting its next command, then close the
+             endpoints.
+        """
+        for task in self.command_handler_tasks:
+            task.cancel()
+        await asyncio.gather(*self.command_handler_tasks, return_exceptions=True)
+        self.control_transport.close()
+        if self.status_transport is not None:
+            self.status_transport.close()
+
+    def _send_raw(self, ip, command):
+        """ Send a command string to the specified IP, without queuing or logging it.
+
+            Safe to call from any thread - if not called from the event loop, the send is handed over to the loop.
+
+            :param ip: IP address of the Tello, as a string e.g. '192.168.1.51'
+            :param command: The Tello SDK string to send, e.g. 'command'.
+        """
+        if threading.get_ident() == self.loop_thread.ident:
+            self.control_transport.sendto(command.encode(), (ip, self.control_port))
+        else:
+            self.loop.call_soon_threadsafe(self.control_transport.sendto, command.encode(), (ip, self.control_port))
+
+    def _send_burst(self, ips, command):
+        """ Send the same command string to several IPs back to back - must be called from the event loop.
+
+            :param ips: List of IP addresses, as strings.
+            :param command: The Tello SDK string to send.
+            :return: List of the time (perf_counter) at which each datagram was sent.
+        """
+        data = command.encode()
+        send_times = []
+        for ip in ips:
+            self.control_transport.sendto(data, (ip, self.control_port))
+            send_times.append(time.perf_counter())
+        return send_times
+
+    def _send_priority(self, ips, command):
+        """ Send a priority command to several IPs back to back - handed over to the event loop, if necessary.
+
+            :return: List of the time (perf_counter) at which each datagram was sent.
+        """
+        if threading.get_ident() == self.loop_thread.ident:
+            return self._send_burst(ips, command)
+        return self._run(self._send_burst_async(ips, command))
+
+    async def _send_burst_async(self, ips, command):
+        return self._send_burst(ips, command)
+
+    def _abort_command(self, tello, log_entry):
+        """ Give up on a command which has been (or is about to be) sent, then wake its command_handler task. """
+        super()._abort_command(tello, log_entry)
+        if tello.ip in self.response_events:
+            self.loop.call_soon_threadsafe(self.response_events[tello.ip].set)
+
+    def _start_command_handler(self, tello):
+        """ Start the command_handler task for the specified Tello, to process its command_queue.
+
+            :param tello: The Tello object for which to start the command_handler.
+        """
+        self._run(self._create_command_handler(tello))
+
+    async def _create_command_handler(self, tello):
+        """ Create the Events and command_handler task for a Tello - must run on the event loop.
+
+            :param tello: The Tello object for which to create the command_handler.
+        """
+        queued_event = asyncio.Event()
+        self.response_events[tello.ip] = asyncio.Event()
+        # Wake the task whenever a command is queued, from whichever thread queues it
+        tello.on_command_queued = lambda: self.loop.call_soon_threadsafe(queued_event.set)
+        self.command_handler_tasks.append(self.loop.create_task(self._command_handler(tello, queued_event)))
+
+    def _start_status_listener(self):
+        """ Open the status endpoint, which receives status messages from the Tellos. """
+        self.status_transport = self._run(self._open_endpoint(self.status_port, self._handle_status))
+
+    def _handle_response(self, response, ip):
+        """ Process a single message received from a Tello on the control port, then wake its command_handler.
+
+            :param response: The raw bytes received from the Tello.
+            :param ip: IP address of the Tello which sent the response, as a string.
+        """
+        super()._handle_response(response, ip)
+        if ip in self.response_events:
+            self.response_events[ip].set()
+
+    async def _send_command(self, tello, log_entry, timeout=None):
+        """ Actually send a command to the Tello at specified IP address, recording details in the Tello's log.
+
+            :param tello: The Tello object for which we're sending the command
+            :param log_entry: The TelloCommand taken from the Tello's queue, which is transferred to its log.
+            :param timeout: Max seconds to wait for the response once sent, or None (default) to allow for how long the
+                             command is expected to take, plus the Tello's learned response latency.
+        """
+        if timeout is None:
+            timeout = tello.response_timeout(log_entry)
+
+        # Add the command to the Tello's log first
+        tello.add_to_log(log_entry)
+
+        # Answer from the latest status instead, if recent enough - saving a round trip
+        if self._read_from_status(tello, log_entry):
+            return
+
+        # Then send the command - straight away, at its release_time (via the scheduler thread, which hands the send
+        #  over to the event loop), or together with the other Tellos if it's a barrier command
+        delay = 0.0
+        if log_entry.release_time is not None:
+            delay = max(0.0, log_entry.release_time - time.monotonic())
+            self._schedule_command(tello, log_entry)
+        elif log_entry.fan_out is None:
+            log_entry.sent_time = time.time()
+            if self._send_unless_flushed(tello, log_entry):
+                self.journal.log_command('sent', tello, log_entry)
+        else:
+            await self._send_barrier_command(tello, log_entry)
+
+        # Wait until a response has been received, resending or timing out if not.  The response Event is set on the
+        #  event loop, so there is no race between checking the response and clearing the Event.
+        response_event = self.response_events[tello.ip]
+        deadline = self.loop.time() + timeout + delay
+        while log_entry.response is None:
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                timeout = self._retry_command(tello, log_entry, timeout)
+                if timeout is None:
+                    return
+                deadline = self.loop.time() + timeout
+                continue
+            response_event.clear()
+            try:
+                await asyncio.wait_for(response_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send_barrier_command(self, tello, log_entry):
+        """ Wait for every Tello to be ready for a barrier command (or timeout), then send it to all back to back.
+
+            :param tello: The Tello object for which we're sending the command.
+            :param log_entry: The TelloCommand, whose fan_out is shared with the other Tellos.
+        """
+        fan_out = log_entry.fan_out
+        released = self.fan_out_events.setdefault(fan_out, asyncio.Event())
+        batch = fan_out.arrive(tello, log_entry)
+        if not batch:
+            try:
+                await asyncio.wait_for(released.wait(), fan_out.timeout)
+            except asyncio.TimeoutError:
+                pass
+            batch = fan_out.flush()
+        if batch:
+            self._send_fan_out(fan_out, batch)
+            released.set()
+        if fan_out.complete:
+            self.fan_out_events.pop(fan_out, None)
+
+    #
+    # TASKS
+    #
+
+    async def _command_handler(self, tello, queued_event):
+        """ Run Command Handler as a separate task for each Tello, to manage the queue of commands.
+
+            Equivalent to the CommsManager thread of the same name, but awaiting rather than blocking, so that a single
+            event loop can manage many Tellos at once.
+
+            :param tello: The Tello object with which the command_handler should be associated.
+            :param queued_event: asyncio.Event which is set each time a command is added to the Tello's command_queue.
+        """
+        while True:
+            # Clear the Event *before* checking the queue, so that a command queued in between can't be missed
+            queued_event.clear()
+            try:
+                command = tello.command_queue.get_nowait()
+            except queue.Empty:
+                await queued_event.wait()
+                continue
+            if command is None:
+                # Queue has been closed, i.e. close_connections has been called
+                return
+            await self._send_command(tello, command)
+            tello.command_done()
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    """ Minimal asyncio protocol, passing each datagram received on to an AsyncCommsManager handler method. """
+
+    def __init__(self, comms_manager, handler):
+        """ :param comms_manager: The AsyncCommsManager which owns this endpoint.
+            :param handler: Function called as handler(data, ip) for each datagram received.
+        """
+        self.comms_manager = comms_manager
+        self.handler = handler
+
+    def datagram_received(self, data, addr):
+        """ Pass the datagram to the handler, reporting (rather than raising) errors e.g. from an unknown Tello. """
+        try:
+            self.handler(data, str(addr[0]))
+        except RuntimeError as exc:
+            self.comms_manager.journal.log('error', str(addr[0]), error=str(exc))
+
+    def error_received(self, exc):
+        """ Report socket errors, but only if we've not told it to terminate_comms. """
+        if not self.comms_manager.terminate_comms:
+            self.comms_manager.journal.log('socket_error', error=str(exc))
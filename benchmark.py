@@ -0,0 +1,226 @@
+#
+# Benchmark suite for FlyTello / CommsManager, run against a local TelloSimulator fleet.
+#
+# Measures, for each fleet size: discovery time (cold, and warm from the discovery cache), FlyTello command
+#  round-trip, 'All' fan-out dispatch and skew (with and without a barrier), wait_sync wake-up latency, priority stop
+#  latency (against PRIORITY_TARGET_MS), and idle CPU usage.  Results are written as JSON, so they can be compared
+#  between releases, e.g.:
+#       python benchmark.py --sizes 1,5,20 --output benchmark_results.json
+#
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from fly_tello import FlyTello
+from tello_simulator import TelloSimulator
+
+
+# Target for priority commands (e.g. stop / emergency): every Tello to have received it within this time of the call,
+#  at the 95th percentile, for a local fleet of PRIORITY_TARGET_TELLOS - only checked at that fleet size
+PRIORITY_TARGET_MS = 5.0
+PRIORITY_TARGET_TELLOS = 50
+# Duration of each simulated move in the priority benchmark, i.e. the move which is cut short
+PRIORITY_MOVE_SECS = 0.5
+
+
+#
+# FUNCTION DEFINITIONS
+#
+
+def summarise(samples):
+    """ Summarise a list of timings (in seconds) as a dict of statistics, in milliseconds. """
+    samples_ms = sorted(sample * 1000 for sample in samples)
+    return {'median_ms': round(statistics.median(samples_ms), 3),
+            'p95_ms': round(samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * 0.95))], 3),
+            'max_ms': round(samples_ms[-1], 3),
+            'samples': len(samples_ms)}
+
+
+def measure_cpu(secs):
+    """ Sleep for secs, returning the CPU used by this whole process in that time, as a percentage of one core. """
+    cpu_start = time.process_time()
+    time.sleep(secs)
+    return (time.process_time() - cpu_start) / secs * 100
+
+
+def bench_discovery(sim, backend, cache_file):
+    """ Time from starting FlyTello until all Tellos are found and numbered, returning (FlyTello, seconds). """
+    time_start = time.perf_counter()
+    fly = FlyTello(sim.serials, backend=backend, local_ip='127.0.0.1', subnet='127.0.0.0/24',
+                   first_ip=2, last_ip=1 + len(sim.tellos), cache_file=cache_file)
+    return fly, time.perf_counter() - time_start
+
+
+def bench_round_trip(fly, repeats):
+    """ End-to-end time for a FlyTello command to all Tellos, from the call until wait_sync returns. """
+    samples = []
+    for _ in range(repeats):
+        time_start = time.perf_counter()
+        fly.up(20)
+        fly.wait_sync()
+        samples.append(time.perf_counter() - time_start)
+    return summarise(samples)
+
+
+def bench_fan_out(fly, sim, repeats, barrier=False):
+    """ For queue_command(..., 'All'): time until every Tello has received the datagram, and inter-Tello skew.
+
+        Arrival times are taken from the simulator, i.e. when each datagram actually arrived at each virtual Tello.
+    """
+    dispatch, skew = [], []
+    for _ in range(repeats):
+        fly.wait_sync()
+        first_index = [len(tello.received) for tello in sim.tellos]
+        time_start = time.perf_counter()
+        fly.tello_mgr.queue_command('down 20', 'Control', 'All', barrier=barrier)
+        fly.wait_sync()
+        arrivals = [tello.received[index][0] for tello, index in zip(sim.tellos, first_index)]
+        dispatch.append(max(arrivals) - time_start)
+        skew.append(max(arrivals) - min(arrivals))
+    return summarise(dispatch), summarise(skew)
+
+
+def bench_wait_sync(fly, sim, repeats):
+    """ Time from the last reply leaving the (simulated) Tellos, until wait_sync returns. """
+    samples = []
+    for _ in range(repeats):
+        fly.wait_sync()
+        fly.tello_mgr.queue_command('speed 50', 'Set', 'All')
+        fly.wait_sync()
+        time_end = time.perf_counter()
+        samples.append(time_end - max(tello.replies[-1][0] for tello in sim.tellos))
+    return summarise(samples)
+
+
+def bench_priority(fly, sim, repeats):
+    """ For stop(), i.e. CommsManager.priority_command: time until every Tello has received it, whilst each Tello is
+        mid-way through a move with further commands queued behind it.
+
+        Also counts any queued commands which reached a Tello after the stop - there should be none.
+    """
+    samples, late_commands = [], 0
+    for _ in range(repeats):
+        fly.wait_sync()
+        first_index = [len(tello.received) for tello in sim.tellos]
+        fly.forward(100, sync=False)
+        fly.up(20, sync=False)
+        fly.down(20, sync=False)
+        # Stop once every Tello has started its move
+        while not all(any(command == 'forward 100' for _, command in tello.received[index:])
+                      for tello, index in zip(sim.tellos, first_index)):
+            time.sleep(0.001)
+        time_start = time.perf_counter()
+        fly.stop()
+        while not all(any(command == 'stop' for _, command in tello.received[index:])
+                      for tello, index in zip(sim.tellos, first_index)):
+            time.sleep(0.001)
+        fly.wait_sync()
+        arrivals = []
+        for tello, index in zip(sim.tellos, first_index):
+            commands = [command for _, command in tello.received[index:]]
+            arrivals.append(tello.received[index + commands.index('stop')][0])
+            late_commands += len(commands) - commands.index('stop') - 1
+        samples.append(max(arrivals) - time_start)
+        # Let the reply to the move which was cut short arrive, before the next repeat
+        time.sleep(PRIORITY_MOVE_SECS)
+    return summarise(samples), late_commands
+
+
+def bench_fleet(size, backend, repeats, idle_secs):
+    """ Run all benchmarks against a simulated fleet of the given size, returning a dict of results. """
+    # Status messages are turned off, so idle CPU is just that of FlyTello and the (mostly idle) simulator threads.
+    with TelloSimulator(size, status_interval=None, command_durations={'forward': PRIORITY_MOVE_SECS}) as sim, \
+            tempfile.TemporaryDirectory() as cache_dir:
+        simulator_cpu = measure_cpu(idle_secs)
+        # Cold discovery searches the whole subnet (and populates the cache), warm discovery then uses the cache
+        cache_file = '%s/discovery_cache.json' % cache_dir
+        fly, discovery = bench_discovery(sim, backend, cache_file)
+        with fly:
+            fly.takeoff()
+            fly.wait_sync()
+            fly_cpu = measure_cpu(idle_secs)
+            round_trip = bench_round_trip(fly, repeats)
+            fan_out_dispatch, fan_out_skew = bench_fan_out(fly, sim, repeats)
+            barrier_dispatch, barrier_skew = bench_fan_out(fly, sim, repeats, barrier=True)
+            # Skew as measured by CommsManager itself, i.e. between the first and last datagrams leaving the socket
+            barrier_send_skew = summarise([fan_out.skew for fan_out in list(fly.tello_mgr.fan_outs)[-repeats:]])
+            wait_sync = bench_wait_sync(fly, sim, repeats)
+            priority, priority_late_commands = bench_priority(fly, sim, repeats)
+            fly.land()
+        fly, warm_discovery = bench_discovery(sim, backend, cache_file)
+        with fly:
+            pass
+    return {'discovery_ms': round(discovery * 1000, 3),
+            'warm_discovery_ms': round(warm_discovery * 1000, 3),
+            'round_trip': round_trip,
+            'fan_out_dispatch': fan_out_dispatch,
+            'fan_out_skew': fan_out_skew,
+            'barrier_dispatch': barrier_dispatch,
+            'barrier_skew': barrier_skew,
+            'barrier_send_skew': barrier_send_skew,
+            'wait_sync_wakeup': wait_sync,
+            'priority_stop': priority,
+            'priority_late_commands': priority_late_commands,
+            'priority_target_met': (priority['p95_ms'] <= PRIORITY_TARGET_MS if size == PRIORITY_TARGET_TELLOS
+                                    else None),
+            'idle_cpu_percent': round(max(0.0, fly_cpu - simulator_cpu), 2)}
+
+
+def git_revision():
+    """ Returns the current git commit hash, or None if not available. """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, backend='thread', repeats=20, idle_secs=2.0, quiet=True):
+    """ Run the benchmarks for each fleet size, returning all results (and details of the run) as a dict.
+
+        :param sizes: List of fleet sizes (number of virtual Tellos) to benchmark.
+        :param backend: Either 'thread' or 'asyncio' - passed to FlyTello.
+        :param repeats: Number of times each timing is repeated, for each fleet size.
+        :param idle_secs: Seconds over which idle CPU usage is measured.
+        :param quiet: If True, hide everything FlyTello prints to the console whilst running.
+        :return: Dict of results, keyed by fleet size.
+    """
+    results = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'git_revision': git_revision(),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'backend': backend,
+               'repeats': repeats,
+               'fleets': {}}
+    for size in sizes:
+        print('[Benchmark]Fleet of %d Tello(s)...' % size)
+        console = io.StringIO() if quiet else None
+        with contextlib.redirect_stdout(console) if quiet else contextlib.nullcontext():
+            results['fleets'][str(size)] = bench_fleet(size, backend, repeats, idle_secs)
+        print('[Benchmark]%s' % json.dumps(results['fleets'][str(size)]))
+    return results
+
+
+#
+# MAIN SCRIPT
+#
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark FlyTello against a simulated fleet of Tellos.')
+    parser.add_argument('--sizes', default='1,5,10,20,50', help='Comma-separated list of fleet sizes')
+    parser.add_argument('--backend', default='thread', choices=['thread', 'asyncio'], help='CommsManager backend')
+    parser.add_argument('--repeats', type=int, default=20, help='Number of repeats for each timing')
+    parser.add_argument('--idle-secs', type=float, default=2.0, help='Seconds over which to measure idle CPU')
+    parser.add_argument('--output', default='benchmark_results.json', help='File to write JSON results to')
+    args = parser.parse_args()
+
+    all_results = run_benchmarks([int(size) for size in args.sizes.split(',')], backend=args.backend,
+                                 repeats=args.repeats, idle_secs=args.idle_secs)
+    with open(args.output, 'w') as output_file:
+        json.dump(all_results, output_file, indent=2)
+    print('[Benchmark]Results written to %s' % args.output)
@@ -0,0 +1,73 @@
+import heapq
+import threading
+import time
+
+
+class CommandScheduler:
+    """ Sends datagrams at absolute (time.monotonic) release times, using a heap of pending releases and one thread.
+
+        The thread sleeps until just before the next release is due, then spins for the final spin_margin seconds, as
+         sleeping alone is only accurate to around a millisecond (or much worse, on some platforms).  Everything due at
+         the same time is then released back to back - e.g. the same move for every Tello in a formation.
+    """
+
+    def __init__(self, spin_margin=0.002, on_error=None):
+        """ :param spin_margin: Seconds before each release at which the thread stops sleeping and starts spinning.
+            :param on_error: Optional function on_error(exc), called if a callback raises an Exception - which is
+                              otherwise ignored, so that one failed release can't stop any later ones.
+        """
+        self.spin_margin = spin_margin
+        self.on_error = on_error
+        self.heap = []
+        self.sequence = 0
+        self.condition = threading.Condition()
+        self.terminate = False
+        self.thread = threading.Thread(target=self._scheduler_thread)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def schedule(self, release_time, callback):
+        """ Call callback() from the scheduler thread at release_time - safe to call from any thread.
+
+            :param release_time: Time, as returned by time.monotonic(), at which to call callback.
+            :param callback: Function with no arguments, e.g. one which sends a command to a Tello.
+        """
+        with self.condition:
+            self.sequence += 1
+            heapq.heappush(self.heap, (release_time, self.sequence, callback))
+            self.condition.notify()
+
+    def close(self):
+        """ Stop the scheduler thread - any releases still pending are dropped. """
+        with self.condition:
+            self.terminate = True
+            self.condition.notify()
+        self.thread.join()
+
+    #
+    # THREADS
+    #
+
+    def _scheduler_thread(self):
+        """ Wait for each release time in turn, then call every callback which is due. """
+        while True:
+            with self.condition:
+                while not self.terminate and (not self.heap
+                                              or self.heap[0][0] - time.monotonic() > self.spin_margin):
+                    self.condition.wait(self.heap[0][0] - time.monotonic() - self.spin_margin if self.heap else None)
+                if self.terminate:
+                    return
+                release_time = self.heap[0][0]
+            # Spin (outside the lock, so more commands can still be scheduled) for the last fraction of a millisecond
+            while time.monotonic() < release_time:
+                pass
+            with self.condition:
+                due = []
+                while self.heap and self.heap[0][0] <= time.monotonic():
+                    due.append(heapq.heappop(self.heap)[2])
+            for callback in due:
+                try:
+                    callback()
+                except Exception as exc:
+                    if self.on_error is not None:
+                        self.on_error(exc)
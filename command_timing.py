@@ -0,0 +1,109 @@
+import math
+
+
+# Assumed performance of a Tello, used to estimate how long each command takes to complete.  These are deliberately
+#  conservative (i.e. on the quick side), so that estimates don't reject commands which would in fact be possible.
+DEFAULT_SPEED = 100         # cm/s - the speed reported by 'speed?' until changed by 'speed x'
+ROTATION_SPEED = 100        # degrees/s
+COMMAND_OVERHEAD = 0.2      # secs, added to every Control command for acceleration and the response
+FIXED_DURATIONS = {'takeoff': 4.0, 'land': 4.0, 'flip': 1.5, 'command': 0.0, 'stop': 0.0, 'emergency': 0.0,
+                   'streamon': 0.0, 'streamoff': 0.0, 'rc': 0.0}
+READ_SET_DURATION = 0.05    # secs, for Read and Set commands which the Tello answers straight away
+SET_STALE_WINDOW = 0.02     # secs - whilst late replies are expected, a quicker 'ok' to a Set command is taken as one
+
+# Response timeouts are the expected duration, scaled up as the estimates are on the quick side, plus a margin learned
+#  from each Tello's response latency.  Until enough responses have been seen, the margin starts out generous.
+TIMEOUT_FACTOR = 2.0
+MIN_TIMEOUT = 0.5           # secs
+CONTROL_ALLOWANCE = 3.0     # secs, added for Control commands - a real move also has to accelerate, stop and settle
+MAX_MARGIN = 10.0           # secs
+INITIAL_LATENCY = 0.3       # secs
+INITIAL_DEVIATION = 0.3     # secs
+
+
+def _distance(*coords):
+    return math.sqrt(sum(coord * coord for coord in coords))
+
+
+def estimate_duration(command, command_type, speed=DEFAULT_SPEED):
+    """ Estimate the seconds a Tello takes to complete a command - from the kinematics of the move, where known.
+
+        :param command: The Tello SDK string, e.g. 'forward 50' or 'curve 20 20 0 40 60 0 30'.
+        :param command_type: Either 'Control', 'Set' or 'Read'.
+        :param speed: The Tello's current speed setting (cm/s), used for moves which don't specify their own speed.
+        :return: Estimated seconds, including COMMAND_OVERHEAD.
+    """
+    if command_type != 'Control':
+        return READ_SET_DURATION
+    parts = command.split(' ')
+    name = parts[0]
+    try:
+        args = [int(arg) for arg in parts[1:] if arg.lstrip('-').isdigit()]
+        if name in FIXED_DURATIONS:
+            return FIXED_DURATIONS[name] + COMMAND_OVERHEAD
+        if name in ('up', 'down', 'left', 'right', 'forward', 'back'):
+            return args[0] / speed + COMMAND_OVERHEAD
+        if name in ('cw', 'ccw'):
+            return args[0] / ROTATION_SPEED + COMMAND_OVERHEAD
+        if name == 'go':
+            # go x y z speed [mid]
+            return _distance(*args[0:3]) / args[3] + COMMAND_OVERHEAD
+        if name == 'curve':
+            # curve x1 y1 z1 x2 y2 z2 speed [mid] - arc length approximated by the path via the first point
+            first, second = args[0:3], args[3:6]
+            length = _distance(*first) + _distance(*[b - a for a, b in zip(first, second)])
+            return length / args[6] + COMMAND_OVERHEAD
+        if name == 'jump':
+            # jump x y z speed yaw mid1 mid2
+            return _distance(*args[0:3]) / args[3] + abs(args[4]) / ROTATION_SPEED + COMMAND_OVERHEAD
+    except (IndexError, ZeroDivisionError):
+        pass
+    return COMMAND_OVERHEAD
+
+
+def command_timeout(expected_duration, margin, command_type='Read'):
+    """ Seconds to wait for the response to a command, before treating it as lost.
+
+        :param expected_duration: Estimated seconds the command takes, as returned by estimate_duration().
+        :param margin: Seconds allowed on top, for the Tello's response latency - see LatencyEstimator.margin.
+        :param command_type: Either 'Control', 'Set' or 'Read'.
+    """
+    allowance = CONTROL_ALLOWANCE if command_type == 'Control' else 0.0
+    return max(MIN_TIMEOUT, expected_duration * TIMEOUT_FACTOR + allowance + margin)
+
+
+class LatencyEstimator:
+    """ Learns how long a Tello takes to answer, smoothed in the same way as TCP's retransmission timer (RFC 6298).
+
+        Only commands which the Tello answers straight away (Read and Set) are sampled, so that the margin reflects
+         the network and the Tello itself, rather than the accuracy of the estimated duration of each move.
+    """
+
+    def __init__(self, gain=0.125, deviation_gain=0.25):
+        """ :param gain: Weight given to each new sample in the smoothed latency.
+            :param deviation_gain: Weight given to each new sample in the smoothed deviation.
+        """
+        self.gain = gain
+        self.deviation_gain = deviation_gain
+        self.latency = INITIAL_LATENCY
+        self.deviation = INITIAL_DEVIATION
+        self.samples = 0
+
+    @property
+    def margin(self):
+        """ Seconds to allow for the response, on top of the command's expected duration. """
+        return min(MAX_MARGIN, self.latency + 4 * self.deviation)
+
+    def update(self, latency):
+        """ Add the latency (secs, from sending to the response) of a Read or Set command. """
+        if self.samples == 0:
+            self.latency = latency
+            self.deviation = latency / 2
+        else:
+            self.deviation += self.deviation_gain * (abs(latency - self.latency) - self.deviation)
+            self.latency += self.gain * (latency - self.latency)
+        self.samples += 1
+
+    def timed_out(self):
+        """ Widen the margin after a timeout, in case it was too tight - narrowed again by later responses. """
+        self.deviation = min(MAX_MARGIN, self.deviation * 2)
@@ -1,9 +1,25 @@
+import collections
+import concurrent.futures
+import contextlib
+import os
 import socket
 import netifaces
 import netaddr
 import threading
 import time
-from tello import Tello
+from tello import Tello, TelloRegistry, FanOut, SyncResult
+from command_timing import COMMAND_OVERHEAD, SET_STALE_WINDOW, command_timeout, estimate_duration
+from flight_journal import FlightJournal
+from tello_status import parse_status, read_from_status
+from command_scheduler import CommandScheduler
+from rc_stream import RcStream
+from discovery_cache import DiscoveryCache, DEFAULT_CACHE_FILE
+from telemetry_store import TelemetryStore
+from telemetry_recorder import TelemetryRecorder
+
+
+# Commands which may be sent via priority_command, i.e. straight away, ahead of anything already queued
+PRIORITY_COMMANDS = ('emergency', 'stop', 'land')
 
 
 class CommsManager:
@@ -12,50 +28,105 @@ class CommsManager:
     # CLASS INIT & SETUP
     #
 
-    def __init__(self):
+    def __init__(self, log_size=10000, log_dir=None, local_ip='', journal_file=None, console_level='info',
+                 fan_out_timeout=1.0, max_retries=2, rc_rate=20.0, rc_hold_time=0.5):
         """ Open sockets ready for communicating with one or more Tellos.
 
             Also initiate the threads for receiving control messages and status from Tello.
             Also create the placeholder list for Tello objects.
+
+            :param log_size: Max number of log entries each Tello keeps in memory, or None for no limit.
+            :param log_dir: Directory to which older log entries are appended (one file per Tello), or None to discard.
+            :param local_ip: Local address to bind to, or '' for all interfaces.  e.g. '127.0.0.1' for the simulator.
+            :param journal_file: File to which every command, response and search event is appended (as JSON Lines).
+            :param console_level: Lowest level of journal event printed to the console - 'debug' to print every
+                                   command and response, 'info', 'warning' or 'error'.
+            :param fan_out_timeout: Max seconds a barrier command (see queue_command) waits for every Tello to be ready.
+            :param max_retries: Max times a Read or Set command is resent if no response is received in time.
+            :param rc_rate: Times per second each Tello is sent its rc setpoint, once set via set_rc.
+            :param rc_hold_time: Seconds an rc setpoint is repeated without being updated, before sending neutral.
         """
 
         self.terminate_comms = False
-
-        # Socket for primary bi-directional communication with Tello
+        self.local_ip = local_ip
         self.control_port = 8889
-        self.control_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # socket for sending cmd
-        self.control_socket.bind(('', self.control_port))
-
-        # Socket for receiving status messages from Tello - not activated here
         self.status_port = 8890
-        self.status_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.status_thread = None
 
-        # Thread for receiving messages from Tello
-        self.receive_thread = threading.Thread(target=self._receive_thread)
-        self.receive_thread.daemon = True
-        self.receive_thread.start()
+        # Journal of commands, responses and other events - written (and printed) by its own background thread
+        self.journal = FlightJournal(journal_file, console_level)
+
+        # Reference to all active Tellos (indexed by IP, num and sn), and settings for each Tello's log
+        self.tellos = TelloRegistry()
+        self.log_size = log_size
+        self.log_dir = log_dir
+
+        # Notified (and discovery_events incremented) on every response, to wake the discovery loop in init_tellos
+        self.discovery_condition = threading.Condition()
+        self.discovery_events = 0
+        self.discovery_report = None
+
+        # Notified whenever any Tello becomes idle, so that wait_sync can wait on a whole group of Tellos at once
+        self.idle_condition = threading.Condition()
 
-        # Reference to all active Tellos
-        self.tellos = []
+        # Barrier commands wait up to fan_out_timeout for all Tellos - the most recent are kept, e.g. to check skew
+        self.fan_out_timeout = fan_out_timeout
+        self.fan_outs = collections.deque(maxlen=100)
 
-    def init_tellos(self, sn_list, get_status=False, first_ip=1, last_ip=254):
+        # Read and (most) Set commands are safe to repeat, so are resent (with backoff) if their response is lost
+        self.max_retries = max_retries
+
+        # Sends commands queued with a release_time, at that time
+        self.scheduler = CommandScheduler(on_error=lambda exc: self.journal.log('sched_error', error=repr(exc)))
+
+        # Streams rc setpoints to the Tellos, outside of their command queues - only started once first used
+        self.rc_rate = rc_rate
+        self.rc_hold_time = rc_hold_time
+        self.rc_stream = None
+
+        # Optional history and recording of status messages from all Tellos - only created if requested in init_tellos
+        self.telemetry = None
+        self.recorder = None
+        # If set in init_tellos, Read commands are answered from status messages up to this many secs old, if possible
+        self.status_read_age = None
+        # Callables run as listener(tello, data) for each status message received, with the raw message (bytes, or a
+        #  memoryview valid only during the call) - e.g. to stream status to TelloGateway clients
+        self.status_listeners = []
+
+        self._open_comms()
+
+    def init_tellos(self, sn_list, get_status=False, first_ip=1, last_ip=254, subnet=None,
+                    cache_file=DEFAULT_CACHE_FILE, telemetry_history=0, telemetry_record=None, status_read_age=None):
         """ Search the network until found the specified number of Tellos, then get each Tello ready for use.
 
             This must be run once; generally the first thing after initiating CommsManager.
             The 'command' message is sent to every IP on the network, with the response_handler thread managing the
              responses to create Tello objects in self.tellos.
-            A command_handler is then created for each, which manages the command_queue for each.
-            Finally, each Tello is queried for its serial number, which is stored in the Tello object with its number.
+            As each Tello is found, a command_handler is created for it, which manages its command_queue.  Each Tello
+             is then immediately queried for its serial number, which is stored in the Tello object with its number.
+            Addresses where the requested Tellos were last found (per the discovery cache) are contacted first, and
+             the rest of the network is only searched if any of those Tellos don't answer.
+            Details and timings of the search are saved in self.discovery_report.
 
             :param sn_list: List of serial numbers, in order we want to number the Tellos.
             :param get_status: True to listen for and record the status messages from the Tellos.
             :param first_ip: If known, we can specify a smaller range of IP addresses to speed up the search.
             :param last_ip: If known, we can specify a smaller range of IP addresses to speed up the search.
+            :param subnet: Optionally, a /24 network to search (e.g. '127.0.0.0/24'), instead of the local interfaces.
+            :param cache_file: Path of the discovery cache file, or None to always search the whole network.
+            :param telemetry_history: If get_status, the number of status messages to keep per Tello in self.telemetry
+                                       (a TelemetryStore, which requires numpy), or 0 to keep only the latest.
+            :param telemetry_record: If get_status, path of a file in which to record every status message (see
+                                      TelemetryRecorder), or None.
+            :param status_read_age: If get_status, answer Read commands covered by the status message (e.g. 'battery?',
+                                     but not 'speed?') from status received within this many secs, rather than asking
+                                     the Tello - or None (default) to always ask the Tello.
         """
 
         # Get network addresses to search
-        subnets, address = self._get_subnets()
+        if subnet is None:
+            subnets, address = self._get_subnets()
+        else:
+            subnets, address = [(netaddr.IPNetwork(subnet).network, '255.255.255.0')], [self.local_ip]
         possible_addr = []
 
         # Create a list of possible IP addresses to search
@@ -68,64 +139,31 @@ class CommsManager:
                     continue
                 possible_addr.append(str(ip))
 
-        # Continue looking until we've found them all
-        num = len(sn_list)
-        while len(self.tellos) < num:
-            print('[Tello Search]Looking for %d Tello(s)' % (num - len(self.tellos)))
-
-            # Remove any found Tellos from the list to search
-            for tello_ip in [tello.ip for tello in self.tellos]:
-                if tello_ip in possible_addr:
-                    possible_addr.remove(tello_ip)
-
-            # Try contacting Tello via each possible_addr
-            for ip in possible_addr:
-                self.control_socket.sendto('command'.encode(), (ip, self.control_port))
-
-            # Responses to the command above will be picked up in receive_thread.  Here we check regularly to see if
-            #  they've all been found, so we can break out quickly.  But after several failed attempts, go around the
-            #  whole loop again and retry contacting.
-            for _ in range(0, 10):
-                time.sleep(0.5)
-                if len(self.tellos) >= num:
-                    break
+        # Find and identify all Tellos, trying any cached addresses first.  Each Tello's command_handler is started as
+        #  soon as it is found, so that its serial number can be queried straight away.
+        cache = DiscoveryCache(cache_file) if cache_file is not None else None
+        cached_addr = cache.addresses(sn_list, possible_addr) if cache is not None else []
+        self._discover_tellos(possible_addr, sn_list, cached_addr)
+        if cache is not None:
+            cache.update(self.tellos)
 
-        # Once we have all Tellos, startup a command_handler for each.  These manage the command queues for each Tello.
-        for tello in self.tellos:
-            command_handler_thread = threading.Thread(target=self._command_handler, args=(tello,))
-            command_handler_thread.daemon = True
-            command_handler_thread.start()
+        # Index the Tellos by their (now known) num and sn, which also sorts them by num
+        self.tellos.reindex()
 
         # Start the status_handler, if needed.  This receives and constantly updates the status of each Tello.
         if get_status:
-            self.status_socket.bind(('', self.status_port))
-            self.status_thread = threading.Thread(target=self._status_thread)
-            self.status_thread.daemon = True
-            self.status_thread.start()
-
-        # Query each Tello to get its serial number - saving the cmd_id so we can match-up responses when they arrive
-        tello_cmd_id = []
-        for tello in self.tellos:
-            # Save the tello together with the returned cmd_id, so we can match the responses with the right Tello below
-            tello_cmd_id.append((tello, tello.add_to_command_queue('sn?', 'Read', None)))
-
-        # Assign the sn to each Tello, as responses become available.
-        # Note that log_wait_response will block until the response is received.
-        for tello, cmd_id in tello_cmd_id:
-            tello.sn = tello.log_wait_response(cmd_id).response
-            # Once we know the SN, look it up in the supplied sn_list and assign the correct tello_num
-            for index, sn in enumerate(sn_list, 1):
-                if tello.sn == sn:
-                    tello.num = index
-
-        # Sort the list of Tellos by their num
-        self.tellos.sort(key=lambda tello: tello.num)
+            if telemetry_history:
+                self.telemetry = TelemetryStore(self.tellos, telemetry_history)
+            if telemetry_record is not None:
+                self.recorder = TelemetryRecorder(telemetry_record)
+            self.status_read_age = status_read_age
+            self._start_status_listener()
 
     #
     # PUBLIC METHODS
     #
 
-    def queue_command(self, command, command_type, tello_num, on_error=None):
+    def queue_command(self, command, command_type, tello_num, on_error=None, barrier=False, release_time=None):
         """ Add a new command to the Tello's (either one Tello or all) command queue - returning the cmd_id.
 
             Note that if a Tello is marked as flight_completed, it will return -1 as its cmd_id.  These are not
@@ -133,33 +171,147 @@ class CommsManager:
 
             :param command: The Tello SDK string (e.g. 'forward 50' or 'battery?') to send to the Tello(s).
             :param command_type: Either 'Control', 'Set' or 'Read' - corresponding to the Tello SDK documentation.
-            :param tello_num: Either 'All' or a Tello number (1,2,...)
+            :param tello_num: Either 'All', a Tello number (1,2,...), or a list of Tello numbers.
             :param on_error: A different Tello SDK string to be sent if command returns an error.
+            :param barrier: If True (and tello_num is 'All' or a list), the command is held until every Tello is ready
+                             for it, then sent to all of them back to back - e.g. so a formation starts moving together.
+            :param release_time: Optionally, the time (as returned by time.monotonic()) at which to send the command.
+                                  Raises RuntimeError, without queuing anything, if any Tello's earlier commands are
+                                  not expected to be complete by then.
             :return: A list of tuples in the form [(tello_num, cmd_id),...].
         """
-        # Determine which Tellos to use, and add the command to the appropriate Tello's queue.
+        # Determine which Tellos to use - for 'All' (or a list), send to each and save the cmd_id in a list
+        tellos = self._select_tellos(tello_num)
+        if release_time is not None:
+            self._check_release_time(tellos, release_time)
+        # Scheduled commands are already released together, so don't also need a barrier
+        fan_out = None
+        if barrier and (tello_num == 'All' or isinstance(tello_num, (list, tuple))) and release_time is None:
+            fan_out = FanOut(command, sum(1 for tello in tellos if not tello.flight_complete), self.fan_out_timeout)
+            self.fan_outs.append(fan_out)
+
+        # Add the command to the appropriate Tello's queue
         cmd_ids = []
-        if tello_num == 'All':
-            for tello in self.tellos:
-                # If command is for all tellos, send to each and save the cmd_id in a list
-                cmd_id = tello.add_to_command_queue(command, command_type, on_error)
-                if cmd_id != -1:
-                    cmd_ids.append((tello.num, cmd_id))
-        else:
-            tello = self.get_tello(num=tello_num)
-            cmd_id = tello.add_to_command_queue(command, command_type, on_error)
+        for tello in tellos:
+            cmd_id = tello.add_to_command_queue(command, command_type, on_error, fan_out, release_time)
             if cmd_id != -1:
                 cmd_ids.append((tello.num, cmd_id))
         return cmd_ids
 
-    def wait_sync(self):
+    def query(self, command, tello_num='All'):
+        """ Queue a Read command, returning a Future for each Tello's reply, resolved with the value of the reply.
+
+            Values are converted per tello.READ_VALUES, e.g. an int for 'battery?'.  A Future fails with RuntimeError
+             if its Tello returns an error or doesn't respond, and is cancelled if the command is discarded (e.g. by
+             priority_command) before being sent.
+
+            :param command: The Tello SDK Read command, e.g. 'battery?'.
+            :param tello_num: Either 'All', a Tello number (1,2,...), or a list of Tello numbers.
+            :return: Dict of {tello_num: concurrent.futures.Future} - excluding any Tello marked as flight_complete.
+        """
+        futures = {}
+        for tello in self._select_tellos(tello_num):
+            future = concurrent.futures.Future()
+            if tello.add_to_command_queue(command, 'Read', None, future=future) != -1:
+                futures[tello.num] = future
+        return futures
+
+    @staticmethod
+    def gather(futures, timeout=None):
+        """ Wait for a set of Futures (e.g. from query) together, until all are done or a single deadline passes.
+
+            :param futures: Dict of {tello_num: concurrent.futures.Future}.
+            :param timeout: Max seconds to wait for all of them, or None to wait for as long as it takes.
+            :return: Dict of {tello_num: value}, with None for any Tello whose reply failed or didn't arrive in time.
+        """
+        concurrent.futures.wait(futures.values(), timeout)
+        values = {}
+        for tello_num, future in futures.items():
+            if future.done() and not future.cancelled() and future.exception() is None:
+                values[tello_num] = future.result()
+            else:
+                values[tello_num] = None
+        return values
+
+    def set_rc(self, left_right, forward_back, up_down, yaw, tello_num='All'):
+        """ Set the rc (remote control) setpoint of the Tello(s), which is then streamed to them at rc_rate.
+
+            Unlike queue_command, this returns straight away and doesn't touch the command queue or log - the latest
+             setpoint is simply sent on each tick, until updated.  If not updated within rc_hold_time, the Tello is
+             sent 'rc 0 0 0 0' instead, i.e. to hover.  Call stop_rc before queuing other moves.
+
+            :param left_right: Each of left_right, forward_back, up_down and yaw in range -100 to +100.
+            :param tello_num: Either 'All', a Tello number (1,2,...), or a list of Tello numbers.
+        """
+        if self.rc_stream is None:
+            self.rc_stream = RcStream(self._send_raw, self.rc_rate, self.rc_hold_time)
+        self.rc_stream.set([tello.ip for tello in self._select_tellos(tello_num) if not tello.flight_complete],
+                           (left_right, forward_back, up_down, yaw))
+
+    def stop_rc(self, tello_num='All'):
+        """ Stop streaming rc setpoints to the Tello(s), after sending 'rc 0 0 0 0' one last time.
+
+            :param tello_num: Either 'All', a Tello number (1,2,...), or a list of Tello numbers.
+        """
+        if self.rc_stream is not None:
+            self.rc_stream.release([tello.ip for tello in self._select_tellos(tello_num)])
+
+    def priority_command(self, command, tello_num='All'):
+        """ Send 'emergency', 'stop' or 'land' straight away - bypassing the command queues, and everything in them.
+
+            Commands still queued for the selected Tellos are discarded (so aren't sent afterwards), then the command
+             is sent to every selected Tello back to back.  Any command already sent but not yet answered (e.g. a long
+             move) is abandoned rather than waited for - its late reply, and the reply to this command, are ignored.
+             The command itself isn't added to the Tellos' logs.  Any rc stream (see set_rc) to the Tellos is stopped.
+
+            :param command: One of PRIORITY_COMMANDS, i.e. 'emergency', 'stop' or 'land'.
+            :param tello_num: Either 'All', a Tello number (1,2,...), or a list of Tello numbers.
+            :return: List of the time (perf_counter) at which the command was sent to each Tello.
+        """
+        if command not in PRIORITY_COMMANDS:
+            raise RuntimeError('Not a priority command: %s - must be one of %s'
+                               % (command, ', '.join(PRIORITY_COMMANDS)))
+        time_start = time.perf_counter()
+        tellos = self._select_tellos(tello_num)
+        flushed = sum(tello.flush_command_queue() for tello in tellos)
+        # Any rc stream would otherwise carry on, overriding the command
+        self.stop_rc(tello_num)
+        send_times = self._send_priority([tello.ip for tello in tellos], command)
+        latency = max(send_times) - time_start if send_times else 0.0
+        for tello in tellos:
+            # The reply to this command will arrive after the current log entry is dealt with, so is a late reply
+            tello.expect_stale(2 * command_timeout(estimate_duration(command, 'Control'), tello.latency.margin,
+                                                   'Control'))
+            log_entry = tello.unanswered_log_entry()
+            if log_entry is not None:
+                self._abort_command(tello, log_entry)
+        self.journal.log('priority', command=command, count=len(tellos), latency_ms=latency * 1000, flushed=flushed)
+        return send_times
+
+    def wait_sync(self, timeout=None, tello_num='All'):
         """ Used to pause the main thread whilst all Tellos catch up, to bring all Tellos into sync.
 
-            Simply checks with each Tello object that each individually has fully processed its queue and responses.
-            The wait_until_idle command is a blocking function, so won't return until ready.
+            Waits until every selected Tello has fully processed its queue and responses - woken as each one becomes
+             idle, rather than waiting on each in turn.  With a timeout, one stuck Tello no longer holds up the rest:
+             the result says which Tellos finished, so the caller can go ahead with those.
+
+            :param timeout: Max seconds to wait, or None to wait for as long as it takes.
+            :param tello_num: Either 'All', a Tello number (1,2,...), or a list of Tello numbers.
+            :return: SyncResult, listing the Tellos which finished and timed out, and how long each took.
         """
-        for tello in self.tellos:
-            tello.wait_until_idle()
+        tellos = self._select_tellos(tello_num)
+        start = time.monotonic()
+        with self.idle_condition:
+            self.idle_condition.wait_for(lambda: all(tello.pending_commands == 0 for tello in tellos), timeout)
+        finished, timed_out, durations = [], [], {}
+        for tello in tellos:
+            if tello.pending_commands == 0:
+                finished.append(tello.num)
+                durations[tello.num] = max(0.0, tello.idle_since - start)
+            else:
+                timed_out.append(tello.num)
+                durations[tello.num] = None
+        return SyncResult(finished, timed_out, durations)
 
     def get_tello(self, num):
         """ Shortcut function to return a specific Tello instance, based on its number.
@@ -167,16 +319,36 @@ class CommsManager:
             :param num: Tello number, as an integer (e.g. 1,2,...)
             :return: Tello object
         """
-        for tello in self.tellos:
-            if tello.num == num:
-                return tello
-        raise RuntimeError('Tello not found!')
+        tello = self.tellos.get_by_num(num)
+        if tello is None:
+            raise RuntimeError('Tello not found!')
+        return tello
 
     def close_connections(self):
         """ Close all comms - to tidy up before exiting """
         self.terminate_comms = True
+        if self.rc_stream is not None:
+            self.rc_stream.close()
+        # Stop each command_handler, which will otherwise be blocked waiting for its next command
+        for tello in self.tellos:
+            tello.close_command_queue()
+            tello.log.close()
+        # Shutdown first, to wake the receive and status threads from recvfrom - the ports are only released once they
+        #  have returned and the sockets are closed.
+        for comms_socket in [self.control_socket, self.status_socket]:
+            try:
+                comms_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for thread in [self.receive_thread, self.status_thread]:
+            if thread is not None:
+                thread.join(timeout=1)
         self.control_socket.close()
         self.status_socket.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.scheduler.close()
+        self.journal.close()
 
     #
     # PRIVATE HELPER METHODS
@@ -211,48 +383,512 @@ class CommsManager:
             addr_list.append(address)
         return subnets, addr_list
 
+    def _open_comms(self):
+        """ Open the sockets, and start the thread for receiving control messages from Tello. """
+
+        # Socket for primary bi-directional communication with Tello
+        self.control_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # socket for sending cmd
+        self.control_socket.bind((self.local_ip, self.control_port))
+
+        # Socket for receiving status messages from Tello - not activated here
+        self.status_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.status_thread = None
+
+        # Thread for receiving messages from Tello, and the command_handler thread for each Tello once found
+        self.command_handler_threads = []
+        self.receive_thread = threading.Thread(target=self._receive_thread)
+        self.receive_thread.daemon = True
+        self.receive_thread.start()
+
+    def _new_tello(self, ip):
+        """ Create a Tello object for a newly found Tello, with its log configured as requested.
+
+            :param ip: IP address of the Tello, as a string.
+            :return: The new Tello object.
+        """
+        log_file = None
+        if self.log_dir is not None:
+            log_file = os.path.join(self.log_dir, 'tello_%s.jsonl' % ip)
+        tello = Tello(ip, log_size=self.log_size, log_file=log_file)
+        tello.on_idle = self._notify_idle
+        return tello
+
+    def _notify_idle(self):
+        """ Wake wait_sync, as a Tello has just become idle. """
+        with self.idle_condition:
+            self.idle_condition.notify_all()
+
+    def _select_tellos(self, tello_num):
+        """ Returns a list of Tello objects, for tello_num of 'All', an individual Tello num, or a list of nums. """
+        if tello_num == 'All':
+            return list(self.tellos)
+        if isinstance(tello_num, (list, tuple)):
+            return [self.get_tello(num=num) for num in tello_num]
+        return [self.get_tello(num=tello_num)]
+
+    def _send_raw(self, ip, command):
+        """ Send a command string to the specified IP, without queuing or logging it.
+
+            :param ip: IP address of the Tello, as a string e.g. '192.168.1.51'
+            :param command: The Tello SDK string to send, e.g. 'command'.
+        """
+        self.control_socket.sendto(command.encode(), (ip, self.control_port))
+
+    def _start_command_handler(self, tello):
+        """ Start the command_handler thread for the specified Tello, to process its command_queue.
+
+            :param tello: The Tello object for which to start the command_handler.
+        """
+        command_handler_thread = threading.Thread(target=self._command_handler, args=(tello,))
+        command_handler_thread.daemon = True
+        command_handler_thread.start()
+        self.command_handler_threads.append(command_handler_thread)
+
+    def _start_status_listener(self):
+        """ Bind the status socket, and start the thread which listens for status messages from the Tellos. """
+        self.status_socket.bind((self.local_ip, self.status_port))
+        self.status_thread = threading.Thread(target=self._status_thread)
+        self.status_thread.daemon = True
+        self.status_thread.start()
+
     def _get_tello(self, ip):
         """ Private function to return the Tello object with the matching IP address.
 
             :param ip: IP address of the requested Tello object, as a string e.g. '123.45.678.90'
             :return: Tello object
         """
-        for tello in self.tellos:
-            if tello.ip == ip:
-                return tello
-        raise RuntimeError('Tello not found!')
+        tello = self.tellos.get_by_ip(ip)
+        if tello is None:
+            raise RuntimeError('Tello not found!')
+        return tello
 
-    def _send_command(self, tello, cmd_id, command, command_type, on_error, timeout=10):
+    def _send_command(self, tello, log_entry, timeout=None):
         """ Actually send a command to the Tello at specified IP address, recording details in the Tello's log.
 
             :param tello: The Tello object for which we're sending the command
-            :param cmd_id: Corresponds to the id first given when in the Tello's queue, to be transferred to its log.
-            :param command: The actual command from Tello SDK, e.g. 'battery?', 'forward 50', etc...
-            :param command_type: Either 'Control', 'Set' or 'Read' - corresponding to the Tello SDK documentation.
-            :param on_error: A different Tello SDK string to be sent if command returns an error.
+            :param log_entry: The TelloCommand taken from the Tello's queue, which is transferred to its log.
+            :param timeout: Max seconds to wait for the response once sent, or None (default) to allow for how long the
+                             command is expected to take, plus the Tello's learned response latency.
         """
+        if timeout is None:
+            timeout = tello.response_timeout(log_entry)
 
         # Add the command to the Tello's log first
-        log_entry = tello.add_to_log(cmd_id, command, command_type, on_error)
-
-        # Then send the command
-        self.control_socket.sendto(command.encode(), (tello.ip, self.control_port))
-        print('[Command  %s]Sent cmd: %s' % (tello.ip, command))
-
-        # Wait until a response has been received, and handle timeout
-        time_sent = time.time()
-        while log_entry.response is None:
-            now = time.time()
-            if now - time_sent > timeout:
-                print('[Command  %s]Failed to send: %s' % (tello.ip, command))
+        tello.add_to_log(log_entry)
+
+        # Answer from the latest status instead, if recent enough - saving a round trip, which would hold up the next
+        #  command in the Tello's queue
+        if self._read_from_status(tello, log_entry):
+            return
+
+        # Then send the command - straight away, at its release_time, or together with the other Tellos if it's a
+        #  barrier command.  The response timeout only starts once it has actually been sent.
+        delay = 0.0
+        if log_entry.release_time is not None:
+            delay = max(0.0, log_entry.release_time - time.monotonic())
+            self._schedule_command(tello, log_entry)
+        elif log_entry.fan_out is None:
+            log_entry.sent_time = time.time()
+            if self._send_unless_flushed(tello, log_entry):
+                self.journal.log_command('sent', tello, log_entry)
+        else:
+            fan_out = log_entry.fan_out
+            batch = fan_out.arrive(tello, log_entry)
+            if not batch:
+                # Wait for the last Tello to arrive and send the batch - or after timeout, send those waiting anyway
+                fan_out.released.wait(fan_out.timeout)
+                batch = fan_out.flush()
+            self._send_fan_out(fan_out, batch)
+
+        # Wait until a response has been received (woken immediately by the receive thread), and handle timeout
+        wait = timeout + delay
+        while not log_entry.wait_response(wait):
+            wait = timeout = self._retry_command(tello, log_entry, timeout)
+            if timeout is None:
+                return
+
+    def _check_release_time(self, tellos, release_time):
+        """ Raise RuntimeError if a command can't be sent at release_time - because it has already passed, or because
+            a Tello's queued commands are not expected to be complete by then.
+
+            :param tellos: List of the Tello objects to which the command is to be sent.
+            :param release_time: Time, as returned by time.monotonic(), at which the command is to be sent.
+        """
+        now = time.monotonic()
+        if release_time < now:
+            raise RuntimeError('Release time is %.3fs in the past' % (now - release_time))
+        for tello in tellos:
+            if not tello.flight_complete and tello.expected_idle > release_time:
+                raise RuntimeError('Tello %d cannot be ready at the release time - its queued commands are expected '
+                                   'to take another %.2fs' % (tello.num, tello.expected_idle - release_time))
+
+    def _schedule_command(self, tello, log_entry):
+        """ Hand a command to the scheduler, to be sent at its release_time.
+
+            :param tello: The Tello object to which the command is to be sent.
+            :param log_entry: The TelloCommand, already in the Tello's log.
+        """
+        def release():
+            late = time.monotonic() - log_entry.release_time
+            log_entry.sent_time = time.time()
+            if not self._send_unless_flushed(tello, log_entry):
+                # Abandoned before it was due, e.g. by priority_command
+                return
+            self.journal.log_command('sent', tello, log_entry)
+            self.journal.log('released', tello.ip, num=tello.num, command=log_entry.command, late_ms=late * 1000)
+        self.scheduler.schedule(log_entry.release_time, release)
+
+    def _send_fan_out(self, fan_out, batch):
+        """ Send a barrier command to a batch of Tellos back to back, then release any Tellos waiting for it.
+
+            :param fan_out: The FanOut to which the batch belongs.
+            :param batch: List of (tello, log_entry) to send to - may be empty, if already sent by another Tello.
+        """
+        # Hold every Tello's condition (in order of num, so two batches can't deadlock) whilst checking and sending, so
+        #  that priority_command can't come in between - then leave out any Tellos whose command was abandoned whilst
+        #  waiting, or whose queue has since been flushed
+        with contextlib.ExitStack() as stack:
+            for tello, _ in sorted(batch, key=lambda item: item[0].num):
+                stack.enter_context(tello.condition)
+            sendable = [(tello, log_entry) for tello, log_entry in batch
+                        if log_entry.response is None and log_entry.flushes == tello.flushes]
+            if sendable:
+                sent_time = time.time()
+                for _, log_entry in sendable:
+                    log_entry.sent_time = sent_time
+                fan_out.sent(self._send_burst([tello.ip for tello, _ in sendable], fan_out.command))
+        for tello, log_entry in batch:
+            if (tello, log_entry) in sendable:
+                self.journal.log_command('sent', tello, log_entry)
+            else:
+                self._discard_unsent(tello, log_entry)
+        if not sendable:
+            return
+        if fan_out.complete:
+            self.journal.log('fan_out', command=fan_out.command, count=fan_out.size, skew_ms=fan_out.skew * 1000)
+
+    def _send_burst(self, ips, command):
+        """ Send the same command string to several IPs, as close together as possible.
+
+            Python has no sendmmsg, so this is the nearest equivalent - the command is encoded once, then sent to each
+             Tello in a tight loop.
+
+            :param ips: List of IP addresses, as strings.
+            :param command: The Tello SDK string to send.
+            :return: List of the time (perf_counter) at which each datagram was sent.
+        """
+        data = command.encode()
+        send_times = []
+        for ip in ips:
+            self.control_socket.sendto(data, (ip, self.control_port))
+            send_times.append(time.perf_counter())
+        return send_times
+
+    def _read_from_status(self, tello, log_entry):
+        """ If log_entry is a Read command which can be answered from the Tello's latest status, and that is no older
+             than self.status_read_age, set its response from the status - without sending anything to the Tello.
+
+            Scheduled and barrier commands are always sent, as other Tellos are timed against them.
+
+            :param tello: The Tello object for which the command is queued.
+            :param log_entry: The TelloCommand, already added to the Tello's log.
+            :return: True if the command was answered from status, otherwise False (and it should be sent as usual).
+        """
+        if (self.status_read_age is None or log_entry.command_type != 'Read' or log_entry.release_time is not None
+                or log_entry.fan_out is not None):
+            return False
+        response = read_from_status(log_entry.command, tello.status, self.status_read_age)
+        if response is None:
+            return False
+        log_entry.success = True
+        log_entry.set_response(response)
+        self.journal.log_command('status_read', tello, log_entry)
+        return True
+
+    def _retry_command(self, tello, log_entry, timeout):
+        """ Called when no response has been received within timeout - resends the command if it's safe to repeat and
+            retries remain, otherwise marks it as timed out.
+
+            :param tello: The Tello object to which the command was sent.
+            :param log_entry: The log entry (TelloCommand object) for which no response was received.
+            :param timeout: Seconds allowed for the response to the latest transmission.
+            :return: Seconds to allow for the response to the retransmission (i.e. backing off), or None if timed out.
+        """
+        held, tello.held_reply = tello.held_reply, None
+        if held is not None and held[0] is log_entry:
+            # The early reply set aside was the only one - so was the response to this command after all
+            self._handle_response(held[1].encode(), tello.ip)
+            return None
+        # The response to the earlier transmission may have been delayed rather than lost, so could yet arrive.  Only
+        #  a late 'ok' (or error) is ambiguous - a late Read value is recognised by its shape alone.
+        if log_entry.command_type != 'Read':
+            tello.expect_stale(timeout * 2)
+        if not log_entry.retryable or log_entry.attempts > self.max_retries:
+            self._command_timed_out(tello, log_entry)
+            return None
+        log_entry.attempts += 1
+        if not self._send_unless_flushed(tello, log_entry):
+            return None
+        self.journal.log('retry', tello.ip, num=tello.num, command=log_entry.command, attempt=log_entry.attempts)
+        return timeout * 2
+
+    def _send_unless_flushed(self, tello, log_entry):
+        """ Send a command, unless priority_command has since abandoned it, or flushed the queue it came from.
+
+            :param tello: The Tello object to which the command is to be sent.
+            :param log_entry: The TelloCommand, already in the Tello's log.
+            :return: True if sent, otherwise False - in which case log_entry has a response, so needn't be waited for.
+        """
+        if tello.send_unless_flushed(log_entry, lambda: self._send_raw(tello.ip, log_entry.command)):
+            return True
+        self._discard_unsent(tello, log_entry)
+        return False
+
+    def _discard_unsent(self, tello, log_entry):
+        """ Mark a command which was never sent as failed - if it hasn't already been, e.g. by priority_command. """
+        # Taken from the queue just before it was flushed
+        if tello.discard_command(log_entry):
+            self.journal.log_command('aborted', tello, log_entry)
+
+    def _send_priority(self, ips, command):
+        """ Send a priority command to several IPs back to back, from whichever thread calls priority_command.
+
+            :return: List of the time (perf_counter) at which each datagram was sent.
+        """
+        return self._send_burst(ips, command)
+
+    def _abort_command(self, tello, log_entry):
+        """ Give up on a command which has been (or is about to be) sent, so its command_handler moves on immediately.
+
+            :param tello: The Tello object to which the command was sent.
+            :param log_entry: The log entry (TelloCommand object), which has no response yet.
+        """
+        log_entry.success = False
+        # Its reply (e.g. to a move cut short by 'stop') may still arrive
+        tello.expect_stale(tello.response_timeout(log_entry))
+        log_entry.set_response('')
+        self.journal.log_command('aborted', tello, log_entry)
+
+    def _command_timed_out(self, tello, log_entry):
+        """ Mark a log entry as failed after its timeout expired, queuing any alternative command.
+
+            :param tello: The Tello object to which the command was sent.
+            :param log_entry: The log entry (TelloCommand object) for which no response was received.
+        """
+        log_entry.success = False
+        tello.latency.timed_out()
+        # Queue any alternative before saving the response, so the Tello never briefly appears idle in between
+        if log_entry.on_error is not None:
+            tello.add_to_command_queue(log_entry.on_error, log_entry.command_type, None)
+            self.journal.log('on_error', tello.ip, num=tello.num, command=log_entry.on_error)
+        log_entry.set_response('')
+        self.journal.log_command('timeout', tello, log_entry)
+
+    def _handle_response(self, response, ip):
+        """ Process a single message received from a Tello on the control port.
+
+            This includes capturing and saving each Tello the first time it responds.
+            If it is a known Tello, the response will be matched against the Tello's log, always recording the response
+            against the last log entry as commands sent to each Tello are strictly sequential.
+            Responses are also tested for success or failure, and if relevant an alternative command may be queued.
+
+            :param response: The raw bytes received from the Tello.
+            :param ip: IP address of the Tello which sent the response, as a string.
+        """
+        response = response.decode().strip()
+
+        # Capture Tellos when they respond for the first time
+        if response.lower() == 'ok' and not self.tellos.has_ip(ip):
+            self.journal.log('found', ip)
+            self.tellos.add(self._new_tello(ip))
+            self._notify_discovery()
+            return
+
+        # Get the current log entry for this Tello, and check the response is for it
+        tello = self._get_tello(ip)
+        log_entry = tello.log_entry()
+        if self._is_stale(tello, log_entry, response):
+            self.journal.log('stale', ip, num=tello.num, response=response)
+            return
+
+        # Determine if the response was ok / error (or reading a value)
+        send_on_error = False
+        if log_entry.command_type in ['Control', 'Set']:
+            if response == 'ok':
+                log_entry.success = True
+            else:
                 log_entry.success = False
-                log_entry.response = ''
                 if log_entry.on_error is not None:
-                    tello.add_to_command_queue(log_entry.on_error, log_entry.command_type, None)
-                    print('[Command  %s]Queuing alternative cmd: %s' % (tello.ip, log_entry.on_error))
-                return
-            # Sleep briefly at the end of each loop, to prevent excessive CPU usage
-            time.sleep(0.01)
+                    # If this command wasn't successful, and there's an on_error entry, flag to send it later.
+                    send_on_error = True
+        elif log_entry.command_type == 'Read':
+            # Assume Read commands are always successful... not aware they can return anything else!?
+            log_entry.success = True
+        else:
+            self.journal.log('invalid_type', ip, num=tello.num, command_type=log_entry.command_type)
+        # If required, queue the alternative command - assume same command type as the original.  This is done
+        #  before saving the response, so that the Tello is never seen as idle between the two commands.
+        if send_on_error:
+            tello.add_to_command_queue(log_entry.on_error, log_entry.command_type, None)
+            self.journal.log('on_error', ip, num=tello.num, command=log_entry.on_error)
+        # Save .response *after* .success, as elsewhere we use .response as a check to move on - avoids race
+        # conditions across the other running threads, which might otherwise try to use .success before saved.
+        # set_response also wakes any threads waiting on this response, i.e. with no polling delay.
+        log_entry.set_response(response)
+        if log_entry.success:
+            tello.record_latency(log_entry)
+        # Read responses are shown by default, as printing them is how e.g. FlyTello.get_battery reports the value
+        self.journal.log_command('read' if log_entry.command_type == 'Read' else 'response', tello, log_entry)
+        self._notify_discovery()
+
+    def _is_stale(self, tello, log_entry, response):
+        """ Returns True if a response can't be for the current log entry - i.e. it's a duplicate, or a late reply to
+            an earlier command which was retransmitted or timed out.
+
+            Commands to each Tello are strictly sequential, so responses would otherwise always be attributed to the
+             latest log entry.  Replies which can't be for it (wrong shape, or the command hasn't been sent or already
+             has its response) are always ignored.  Otherwise, whilst late replies are still expected, an 'ok' (or
+             error) arriving sooner than the current command could have finished is taken to be one of those - but is
+             held, and used after all if no other reply arrives (see _retry_command).  Set commands are answered almost
+             straight away, so for those only a reply within SET_STALE_WINDOW is held.
+
+            :param tello: The Tello object which sent the response.
+            :param log_entry: The Tello's latest log entry, or None if nothing has been sent yet.
+            :param response: The decoded response string.
+        """
+        if (log_entry is None or log_entry.sent_time is None or log_entry.response is not None
+                or not log_entry.expects(response)):
+            if response == 'ok' or response.startswith('error'):
+                tello.take_stale()
+            return True
+        if log_entry.command_type in ('Control', 'Set'):
+            if log_entry.command_type == 'Control':
+                window = (log_entry.expected_duration - COMMAND_OVERHEAD) / 2
+            else:
+                window = SET_STALE_WINDOW
+            if time.time() - log_entry.sent_time < window and tello.take_stale():
+                tello.held_reply = (log_entry, response)
+                return True
+        return False
+
+    def _notify_discovery(self):
+        """ Wake the discovery loop in init_tellos (if running), after a Tello is found or a response received. """
+        with self.discovery_condition:
+            self.discovery_events += 1
+            self.discovery_condition.notify_all()
+
+    def _discover_tellos(self, possible_addr, sn_list, cached_addr=(), cache_wait=0.5, send_rate=500,
+                         first_retry=0.25, max_retry=2.0):
+        """ Search possible_addr for Tellos, returning as soon as every serial number in sn_list is identified.
+
+            'command' is sent to each address in rate-limited bursts.  Addresses which don't answer are retried with
+             exponential backoff, whilst those which have answered are never contacted again.  Each Tello found has its
+             command_handler started and is queried for its serial number straight away, i.e. whilst the search for
+             others continues.  Progress is journalled as Tellos are found and identified.
+
+            :param possible_addr: List of IP addresses (as strings) to search.
+            :param sn_list: List of serial numbers, in order we want to number the Tellos.
+            :param cached_addr: List of IP addresses to contact first, i.e. where the Tellos were last found.
+            :param cache_wait: Seconds to wait for cached_addr to answer, before also searching all of possible_addr.
+            :param send_rate: Max 'command' messages sent per second, to avoid flooding the network.
+            :param first_retry: Seconds before first re-sending to an address which hasn't answered.
+            :param max_retry: Max seconds between re-sending to an address which hasn't answered.
+        """
+        time_start = time.monotonic()
+        self.journal.log('search', count=len(sn_list))
+
+        # When each address is next due a 'command', and the current retry interval for each
+        sweep_start = time_start + cache_wait if cached_addr else time_start
+        next_send = {ip: time_start if ip in cached_addr else sweep_start for ip in possible_addr}
+        retry_interval = {ip: first_retry for ip in possible_addr}
+        packets_sent = 0
+        send_tokens = send_rate * 0.1
+        last_send_time = time_start
+
+        # Tellos which have been found, and the cmd_id of their sn? query if not yet identified
+        pending_sn = {}
+        started = set()
+        report = []
+
+        while True:
+            with self.discovery_condition:
+                seen_events = self.discovery_events
+            now = time.monotonic()
+
+            # Start each newly found Tello, stop contacting its address, and query its serial number
+            for tello in self.tellos:
+                if tello.ip not in started:
+                    started.add(tello.ip)
+                    next_send.pop(tello.ip, None)
+                    self._start_command_handler(tello)
+                    pending_sn[tello] = tello.add_to_command_queue('sn?', 'Read', None)
+                    report.append({'ip': tello.ip, 'found_secs': now - time_start})
+
+            # Once we know each SN, look it up in the supplied sn_list and assign the correct tello_num
+            for tello, cmd_id in list(pending_sn.items()):
+                log_entry = tello.log.get(cmd_id)
+                if log_entry is None or log_entry.response is None:
+                    continue
+                if log_entry.response == '':
+                    # Query timed out - ask again
+                    pending_sn[tello] = tello.add_to_command_queue('sn?', 'Read', None)
+                    continue
+                del pending_sn[tello]
+                tello.sn = log_entry.response
+                for index, sn in enumerate(sn_list, 1):
+                    if tello.sn == sn:
+                        tello.num = index
+                for entry in report:
+                    if entry['ip'] == tello.ip:
+                        entry.update({'sn': tello.sn, 'num': tello.num, 'identified_secs': now - time_start})
+                self.journal.log('identified', tello.ip, num=tello.num, sn=tello.sn, secs=now - time_start)
+
+            # Finished once all requested Tellos are identified - or as many Tellos as requested, if any SNs unknown
+            identified_sns = set(tello.sn for tello in self.tellos if tello.sn is not None)
+            if set(sn_list) <= identified_sns or len(identified_sns) >= len(sn_list):
+                break
+
+            # Send 'command' to each address that's due, as allowed by the rate limit (a token bucket, allowing bursts
+            #  of up to 0.1s worth of messages), then back off its retry interval
+            send_tokens = min(send_rate * 0.1, send_tokens + (now - last_send_time) * send_rate)
+            last_send_time = now
+            for ip in sorted(next_send, key=next_send.get):
+                if next_send[ip] > now or send_tokens < 1:
+                    break
+                self._send_raw(ip, 'command')
+                packets_sent += 1
+                send_tokens -= 1
+                next_send[ip] = now + retry_interval[ip]
+                retry_interval[ip] = min(retry_interval[ip] * 2, max_retry)
+
+            # Sleep until the next address is due (and the rate limit allows it), or until a response arrives
+            wait = 0.05
+            if next_send:
+                wait = min(wait, max(0.0, min(next_send.values()) - time.monotonic(), (1 - send_tokens) / send_rate))
+            with self.discovery_condition:
+                self.discovery_condition.wait_for(lambda: self.discovery_events != seen_events, wait)
+
+        total_secs = time.monotonic() - time_start
+        self.discovery_report = {'total_secs': total_secs, 'packets_sent': packets_sent, 'tellos': report}
+        self.journal.log('search_done', count=len(self.tellos), secs=total_secs, packets=packets_sent)
+
+    def _handle_status(self, response, ip):
+        """ Process a single status message received from a Tello, saving it in the Tello object.
+
+            :param response: The raw bytes (or a memoryview of the receive buffer) received from the Tello.
+            :param ip: IP address of the Tello which sent the status message, as a string.
+        """
+        if response == b'ok':
+            return
+        tello = self._get_tello(ip)
+        # Swap in a complete new record, so that readers never see a partly updated status
+        tello.status = parse_status(response)
+        if self.telemetry is not None:
+            self.telemetry.append(ip, tello.status)
+        if self.recorder is not None:
+            self.recorder.record(ip, response, tello.status.timestamp)
+        for listener in self.status_listeners:
+            listener(tello, response)
 
     #
     # THREADS
@@ -269,69 +905,37 @@ class CommsManager:
             :param tello: The Tello object with which the command_handler should be associated.
         """
         while True:
-            # If nothing in the queue, just keep looping
-            while not tello.command_queue:
-                time.sleep(0.01)
-            # Pop command off the Tello's queue, then send the command.
-            # Note as part of send_command the same details will be added back into Tello's log.
-            command = tello.command_queue.pop(0)
-            self._send_command(tello, command.cmd_id, command.command, command.command_type, command.on_error)
+            # Pop command off the Tello's queue, blocking (without using CPU) until one is available, then send it.
+            # Note as part of send_command the same TelloCommand will be moved into the Tello's log.
+            command = tello.command_queue.get()
+            if command is None:
+                # Queue has been closed, i.e. close_connections has been called
+                return
+            self._send_command(tello, command)
+            tello.command_done()
 
     def _receive_thread(self):
         """ Listen continually to responses from the Tello - should run in its own thread.
 
-            This method includes capturing and saving each Tello the first time it responds.
-            If it is a known Tello, the response will be matched against the Tello's log, always recording the response
-            against the last log entry as commands sent to each Tello are strictly sequential.
-            Responses are also tested for success or failure, and if relevant an alternative command may be sent
-            immediately on error.
+            Each response is passed to _handle_response, which matches it against the relevant Tello and its log.
         """
 
         while not self.terminate_comms:
             try:
-                # Get responses from all Tellos - this line blocks until a message is received - and reformat values
+                # Get responses from all Tellos - this line blocks until a message is received
                 response, ip = self.control_socket.recvfrom(1024)
-                response = response.decode().strip()
-                ip = str(ip[0])
-
-                # Capture Tellos when they respond for the first time
-                if response.lower() == 'ok' and ip not in [tello.ip for tello in self.tellos]:
-                    print('[Tello Search]Found Tello on IP %s' % ip)
-                    self.tellos.append(Tello(ip))
-                    continue
+                if self.terminate_comms:
+                    break
+                self._handle_response(response, str(ip[0]))
 
-                # Get the current log entry for this Tello
-                tello = self._get_tello(ip)
-                log_entry = tello.log_entry()
-
-                # Determine if the response was ok / error (or reading a value)
-                send_on_error = False
-                if log_entry.command_type in ['Control', 'Set']:
-                    if response == 'ok':
-                        log_entry.success = True
-                    else:
-                        log_entry.success = False
-                        if log_entry.on_error is not None:
-                            # If this command wasn't successful, and there's an on_error entry, flag to send it later.
-                            send_on_error = True
-                elif log_entry.command_type == 'Read':
-                    # Assume Read commands are always successful... not aware they can return anything else!?
-                    log_entry.success = True
-                else:
-                    print('[Response %s]Invalid command_type: %s' % (ip, log_entry.command_type))
-                # Save .response *after* .success, as elsewhere we use .response as a check to move on - avoids race
-                # conditions across the other running threads, which might otherwise try to use .success before saved.
-                log_entry.response = response
-                print('[Response %s]Received: %s' % (ip, response))
-                # If required, queue the alternative command - assume same command type as the original.
-                if send_on_error:
-                    tello.add_to_command_queue(log_entry.on_error, log_entry.command_type, None)
-                    print('[Command  %s]Queuing alternative cmd: %s' % (ip, log_entry.on_error))
+            except RuntimeError as exc:
+                # Report (rather than stopping on) responses which can't be handled, e.g. from an unknown Tello
+                self.journal.log('error', str(ip[0]), error=str(exc))
 
             except socket.error as exc:
                 if not self.terminate_comms:
                     # Report socket errors, but only if we've not told it to terminate_comms.
-                    print('[Socket Error]Exception socket.error : %s' % exc)
+                    self.journal.log('socket_error', error=str(exc))
 
     def _status_thread(self):
         """ Listen continually to status from the Tellos - should run in its own thread.
@@ -339,22 +943,20 @@ class CommsManager:
             Listens for status messages from each Tello, and saves them in the Tello object as they arrive.
         """
 
+        # Status messages arrive ~10 times per second from every Tello, so receive each into the same buffer
+        status_buffer = bytearray(1024)
+        status_view = memoryview(status_buffer)
         while not self.terminate_comms:
             try:
-                response, ip = self.status_socket.recvfrom(1024)
-                response = response.decode()
-                if response == 'ok':
-                    continue
-                ip = ''.join(str(ip[0]))
-                tello = self._get_tello(ip)
-                tello.status.clear()
-                status_parts = response.split(';')
-                for status_part in status_parts:
-                    key_value = status_part.split(':')
-                    if len(key_value) == 2:
-                        tello.status[key_value[0]] = key_value[1]
+                nbytes, ip = self.status_socket.recvfrom_into(status_buffer)
+                if self.terminate_comms:
+                    break
+                self._handle_status(status_view[:nbytes], str(ip[0]))
+
+            except RuntimeError as exc:
+                self.journal.log('error', str(ip[0]), error=str(exc))
 
             except socket.error as exc:
                 if not self.terminate_comms:
                     # Report socket errors, but only if we've not told it to terminate_comms.
-                    print('[Socket Error]Exception socket.error : %s' % exc)
+                    self.journal.log('socket_error', error=str(exc))
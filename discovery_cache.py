@@ -0,0 +1,76 @@
+import json
+import os
+import netaddr
+
+
+# Default location of the cache file, in the user's home directory
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.tello_discovery_cache.json')
+
+
+class DiscoveryCache:
+    """ On-disk cache of the IP address each Tello (by serial number) was last found on, keyed by /24 subnet.
+
+        Tellos usually get the same DHCP lease each session, so CommsManager.init_tellos contacts the cached addresses
+         first, and only falls back to searching the whole subnet for serial numbers which don't answer.
+        The cache is a small JSON file, in the form {'192.168.1.0/24': {'0TQDFC6EDBBX03': '192.168.1.51', ...}, ...}.
+    """
+
+    def __init__(self, cache_file=DEFAULT_CACHE_FILE):
+        """ :param cache_file: Path of the JSON file holding the cache - created when first saved. """
+        self.cache_file = cache_file
+        self.subnets = self._load()
+
+    def addresses(self, sn_list, possible_addr):
+        """ Returns the cached IP address of each serial number in sn_list, where that address is still being searched.
+
+            :param sn_list: List of serial numbers we're looking for.
+            :param possible_addr: List of IP addresses (as strings) being searched.
+            :return: List of IP addresses (as strings) to contact first.
+        """
+        possible = set(possible_addr)
+        cached_addr = []
+        for subnet_cache in self.subnets.values():
+            for sn in sn_list:
+                ip = subnet_cache.get(sn)
+                if ip in possible and ip not in cached_addr:
+                    cached_addr.append(ip)
+        return cached_addr
+
+    def update(self, tellos):
+        """ Record the IP address of each Tello with a known serial number, then save the cache to disk.
+
+            :param tellos: Iterable of Tello objects.
+        """
+        for tello in tellos:
+            if not tello.sn:
+                continue
+            subnet = str(netaddr.IPNetwork('%s/24' % tello.ip).cidr)
+            self.subnets.setdefault(subnet, {})[tello.sn] = tello.ip
+        self._save()
+
+    #
+    # PRIVATE HELPER METHODS
+    #
+
+    def _load(self):
+        """ Read the cache from disk, returning an empty cache if the file doesn't exist or can't be read. """
+        try:
+            with open(self.cache_file) as cache:
+                subnets = json.load(cache)
+            if isinstance(subnets, dict):
+                return subnets
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as exc:
+            print('[Tello Search]Ignoring unreadable discovery cache %s: %s' % (self.cache_file, exc))
+        return {}
+
+    def _save(self):
+        """ Write the cache to disk - via a temporary file, so that a partly written cache is never left behind. """
+        temp_file = '%s.tmp' % self.cache_file
+        try:
+            with open(temp_file, 'w') as cache:
+                json.dump(self.subnets, cache, indent=2, sort_keys=True)
+            os.replace(temp_file, self.cache_file)
+        except OSError as exc:
+            print('[Tello Search]Unable to save discovery cache %s: %s' % (self.cache_file, exc))
@@ -1,13 +1,15 @@
 #
 # Quick and basic code for running a standalone "emergency stop" in case of any problems
 #
-#
+# If a TelloGateway is running (python tello_gateway.py serve ...), commands are sent through its priority lane, so
+#  this can run alongside a flight.  Otherwise, this binds the control port itself and sends to every possible IP.
 #
 
 import socket
 import netaddr
 import netifaces
 import time
+from tello_gateway import GatewayClient
 
 
 #
@@ -56,6 +58,36 @@ def send_command(command, possible_addr, control_socket, control_port):
         time.sleep(0.01)
 
 
+def connect_gateway():
+    """ Connect to a running TelloGateway, returning the GatewayClient - or None if no gateway is running. """
+    try:
+        return GatewayClient()
+    except OSError:
+        return None
+
+
+def send_via_gateway(command, gateway):
+    """ Send the command to every Tello via the gateway, straight away and ahead of anything queued - reconnecting
+        once if the gateway connection has been lost.
+
+        :return: The GatewayClient used, or None if the gateway can't be reached (so the command hasn't been sent).
+    """
+    try:
+        print('Sent %s command to %d drone(s) via the gateway' % (command, gateway.priority_command(command)))
+        return gateway
+    except (RuntimeError, OSError) as error:
+        print('Gateway failed (%s) - reconnecting...' % error)
+    gateway = connect_gateway()
+    if gateway is None:
+        return None
+    try:
+        print('Sent %s command to %d drone(s) via the gateway' % (command, gateway.priority_command(command)))
+        return gateway
+    except (RuntimeError, OSError) as error:
+        print('Gateway failed again (%s)' % error)
+        return None
+
+
 def initialise(first_ip, last_ip, control_port, possible_addr):
 
     # Create socket for communication with Tello
@@ -88,24 +120,26 @@ last_ip = 54
 control_port = 8889
 control_socket = None
 possible_addr = []
+gateway = connect_gateway()
+if gateway:
+    print('Connected to the Tello gateway!')
 
 while True:
     # Do nothing until we've got a command
     command = input('Emergency Stop?  ' ' or L = Auto-Land  |  S = Stop  |  E = Emergency Cut-Out  |  Q = Quit: ')
 
-    # If not already initalised, initialise the network connection via a UDP socket
-    if not control_socket:
-        possible_addr, control_socket = initialise(first_ip, last_ip, control_port, possible_addr)
-        print('Connection initialised!')
-
-    if command.upper() == ' ':
-        send_command('land', possible_addr, control_socket, control_port)
-    elif command.upper() == 'L':
-        send_command('land', possible_addr, control_socket, control_port)
-    elif command.upper() == 'S':
-        send_command('stop', possible_addr, control_socket, control_port)
-    elif command.upper() == 'E':
-        send_command('emergency', possible_addr, control_socket, control_port)
+    commands = {' ': 'land', 'L': 'land', 'S': 'stop', 'E': 'emergency'}
+    if command.upper() in commands:
+        if gateway:
+            gateway = send_via_gateway(commands[command.upper()], gateway)
+            if not gateway:
+                print('Gateway unavailable - sending directly instead!')
+        if not gateway:
+            # If not already initalised, initialise the network connection via a UDP socket
+            if not control_socket:
+                possible_addr, control_socket = initialise(first_ip, last_ip, control_port, possible_addr)
+                print('Connection initialised!')
+            send_command(commands[command.upper()], possible_addr, control_socket, control_port)
     elif command.upper() == 'Q':
         print('Q(uit) command received - exiting!')
         exit()
@@ -0,0 +1,125 @@
+import json
+import queue
+import threading
+import time
+
+
+# Journal levels - events below the console level are only written to the journal file (if any)
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+_LEVEL_NAMES = {level: name.upper() for name, level in LEVELS.items()}
+
+# Level, and console message, for each type of event - formatted with the event's fields, plus its ip
+EVENTS = {
+    'sent':         (DEBUG,   '[Command  {ip}]Sent cmd: {command}'),
+    'response':     (DEBUG,   '[Response {ip}]Received: {response}'),
+    'read':         (INFO,    '[Response {ip}]Received: {command} {response}'),
+    'status_read':  (INFO,    '[Response {ip}]From status: {command} {response}'),
+    'timeout':      (WARNING, '[Command  {ip}]Failed to send: {command}'),
+    'on_error':     (WARNING, '[Command  {ip}]Queuing alternative cmd: {command}'),
+    'retry':        (INFO,    '[Command  {ip}]No response, resending: {command} (attempt {attempt})'),
+    'stale':        (DEBUG,   '[Response {ip}]Ignored late or duplicate response: {response}'),
+    'aborted':      (WARNING, '[Command  {ip}]Abandoned: {command}'),
+    'priority':     (INFO,    '[Priority]Sent {command} to {count} Tello(s) in {latency_ms:.3f}ms, '
+                              'discarding {flushed} queued command(s)'),
+    'invalid_type': (WARNING, '[Response {ip}]Invalid command_type: {command_type}'),
+    'error':        (WARNING, '[Response {ip}]Error: {error}'),
+    'fan_out':      (DEBUG,   '[Fan Out]Sent {command} to {count} Tello(s), skew {skew_ms:.3f}ms'),
+    'released':     (DEBUG,   '[Schedule {ip}]Released {command}, {late_ms:.3f}ms after release time'),
+    'sched_error':  (ERROR,   '[Schedule]Exception in scheduled release: {error}'),
+    'socket_error': (ERROR,   '[Socket Error]Exception socket.error : {error}'),
+    'search':       (INFO,    '[Tello Search]Looking for {count} Tello(s)'),
+    'found':        (DEBUG,   '[Tello Search]Found Tello on IP {ip}'),
+    'identified':   (INFO,    '[Tello Search]Identified Tello {num} ({sn}) on IP {ip} after {secs:.3f}s'),
+    'search_done':  (INFO,    '[Tello Search]Found {count} Tello(s) in {secs:.3f}s, sending {packets} packets'),
+}
+
+
+class FlightJournal:
+    """ Structured journal of everything sent to and received from the Tellos, written by a background thread.
+
+        Calling log() just puts the event on a queue, so the threads which send commands and receive responses never
+         wait on console or file I/O.  The writer thread then appends each event to the journal file as a line of JSON
+         (JSON Lines) - e.g. {"time": ..., "level": "DEBUG", "event": "response", "ip": "192.168.1.51", "num": 1,
+         "cmd_id": 3, "command": "battery?", "response": "87", "latency_ms": 23.1} - and prints those at or above the
+         console level.
+    """
+
+    def __init__(self, journal_file=None, console_level='info'):
+        """ :param journal_file: Path of a file to which all events are appended as JSON Lines, or None for no file.
+            :param console_level: Lowest level printed to the console - 'debug' (every command and response), 'info',
+                                   'warning' or 'error'.
+        """
+        if console_level not in LEVELS:
+            raise RuntimeError('Unknown console_level: %s - must be one of %s' % (console_level, ', '.join(LEVELS)))
+        self.journal_file = journal_file
+        self.console_level = LEVELS[console_level]
+        # Events below min_level would be neither printed nor saved, so aren't even queued
+        self.min_level = DEBUG if journal_file is not None else self.console_level
+        self.journal_queue = queue.SimpleQueue()
+        self.writer_thread = threading.Thread(target=self._writer_thread)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def log(self, event, ip=None, **fields):
+        """ Add an event to the journal - safe to call from any thread, and never blocks.
+
+            :param event: Type of event, i.e. a key of EVENTS, e.g. 'sent'.
+            :param ip: IP address of the Tello the event relates to, if any.
+            :param fields: Any further details of the event, e.g. num, cmd_id, command, response, latency_ms.
+        """
+        if EVENTS[event][0] >= self.min_level:
+            self.journal_queue.put((time.time(), event, ip, fields))
+
+    def log_command(self, event, tello, log_entry):
+        """ Add an event relating to a single command to the journal, with the details of the command.
+
+            :param event: Type of event - e.g. 'sent', 'response' or 'timeout'.
+            :param tello: The Tello object to which the command was sent.
+            :param log_entry: The TelloCommand object.
+        """
+        if EVENTS[event][0] < self.min_level:
+            return
+        fields = {'num': tello.num, 'cmd_id': log_entry.cmd_id, 'command': log_entry.command,
+                  'command_type': log_entry.command_type}
+        if event != 'sent':
+            fields['response'] = log_entry.response
+            fields['success'] = log_entry.success
+            if log_entry.sent_time is not None and log_entry.response_time is not None:
+                fields['latency_ms'] = round((log_entry.response_time - log_entry.sent_time) * 1000, 3)
+        self.journal_queue.put((time.time(), event, tello.ip, fields))
+
+    def close(self):
+        """ Write all queued events, then stop the writer thread. """
+        self.journal_queue.put(None)
+        self.writer_thread.join()
+
+    #
+    # THREADS
+    #
+
+    def _writer_thread(self):
+        """ Print and save each queued event - runs in its own thread until closed. """
+        journal = open(self.journal_file, 'a') if self.journal_file is not None else None
+        try:
+            while True:
+                entry = self.journal_queue.get()
+                if entry is None:
+                    return
+                timestamp, event, ip, fields = entry
+                level, console_format = EVENTS[event]
+                if level >= self.console_level:
+                    print(console_format.format(ip=ip, **fields))
+                if journal is not None:
+                    record = {'time': timestamp, 'level': _LEVEL_NAMES[level], 'event': event, 'ip': ip}
+                    record.update(fields)
+                    journal.write(json.dumps(record) + '\n')
+                    # Flush once the queue is empty, i.e. in batches when busy
+                    if self.journal_queue.empty():
+                        journal.flush()
+        finally:
+            if journal is not None:
+                journal.close()
@@ -3,6 +3,10 @@ import threading
 from typing import Union, Optional
 from contextlib import contextmanager
 from comms_manager import CommsManager
+from async_comms_manager import AsyncCommsManager
+from discovery_cache import DEFAULT_CACHE_FILE
+from tello import READ_VALUES, SyncResult
+from move_coalescer import MoveCoalescer
 
 
 class FlyTello:
@@ -19,18 +23,51 @@ class FlyTello:
     # CLASS INITIALISATION AND CONTEXT HANDLER
     #
 
-    def __init__(self, tello_sn_list: list, get_status=False, first_ip: int=1, last_ip: int=254):
+    def __init__(self, tello_sn_list: list, get_status=False, first_ip: int=1, last_ip: int=254,
+                 backend: str='thread', local_ip: str='', subnet: Optional[str]=None,
+                 cache_file: Optional[str]=DEFAULT_CACHE_FILE, telemetry_history: int=0,
+                 telemetry_record: Optional[str]=None, journal_file: Optional[str]=None, console_level: str='info',
+                 status_read_age: Optional[float]=None):
         """ Initiate FlyTello, starting up CommsManager, finding and initialising our Tellos, and reporting battery.
 
             :param tello_sn_list: List of serial numbers, in the order we want to number the Tellos.
             :param first_ip: Optionally, we can specify a smaller range of IP addresses to speed up the search.
             :param last_ip: Optionally, we can specify a smaller range of IP addresses to speed up the search.
+            :param backend: Either 'thread' (CommsManager, default) or 'asyncio' (AsyncCommsManager, for large swarms).
+            :param local_ip: Optionally, the local address to bind to - e.g. '127.0.0.1' to fly the TelloSimulator.
+            :param subnet: Optionally, a /24 network to search instead of the local interfaces, e.g. '127.0.0.0/24'.
+            :param cache_file: File caching where each Tello was last found, to speed up the search.  None to disable.
+            :param telemetry_history: With get_status, number of status messages to keep per Tello (~10 per sec) for
+                                       the get_status_history / mean / min / max methods.  Requires numpy.
+            :param telemetry_record: With get_status, a file in which to record every status message, for analysis
+                                      or replay after the flight via telemetry_recorder.py.
+            :param journal_file: Optionally, a file to which every command and response is saved, as JSON Lines.
+            :param console_level: Lowest level of message printed to the console - 'debug' prints every command and
+                                   response, 'info' (default) just key events, or 'warning' / 'error'.
+            :param status_read_age: With get_status, answer get_battery, get_time etc from status messages received
+                                     within this many secs (e.g. 0.5), instead of asking the Tellos - so they don't
+                                     hold up flight commands.  get_speed always asks, as the status doesn't include it.
         """
-        self.tello_mgr = CommsManager()
-        self.tello_mgr.init_tellos(sn_list=tello_sn_list, get_status=get_status, first_ip=first_ip, last_ip=last_ip)
+        if backend == 'thread':
+            self.tello_mgr = CommsManager(local_ip=local_ip, journal_file=journal_file, console_level=console_level)
+        elif backend == 'asyncio':
+            self.tello_mgr = AsyncCommsManager(local_ip=local_ip, journal_file=journal_file,
+                                               console_level=console_level)
+        else:
+            raise RuntimeError('Unknown backend: %s - must be either \'thread\' or \'asyncio\'' % backend)
+        self.tello_mgr.init_tellos(sn_list=tello_sn_list, get_status=get_status, first_ip=first_ip, last_ip=last_ip,
+                                   subnet=subnet, cache_file=cache_file, telemetry_history=telemetry_history,
+                                   telemetry_record=telemetry_record, status_read_age=status_read_age)
         self.tello_mgr.queue_command('battery?', 'Read', 'All')
         self.individual_behaviour_threads = []
         self.in_sync_these = False
+        # Within a sync_these() block which timed out, the Tellos which were ready - 'All' then means only these
+        self.ready_tellos = None
+        # Within a scheduled() block, the time at which commands are released - kept for each thread, so that e.g.
+        #  run_individual threads carry on sending their own commands straight away
+        self.scheduling = threading.local()
+        # Within a coalesce_moves() block, the MoveCoalescer through which commands are queued
+        self.coalescer = None
 
     def __enter__(self):
         """ (ContextManager) Called when FlyTello is initiated using a with statement. """
@@ -38,20 +75,29 @@ class FlyTello:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """ (ContextManager) Tidies up when FlyTello leaves the scope of its with statement. """
+        land_ids = []
         if exc_type is not None:
-            # If leaving after an Exception, ensure all Tellos have landed...
-            self.tello_mgr.queue_command('land', 'Control', 'All')
+            # If leaving after an Exception, ensure all Tellos have landed - straight away, dropping any queued commands
+            self._discard_moves('All')
+            self.tello_mgr.priority_command('land', 'All')
+            # The priority land isn't confirmed, so also queue a normal land (and a second attempt, if that fails) which
+            #  is waited for below - in case the priority datagram was lost
+            land_ids = self.tello_mgr.queue_command('land', 'Control', 'All', on_error='land')
             print('[Exception Occurred]All Tellos Landing...')
-        else:
-            pass
         # In all cases, wait until all commands have been sent and responses received before closing comms and exiting.
+        self._flush_moves('All')
         self.tello_mgr.wait_sync()
+        for tello_num, cmd_id in land_ids:
+            tello = self.tello_mgr.get_tello(tello_num)
+            if not tello.log_entry(cmd_id).success and not tello.log_entry().success:
+                print('[Exception Occurred]Tello %d has not confirmed landing!' % tello_num)
         self.tello_mgr.close_connections()
 
     #
     # TELLO SDK V2.0 COMMANDS: CONTROL
     #
-    # Control commands perform validation of input parameters.  tello_num can be an individual (1,2,...) or 'All'.
+    # Control commands perform validation of input parameters.  tello_num can be an individual (1,2,...), 'All', or a
+    #  list of Tello numbers, e.g. the Tellos which finished in time, as returned by wait_sync(timeout=...).finished.
     # If sync is True, will wait until all Tellos are ready before executing command.
     #   Note sync is ignored (i.e. False) if tello_num is 'All', or if is called within a sync_these 'with' block.
     #
@@ -65,12 +111,14 @@ class FlyTello:
         self._command('land', 'Control', tello, sync)
 
     def stop(self, tello: Union[int, str]='All') -> None:
-        """ Stop Tello wherever it is, even if mid-manoeuvre. """
-        self._command('stop', 'Control', tello, sync=False)
+        """ Stop Tello wherever it is, even if mid-manoeuvre.  Sent straight away, discarding any queued commands. """
+        self._discard_moves(tello)
+        self.tello_mgr.priority_command('stop', tello)
 
     def emergency(self, tello: Union[int, str]='All') -> None:
-        """ Immediately kill power to the Tello's motors. """
-        self._command('emergency', 'Control', tello, sync=False)
+        """ Immediately kill power to the Tello's motors.  Sent straight away, discarding any queued commands. """
+        self._discard_moves(tello)
+        self.tello_mgr.priority_command('emergency', tello)
 
     def up(self, dist: int, tello: Union[int, str]='All', sync: bool=True) -> None:
         """ Move up by dist (in cm) """
@@ -262,14 +310,25 @@ class FlyTello:
         self._command_with_value('speed', 'Set', speed, 10, 100, 'cm/s', tello, sync)
 
     def set_rc(self, left_right: int, forward_back: int, up_down: int, yaw: int,
-               tello: Union[int, str]='All', sync: bool=False) -> None:
-        """ Simulate remote controller commands, with range of -100 to +100 on each axis. """
-        self._control_multi(command='rc',
-                            val_params=[(left_right, -100, 100, 'left_right'),
-                                        (forward_back, -100, 100, 'forward_back'),
-                                        (up_down, -100, 100, 'up_down'),
-                                        (yaw, -100, 100, 'yaw')],
-                            opt_params=[], tello_num=tello, sync=sync)
+               tello: Union[int, str, list]='All', sync: bool=False) -> None:
+        """ Simulate remote controller commands, with range of -100 to +100 on each axis.
+
+            Returns straight away - the setpoint is streamed to the Tello(s) many times a second (see CommsManager
+             set_rc) until updated by calling set_rc again, e.g. from a joystick or control loop.  If not updated for
+             half a second, the Tello(s) hover.  Call stop_rc() before any other moves.
+        """
+        tello = self._sync_before_command(tello, sync)
+        for value, label in [(left_right, 'left_right'), (forward_back, 'forward_back'), (up_down, 'up_down'),
+                             (yaw, 'yaw')]:
+            if not -100 <= value <= 100:
+                print('[FlyTello Error]rc - %s parameter out-of-range.' % label)
+                return
+        self._flush_moves(tello)
+        self.tello_mgr.set_rc(left_right, forward_back, up_down, yaw, tello)
+
+    def stop_rc(self, tello: Union[int, str, list]='All') -> None:
+        """ Stop streaming rc setpoints to the Tello(s), leaving them hovering - ready for other commands. """
+        self.tello_mgr.stop_rc(tello)
 
     def set_own_wifi(self, ssid: str, password: str, tello: int, sync: bool=False) -> None:
         """ Set the Tello's own WiFi built-in hotspot to use the specified name (ssid) and password. """
@@ -328,6 +387,35 @@ class FlyTello:
         """ Read the Serial Number of the Tello(s) """
         self._command('sn?', 'Read', tello, sync)
 
+    def query(self, command: str, tello: Union[str, int, list]='All') -> dict:
+        """ Send a Read command (e.g. 'battery?'), returning straight away with a Future for each Tello's reply.
+
+            Each Future resolves to the reply as a value - e.g. an int for 'battery?', or a dict for 'attitude?'.  Use
+             gather() to collect them all, or e.g. fly.query('battery?', 1)[1].result(timeout=5) for a single Tello.
+
+            :param command: One of the Tello SDK Read commands, i.e. the get_... methods above.
+            :param tello: Tello Number, list of Tello Numbers, or 'All'.
+            :return: Dict of {tello_num: concurrent.futures.Future}.
+        """
+        if command not in READ_VALUES:
+            raise RuntimeError('Not a Read command: %s - must be one of %s' % (command, ', '.join(READ_VALUES)))
+        tello = self._sync_before_command(tello, False)
+        self._flush_moves(tello)
+        return self.tello_mgr.query(command, tello)
+
+    def gather(self, command: str, tello: Union[str, int, list]='All', timeout: Optional[float]=10.0) -> dict:
+        """ Send a Read command to the Tello(s), and wait for all of their replies together - up to timeout overall.
+
+            e.g. fly.gather('battery?') might return {1: 87, 2: 64}.  The Tellos are asked concurrently, so this takes
+             about as long as the slowest Tello, not the sum of them all.
+
+            :param command: One of the Tello SDK Read commands, e.g. 'battery?', 'time?' or 'height?'.
+            :param tello: Tello Number, list of Tello Numbers, or 'All'.
+            :param timeout: Max seconds to wait for all of the replies, or None for as long as it takes.
+            :return: Dict of {tello_num: value}, with None for any Tello which didn't reply with a valid value in time.
+        """
+        return self.tello_mgr.gather(self.query(command, tello), timeout)
+
     #
     # TELLO SDK V2.0 EXTENDED & COMPOSITE COMMANDS
     #
@@ -424,6 +512,8 @@ class FlyTello:
             :param tello: Number of an individual Tello, i.e. 1,2,....  Doesn't support 'All'.
             :return: Returns True when mission pad is found, and Tello is hovering directly above it.  Otherwise False.
         """
+        # Each step depends on the outcome of the last, so any moves held back by coalesce_moves() must go first
+        self._flush_moves(tello)
         for x in range(0, len(pattern)):
             # Try to centre over the nearest mission pad
             cmd_ids = self.tello_mgr.queue_command('go 0 0 %d %d %s' % (height, speed, pad),
@@ -476,12 +566,19 @@ class FlyTello:
     # SYNC AND TIMING METHODS
     #
 
-    def wait_sync(self) -> None:
-        """ Block execution until all Tellos are ready, i.e. no queued commands or pending responses. """
-        self.tello_mgr.wait_sync()
+    def wait_sync(self, timeout: Optional[float]=None, tello: Union[int, str, list]='All') -> SyncResult:
+        """ Block execution until all Tellos are ready, i.e. no queued commands or pending responses.
+
+            :param timeout: Max seconds to wait, or None (default) to wait for as long as it takes.
+            :param tello: The Tellos to wait for - 'All' (default), an individual Tello, or a list of Tello numbers.
+            :return: SyncResult - e.g. result.finished lists the Tellos which are ready, and result.timed_out those
+                      which are not.  True if every Tello is ready.
+        """
+        self._flush_moves(tello)
+        return self.tello_mgr.wait_sync(timeout, tello)
 
     @contextmanager
-    def sync_these(self) -> None:
+    def sync_these(self, timeout: Optional[float]=None, tello: Union[int, str, list]='All') -> SyncResult:
         """ Synchronise the commands within the "with" block, when this is used as a Context Manager.
 
             Provides a clearer way to layout code which will ensure all Tellos are ready before the code within this
@@ -492,11 +589,73 @@ class FlyTello:
                     fly.left(50, 1)
                     fly.right(50, 2)
             Note that any sync=True setting on commands inside the block will be ignored!
+
+            With a timeout, the block goes ahead with just the Tellos which are ready by then - commands for 'All'
+            within the block are only sent to those, and the SyncResult says which Tellos were left out, e.g.:
+                with fly.sync_these(timeout=10) as sync:
+                    fly.up(50)
+                    if sync.timed_out:
+                        print('Left behind: %s' % sync.timed_out)
+
+            :param timeout: Max seconds to wait, or None (default) to wait for as long as it takes.
+            :param tello: The Tellos to wait for - 'All' (default), an individual Tello, or a list of Tello numbers.
         """
-        self.tello_mgr.wait_sync()
+        self._flush_moves(tello)
+        result = self.tello_mgr.wait_sync(timeout, tello)
         self.in_sync_these = True
-        yield
-        self.in_sync_these = False
+        if result.timed_out:
+            self.ready_tellos = result.finished
+        try:
+            yield result
+        finally:
+            self.in_sync_these = False
+            self.ready_tellos = None
+
+    @contextmanager
+    def scheduled(self, delay: float=0.0, release_time: Optional[float]=None) -> float:
+        """ Send every command within the "with" block at exactly the same time - e.g. to start a formation move.
+
+            The release time is either given directly (as returned by time.monotonic()), or is delay secs from now, and
+            is returned by the context manager so that later steps can be timed from it.  Commands within the block are
+            rejected (raising RuntimeError) if a Tello's earlier commands are not expected to be complete in time, so
+            each block should contain only one command for each Tello, e.g.:
+                with fly.scheduled(delay=0.3) as t0:
+                    fly.curve(20, 20, 0, 40, 60, 0, 30, tello=1)
+                    fly.curve(-20, -20, 0, -40, -60, 0, 30, tello=2)
+                with fly.scheduled(release_time=t0 + 5):
+                    fly.flip('left')
+            Only commands from the thread which entered the block are scheduled - e.g. run_individual threads are not.
+            Note that any sync=True setting on commands inside the block will be ignored!
+        """
+        self._flush_moves('All')
+        self.scheduling.release_time = release_time if release_time is not None else time.monotonic() + delay
+        try:
+            yield self.scheduling.release_time
+        finally:
+            self.scheduling.release_time = None
+
+    @contextmanager
+    def coalesce_moves(self) -> MoveCoalescer:
+        """ Merge runs of relative moves (forward, back, left, right, up, down and straight) into a single 'go' for
+             each Tello, within the "with" block - e.g. to save a round trip, and a stop-and-settle, on every step of a
+             long sequence of short moves:
+                with fly.coalesce_moves() as moves:
+                    fly.forward(50)
+                    fly.left(50)        # Sent as 'go 50 50 0 100', i.e. flies diagonally to the same point
+                    fly.rotate_cw(90)   # Anything else (e.g. rotate, flip, or mission pad commands) is sent in order
+                print(moves.round_trips_saved)
+
+            Moves are held back until a different command, or a wait (e.g. wait_sync, sync_these, gather), for the
+             same Tello - and are all sent by the end of the block.  Note that pause() doesn't send them.
+        """
+        self.coalescer = MoveCoalescer(self.tello_mgr)
+        try:
+            yield self.coalescer
+            self.coalescer.flush()
+        finally:
+            coalescer, self.coalescer = self.coalescer, None
+            print('[Coalesce Moves]Merged %d move(s) into %d command(s), saving %d round trip(s)'
+                  % (coalescer.moves_received, coalescer.commands_sent, coalescer.round_trips_saved))
 
     @staticmethod
     def pause(secs: float) -> None:
@@ -511,6 +670,7 @@ class FlyTello:
         
             :param tello: Tello Number - must be a single Tello, referenced by its number.  Cannot be 'All'.
         """
+        self._flush_moves(tello)
         self.tello_mgr.get_tello(tello).flight_complete = True
 
     #
@@ -520,6 +680,7 @@ class FlyTello:
     def print_status(self, tello: Union[int, str]='All', sync: bool=False) -> None:
         """ Print the entire Status Message to the Python Console, for the specified Tello(s). """
         if sync and not self.in_sync_these:
+            self._flush_moves('All')
             self.tello_mgr.wait_sync()
         if tello == 'All':
             for tello in self.tello_mgr.tellos:
@@ -528,39 +689,122 @@ class FlyTello:
             tello = self.tello_mgr.get_tello(num=tello)
             print('Tello %d Status: %s' % (tello.num, tello.status))
 
-    def get_status(self, key: str, tello: int, sync: bool=False) -> Optional[str]:
-        """ Return the value of a specific key from an individual Tello  """
+    def get_status(self, key: str, tello: int, sync: bool=False) -> Optional[Union[int, float, tuple]]:
+        """ Return the value of a specific key from an individual Tello, e.g. 'bat' or 'baro', as a number  """
         if sync and not self.in_sync_these:
+            self._flush_moves('All')
             self.tello_mgr.wait_sync()
         tello = self.tello_mgr.get_tello(num=tello)
         if key in tello.status:
             return tello.status[key]
         return None
 
+    def get_status_history(self, key: str, tello: Union[int, str]='All', secs: Optional[float]=None) -> tuple:
+        """ Return the recent history of a status key, as numpy arrays (timestamps, values), oldest first.
+
+            For 'All' each array has one row per Tello (in order of num); for an individual Tello, a single row.
+            Requires FlyTello to be initialised with get_status=True and telemetry_history.
+
+            :param key: The status key, e.g. 'h' or 'bat'.
+            :param tello: Tello Number, or 'All'.
+            :param secs: Only include the last secs seconds, or None for the whole history.  Older slots are NaN.
+        """
+        timestamps, values = self._get_telemetry().window(key, secs)
+        if tello == 'All':
+            return timestamps, values
+        row = self._get_telemetry_row(tello)
+        return timestamps[row], values[row]
+
+    def get_status_mean(self, key: str, tello: Union[int, str]='All', secs: float=1.0):
+        """ Return the rolling mean of a status key over the last secs seconds - an array for 'All' (one value per
+            Tello, in order of num), or a float for an individual Tello.  NaN where no status has been received.
+        """
+        means = self._get_telemetry().mean(key, secs)
+        if tello == 'All':
+            return means
+        return means[self._get_telemetry_row(tello)].item()
+
+    def get_status_min(self, key: str, secs: Optional[float]=None) -> tuple:
+        """ Return the lowest value of a status key across all Tellos, e.g. get_status_min('bat') for lowest battery.
+
+            :param key: The status key, e.g. 'bat'.
+            :param secs: Search the last secs seconds of history, or None for just the latest status of each Tello.
+            :return: Tuple (value, tello_num), or (None, None) if no status has been received.
+        """
+        return self._get_telemetry().extreme(key, secs, highest=False)
+
+    def get_status_max(self, key: str, secs: Optional[float]=None) -> tuple:
+        """ Return the highest value of a status key across all Tellos, e.g. get_status_max('h') for the highest Tello.
+
+            :param key: The status key, e.g. 'h'.
+            :param secs: Search the last secs seconds of history, or None for just the latest status of each Tello.
+            :return: Tuple (value, tello_num), or (None, None) if no status has been received.
+        """
+        return self._get_telemetry().extreme(key, secs, highest=True)
+
     #
     # PRIVATE SHORTCUT METHODS
     #
 
+    def _get_telemetry(self):
+        if self.tello_mgr.telemetry is None:
+            raise RuntimeError('Telemetry history not enabled - use get_status=True and telemetry_history in FlyTello')
+        return self.tello_mgr.telemetry
+
+    def _get_telemetry_row(self, tello_num):
+        return self._get_telemetry().rows[self.tello_mgr.get_tello(num=tello_num).ip]
+
+    def _release_time(self):
+        """ Returns the release time of the scheduled() block this thread is within, or None if not scheduling. """
+        return getattr(self.scheduling, 'release_time', None)
+
+    def _flush_moves(self, tello_num):
+        if self.coalescer is not None:
+            self.coalescer.flush(tello_num)
+
+    def _discard_moves(self, tello_num):
+        if self.coalescer is not None:
+            self.coalescer.discard(tello_num)
+
+    def _queue_command(self, command, command_type, tello_num, sync):
+        """ Queue the command via the MoveCoalescer within a coalesce_moves() block, otherwise straight to CommsManager.
+
+            Scheduled commands are never held back, as they must be queued in time for their release.  Within a
+             sync_these() block, sync is ignored - so commands aren't held at a barrier for the other Tellos either.
+        """
+        release_time = self._release_time()
+        barrier = sync and not self.in_sync_these
+        if self.coalescer is not None and release_time is None:
+            self.coalescer.queue_command(command, command_type, tello_num, barrier=barrier)
+        else:
+            self.tello_mgr.queue_command(command, command_type, tello_num, barrier=barrier, release_time=release_time)
+
+    def _sync_before_command(self, tello_num, sync):
+        """ Wait until the Tellos are ready (for sync), returning the Tellos to which the command should be sent. """
+        if tello_num == 'All' and self.ready_tellos is not None:
+            return self.ready_tellos
+        if sync and not isinstance(tello_num, int) and not self.in_sync_these and self._release_time() is None:
+            # Kept for 'All' too - wait_sync waits for every Tello to finish its earlier commands, then the barrier (see
+            #  _queue_command) sends this command to all of them back to back, rather than as each is ready
+            self.tello_mgr.wait_sync(tello_num=tello_num)
+        return tello_num
+
     def _command(self, command, command_type, tello_num, sync):
-        if sync and tello_num == 'All' and not self.in_sync_these:
-            # TODO: Review whether tello_num=='All' should preclude wait_sync - might want to keep it!
-            self.tello_mgr.wait_sync()
-        self.tello_mgr.queue_command(command, command_type, tello_num)
+        tello_num = self._sync_before_command(tello_num, sync)
+        self._queue_command(command, command_type, tello_num, sync)
 
     def _command_with_value(self, command, command_type, value, val_min, val_max, units, tello_num, sync):
-        if sync and tello_num == 'All' and not self.in_sync_these:
-            self.tello_mgr.wait_sync()
+        tello_num = self._sync_before_command(tello_num, sync)
         if val_min <= value <= val_max:
-            self.tello_mgr.queue_command('%s %d' % (command, value), command_type, tello_num)
+            self._queue_command('%s %d' % (command, value), command_type, tello_num, sync)
         else:
             print('[FlyTello Error]%s %d - value must be %d-%d%s.' % (command, value, val_min, val_max, units))
 
     def _command_with_options(self, command, command_type, option, validate_options, tello_num, sync):
         # TODO: Allow an on_error value to be passed through to queue_command
-        if sync and tello_num == 'All' and not self.in_sync_these:
-            self.tello_mgr.wait_sync()
+        tello_num = self._sync_before_command(tello_num, sync)
         if option in validate_options:
-            self.tello_mgr.queue_command('%s %s' % (command, option), command_type, tello_num)
+            self._queue_command('%s %s' % (command, option), command_type, tello_num, sync)
         else:
             print('[FlyTello Error]%s %s - value must be in list %s.' % (command, option, validate_options))
 
@@ -579,8 +823,7 @@ class FlyTello:
             :return: Returns list of cmd_ids, from queue_command() - or nothing
         """
         # TODO: Allow an on_error value to be passed through to queue_command
-        if sync and tello_num == 'All' and not self.in_sync_these:
-            self.tello_mgr.wait_sync()
+        tello_num = self._sync_before_command(tello_num, sync)
 
         command_parameters = ''
 
@@ -598,4 +841,4 @@ class FlyTello:
                 print('[FlyTello Error]%s - %s parameter not valid.' % (command, opt_param[2]))
                 return
 
-        self.tello_mgr.queue_command('%s%s' % (command, command_parameters), 'Control', tello_num)
+        self._queue_command('%s%s' % (command, command_parameters), 'Control', tello_num, sync)
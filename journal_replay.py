@@ -0,0 +1,237 @@
+#
+# Replays a recorded flight against stand-in Tellos, to spot performance regressions without flying anything.
+#
+# Record a real flight by adding journal_file to the script's FlyTello, e.g. FlyTello(my_tellos, journal_file=...),
+#  then re-run the same script against virtual Tellos which give the recorded responses with the recorded timing:
+#       python journal_replay.py flight.jsonl demo_single.py --output replay_report.json
+#
+# The report compares the replay with the recording: the time each command took to be dispatched once its Tello was
+#  ready, the skew between Tellos sent the same command together, and the total mission duration.
+#
+
+import argparse
+import collections
+import contextlib
+import inspect
+import json
+import os
+import runpy
+import sys
+import tempfile
+import fly_tello
+from benchmark import summarise
+from tello_simulator import TelloSimulator, VirtualTello
+
+
+#
+# CLASS DEFINITIONS
+#
+
+class FlightRecording:
+    """ The Tellos, and every command sent to them with its timing, as read from a FlightJournal file. """
+
+    def __init__(self, journal_file):
+        """ :param journal_file: Path of the JSON Lines journal, written with FlyTello(..., journal_file=...). """
+        self.journal_file = journal_file
+        # Details of each Tello, keyed by num: {'sn': ..., 'ip': ...}
+        self.tellos = {}
+        # Commands sent to each Tello in order, keyed by IP: [{'cmd_id', 'command', 'sent', 'response', 'latency'}]
+        self.commands = collections.defaultdict(list)
+        # Start of the mission, i.e. once all Tellos were found, and the last response (or timeout) received
+        self.mission_start = None
+        self.mission_end = None
+
+        sent = {}
+        with open(journal_file) as journal:
+            for line in journal:
+                event = json.loads(line)
+                if event['event'] == 'identified':
+                    self.tellos[event['num']] = {'sn': event['sn'], 'ip': event['ip']}
+                elif event['event'] == 'search_done':
+                    self.mission_start = event['time']
+                elif event['event'] == 'sent':
+                    command = {'cmd_id': event['cmd_id'], 'command': event['command'], 'sent': event['time'],
+                               'response': None, 'latency': None}
+                    sent[(event['ip'], event['cmd_id'])] = command
+                    self.commands[event['ip']].append(command)
+                elif event['event'] in ('response', 'read', 'timeout'):
+                    command = sent.get((event['ip'], event['cmd_id']))
+                    if command is not None:
+                        # A timeout is recorded as no response, so that the stand-in Tello also doesn't respond
+                        command['response'] = event['response'] if event['event'] != 'timeout' else None
+                        command['latency'] = event.get('latency_ms', 0) / 1000
+                    self.mission_end = event['time']
+        if not self.tellos or self.mission_start is None:
+            raise RuntimeError('%s has no completed Tello search - was it written with FlyTello(journal_file=...)?'
+                               % journal_file)
+
+    @property
+    def serials(self):
+        """ Serial numbers of the Tellos, in order of num. """
+        return [self.tellos[num]['sn'] for num in sorted(self.tellos)]
+
+    def mission_commands(self, num):
+        """ Commands sent to a Tello after the search completed, i.e. by the flight script itself. """
+        return [command for command in self.commands[self.tellos[num]['ip']] if command['sent'] >= self.mission_start]
+
+    def script(self, sn):
+        """ Recorded responses of the Tello with serial number sn, as {command: deque([(response, latency), ...])}. """
+        script = collections.defaultdict(collections.deque)
+        for tello in self.tellos.values():
+            if tello['sn'] == sn:
+                for command in self.commands[tello['ip']]:
+                    script[command['command']].append((command['response'], command['latency']))
+        return script
+
+    def timing(self):
+        """ Returns the dispatch timing of each command, plus skew between Tellos and total mission duration.
+
+            Dispatch is the time from a Tello being ready (i.e. the response to its previous command, or the start of
+             the mission) until the next command is sent to it.  Skew is the spread of send times, for each step at
+             which every Tello was sent the same command.
+
+            :return: Dict of {'dispatch': {(num, index): secs}, 'skew': {index: secs}, 'mission_secs': secs}.
+        """
+        dispatch = {}
+        steps = collections.defaultdict(list)
+        for num in self.tellos:
+            ready = self.mission_start
+            for index, command in enumerate(self.mission_commands(num)):
+                dispatch[(num, index)] = command['sent'] - ready
+                ready = command['sent'] + (command['latency'] or 0)
+                steps[index].append(command)
+        skew = {}
+        for index, commands in steps.items():
+            if len(commands) > 1 and len(set(command['command'] for command in commands)) == 1:
+                skew[index] = max(c['sent'] for c in commands) - min(c['sent'] for c in commands)
+        return {'dispatch': dispatch, 'skew': skew, 'mission_secs': self.mission_end - self.mission_start}
+
+
+class ScriptedTello(VirtualTello):
+    """ A virtual Tello which answers each command with the response, and after the time, recorded in a journal.
+
+        Responses are matched by command, in the order recorded.  Commands not in the recording (or sent more times
+         than recorded) fall back to the usual VirtualTello behaviour.
+    """
+
+    def __init__(self, ip, sn, script, time_scale=1.0):
+        """ :param ip: Address on which this virtual Tello listens, as a string.
+            :param sn: Serial number reported by this virtual Tello.
+            :param script: Recorded responses, as returned by FlightRecording.script().
+            :param time_scale: Multiplier for the recorded response times, e.g. 0.1 to replay ten times faster.
+        """
+        super().__init__(ip, sn)
+        self.script = script
+        self.time_scale = time_scale
+        self.next_duration = None
+
+    def respond(self, command):
+        """ Update the virtual Tello's state as usual, but return the recorded response if there is one. """
+        response = super().respond(command)
+        self.next_duration = None
+        if self.script.get(command):
+            response, latency = self.script[command].popleft()
+            self.next_duration = (latency or 0) * self.time_scale
+        return response
+
+    def command_duration(self, command):
+        """ The recorded time for the command just responded to - including the network round-trip. """
+        return self.next_duration
+
+
+#
+# FUNCTION DEFINITIONS
+#
+
+@contextlib.contextmanager
+def replay_fly_tello(num_tellos, backend, journal_file):
+    """ Within this context, FlyTello always connects to the stand-in Tellos, and journals to journal_file.
+
+        The flight script's own FlyTello arguments (e.g. get_status) are kept, other than those which control how it
+         finds and talks to the Tellos.
+    """
+    original = fly_tello.FlyTello
+    overrides = {'first_ip': 2, 'last_ip': 1 + num_tellos, 'local_ip': '127.0.0.1', 'subnet': '127.0.0.0/24',
+                 'cache_file': None, 'backend': backend, 'journal_file': journal_file, 'console_level': 'warning'}
+
+    class ReplayFlyTello(original):
+        def __init__(self, *args, **kwargs):
+            arguments = inspect.signature(original.__init__).bind(self, *args, **kwargs).arguments
+            del arguments['self']
+            arguments.update(overrides)
+            super().__init__(**arguments)
+
+    fly_tello.FlyTello = ReplayFlyTello
+    try:
+        yield
+    finally:
+        fly_tello.FlyTello = original
+
+
+def compare(recorded, replayed):
+    """ Compare the timing of a replay with its recording, returning a report as a dict. """
+    recorded_timing, replayed_timing = recorded.timing(), replayed.timing()
+    common = sorted(set(recorded_timing['dispatch']) & set(replayed_timing['dispatch']))
+    changes = [(replayed_timing['dispatch'][key] - recorded_timing['dispatch'][key], key) for key in common]
+    # Check the replay sent the same commands as the recording, otherwise the comparison is not like-for-like
+    divergent = sum(1 for num, index in common if recorded.mission_commands(num)[index]['command']
+                    != replayed.mission_commands(num)[index]['command'])
+    report = {}
+    for name, timing in [('recorded', recorded_timing), ('replayed', replayed_timing)]:
+        report[name] = {'mission_secs': round(timing['mission_secs'], 3),
+                        'commands': len(timing['dispatch']),
+                        'dispatch': summarise(list(timing['dispatch'].values()) or [0]),
+                        'skew': summarise(list(timing['skew'].values()) or [0])}
+    report['mission_change_secs'] = round(replayed_timing['mission_secs'] - recorded_timing['mission_secs'], 3)
+    report['divergent_commands'] = divergent
+    report['slowest_dispatch'] = [{'tello': num, 'command': replayed.mission_commands(num)[index]['command'],
+                                   'change_ms': round(change * 1000, 3)}
+                                  for change, (num, index) in sorted(changes, reverse=True)[:5]]
+    return report
+
+
+def replay(journal_file, script, script_args=(), time_scale=1.0, backend='thread'):
+    """ Re-run a flight script against stand-in Tellos which replay a recorded journal, and compare the timing.
+
+        :param journal_file: Journal recorded from the original flight, via FlyTello(..., journal_file=...).
+        :param script: Path of the original flight script, which is run as if it were __main__.
+        :param script_args: Command line arguments for the script, if any.
+        :param time_scale: Multiplier for recorded response times - 1.0 (default) for a like-for-like comparison.
+        :param backend: CommsManager backend for the replay - either 'thread' or 'asyncio'.
+        :return: Dict comparing the replay to the recording - see compare().
+    """
+    recorded = FlightRecording(journal_file)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        replay_journal = os.path.join(temp_dir, 'replay.jsonl')
+        argv = sys.argv
+        sys.argv = [script] + list(script_args)
+        try:
+            with TelloSimulator(len(recorded.tellos), serials=recorded.serials,
+                                tello_factory=lambda ip, sn: ScriptedTello(ip, sn, recorded.script(sn), time_scale)):
+                with replay_fly_tello(len(recorded.tellos), backend, replay_journal):
+                    runpy.run_path(script, run_name='__main__')
+        finally:
+            sys.argv = argv
+        replayed = FlightRecording(replay_journal)
+    return compare(recorded, replayed)
+
+
+#
+# MAIN SCRIPT
+#
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a recorded flight against stand-in Tellos, comparing timing.')
+    parser.add_argument('journal_file', help='Journal recorded from the original flight')
+    parser.add_argument('script', help='The original flight script')
+    parser.add_argument('script_args', nargs=argparse.REMAINDER, help='Arguments for the flight script')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='Multiplier for recorded response times')
+    parser.add_argument('--backend', default='thread', choices=['thread', 'asyncio'], help='CommsManager backend')
+    parser.add_argument('--output', default=None, help='File to write the JSON report to')
+    args = parser.parse_args()
+
+    replay_report = replay(args.journal_file, args.script, args.script_args, args.time_scale, args.backend)
+    print('[Replay]%s' % json.dumps(replay_report, indent=2))
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(replay_report, output_file, indent=2)
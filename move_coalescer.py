@@ -0,0 +1,187 @@
+import threading
+
+
+# Relative moves which can be merged, as the (x, y, z) direction of each - the axes of the SDK 'go x y z speed' command
+MOVE_VECTORS = {'forward': (1, 0, 0), 'back': (-1, 0, 0), 'left': (0, 1, 0), 'right': (0, -1, 0),
+                'up': (0, 0, 1), 'down': (0, 0, -1)}
+# SDK limits for each axis of 'go' - and at least one axis must be MIN_MOVE or more (in either direction)
+MAX_MOVE = 500
+MIN_MOVE = 20
+
+
+class MoveCoalescer:
+    """ Sits in front of CommsManager.queue_command, merging runs of relative moves for each Tello into a single 'go'.
+
+        Each move costs a full round trip, and the Tello stops and settles after each one - so e.g. 'forward 50' then
+         'left 50' is sent as 'go 50 50 0 100' instead, or 'up 20' then 'up 30' as 'up 50'.  The Tello ends up in the
+         same place, but flies straight there.  Moves are held back until something else is queued for the same
+         Tello (e.g. a rotate, flip or mission pad command, which are never merged), or flush() is called - e.g.
+         before waiting for the Tellos.  Merges are only made within the SDK limits for 'go', i.e. each axis within
+         +/-MAX_MOVE, and at least MIN_MOVE on one axis - otherwise the original moves are sent as they were.
+
+        A barrier move (i.e. sync=True) for several Tellos is only merged if every one of those Tellos ends up with the
+         same merged commands, so each is still sent to all of them together.  Otherwise, their moves are sent as they
+         were, each barrier move still to all of its Tellos at once.
+    """
+
+    def __init__(self, tello_mgr):
+        """ :param tello_mgr: The CommsManager to which commands are passed on. """
+        self.tello_mgr = tello_mgr
+        # Moves held back for each Tello, as {num: [(command, (x, y, z), speed, barrier, call, nums), ...]} - where
+        #  call numbers each queue_command call in order, and nums are all of the Tellos that call was for
+        self.pending = {}
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.moves_received = 0
+        self.commands_sent = 0
+
+    @property
+    def round_trips_saved(self):
+        """ Number of commands (and so round trips) saved by merging moves, so far. """
+        return self.moves_received - self.commands_sent
+
+    def queue_command(self, command, command_type, tello_num, on_error=None, barrier=False):
+        """ Queue a command, as CommsManager.queue_command - except that relative moves are held back to be merged.
+
+            Anything other than a relative move first flushes the moves held back for its Tello(s), so everything is
+             still sent to each Tello in order.
+        """
+        nums = self._select_nums(tello_num)
+        move = None if on_error is not None else self._move_vector(command, command_type)
+        with self.lock:
+            if move is None:
+                self._flush(nums)
+                self.tello_mgr.queue_command(command, command_type, tello_num, on_error, barrier)
+                return
+            self.calls += 1
+            for num in nums:
+                vector, speed = move
+                if speed is None:
+                    speed = self.tello_mgr.get_tello(num).speed
+                self.pending.setdefault(num, []).append((command, vector, speed, barrier, self.calls, tuple(nums)))
+                self.moves_received += 1
+
+    def flush(self, tello_num='All'):
+        """ Send all moves held back for the Tello(s), merged where possible.
+
+            :param tello_num: Either 'All', a Tello number (1,2,...), or a list of Tello numbers.
+        """
+        with self.lock:
+            self._flush(self._select_nums(tello_num))
+
+    def discard(self, tello_num='All'):
+        """ Drop any moves held back for the Tello(s), without sending them - e.g. when 'stop' is sent instead.
+
+            :param tello_num: Either 'All', a Tello number (1,2,...), or a list of Tello numbers.
+        """
+        with self.lock:
+            for num in self._select_nums(tello_num):
+                self.moves_received -= len(self.pending.pop(num, []))
+
+    #
+    # PRIVATE HELPER METHODS
+    #
+
+    def _select_nums(self, tello_num):
+        if tello_num == 'All':
+            return [tello.num for tello in self.tello_mgr.tellos]
+        if isinstance(tello_num, (list, tuple)):
+            return list(tello_num)
+        return [tello_num]
+
+    @staticmethod
+    def _move_vector(command, command_type):
+        """ Returns ((x, y, z), speed) for a relative move which can be merged - speed being None for a move which uses
+             the Tello's speed setting - or None for any other command.
+        """
+        if command_type != 'Control':
+            return None
+        parts = command.split(' ')
+        try:
+            if parts[0] in MOVE_VECTORS and len(parts) == 2:
+                dist = int(parts[1])
+                return tuple(dist * axis for axis in MOVE_VECTORS[parts[0]]), None
+            if parts[0] == 'go' and len(parts) == 5:
+                return (int(parts[1]), int(parts[2]), int(parts[3])), int(parts[4])
+        except ValueError:
+            pass
+        return None
+
+    def _flush(self, nums):
+        """ Send the moves held back for each of nums - Tellos with identical commands are sent them together.
+
+            Any other Tello sharing a held barrier move with one of nums is flushed too, so the barrier isn't split.
+        """
+        nums = self._barrier_closure(nums)
+        merged = {num: tuple(self._merge(self.pending[num])) for num in nums}
+        # Tellos whose commands would differ from another Tello sharing a barrier move are sent their moves unmerged
+        unmerged = self._barrier_closure([num for num in nums if any(merged[other] != merged[num]
+                                                                     for other in self._barrier_partners(num))])
+        if unmerged:
+            self._send_unmerged(unmerged)
+        groups = {}
+        for num in nums:
+            if num not in unmerged:
+                groups.setdefault(merged[num], []).append(num)
+            del self.pending[num]
+        for commands, group in groups.items():
+            self.commands_sent += len(commands) * len(group)
+            for command, barrier in commands:
+                self.tello_mgr.queue_command(command, 'Control', group if len(group) > 1 else group[0],
+                                             barrier=barrier)
+
+    def _barrier_partners(self, num):
+        """ Returns the other Tellos with which num shares a held barrier move. """
+        return {other for _, _, _, barrier, _, call_nums in self.pending.get(num, []) if barrier
+                for other in call_nums if other != num}
+
+    def _barrier_closure(self, nums):
+        """ Returns those of nums with moves held back, plus every Tello sharing a held barrier move with them (and so
+             on), as a list.
+        """
+        closure = [num for num in nums if self.pending.get(num)]
+        for num in closure:
+            closure.extend(other for other in self._barrier_partners(num)
+                           if other not in closure and self.pending.get(other))
+        return closure
+
+    def _send_unmerged(self, nums):
+        """ Send the moves held back for nums as they were, in order - each to all of its Tellos together. """
+        calls = {}
+        for num in nums:
+            for command, _, _, barrier, call, _ in self.pending[num]:
+                calls.setdefault(call, (command, barrier, []))[2].append(num)
+        for call in sorted(calls):
+            command, barrier, group = calls[call]
+            self.commands_sent += len(group)
+            self.tello_mgr.queue_command(command, 'Control', group if len(group) > 1 else group[0], barrier=barrier)
+
+    @staticmethod
+    def _merge(moves):
+        """ Merge a list of moves for one Tello into as few commands as possible, returning [(command, barrier), ...].
+
+            Consecutive moves are merged whilst they have the same speed and barrier, and every axis stays in range.
+        """
+        runs = []
+        for command, vector, speed, barrier, _, _ in moves:
+            if runs:
+                run_moves, run_vector, run_speed, run_barrier = runs[-1]
+                total = tuple(a + b for a, b in zip(run_vector, vector))
+                if speed == run_speed and barrier == run_barrier and max(abs(axis) for axis in total) <= MAX_MOVE:
+                    runs[-1] = (run_moves + [command], total, run_speed, run_barrier)
+                    continue
+            runs.append(([command], vector, speed, barrier))
+
+        commands = []
+        for run_moves, (x, y, z), speed, barrier in runs:
+            if len(run_moves) == 1 or max(abs(x), abs(y), abs(z)) < MIN_MOVE:
+                # Nothing to merge, or the moves (nearly) cancel out - too small for a single command, so send as-is
+                commands.extend((command, barrier) for command in run_moves)
+            elif [x, y, z].count(0) == 2 and not any(command.startswith('go ') for command in run_moves):
+                # Along a single axis, so the equivalent simple move (which uses the same speed setting) is clearer
+                name = next(name for name, axes in MOVE_VECTORS.items()
+                            if axes == tuple((axis > 0) - (axis < 0) for axis in (x, y, z)))
+                commands.append(('%s %d' % (name, abs(x + y + z)), barrier))
+            else:
+                commands.append(('go %d %d %d %d' % (x, y, z, speed), barrier))
+        return commands
@@ -0,0 +1,86 @@
+import threading
+import time
+
+
+# Sent in place of a setpoint which hasn't been updated within hold_time, i.e. hover in place
+NEUTRAL_RC = (0, 0, 0, 0)
+
+
+class RcStream:
+    """ Streams 'rc' commands to any number of Tellos at a fixed rate, from a register of the latest setpoint for each.
+
+        The Tello never replies to 'rc', and each one is superseded by the next, so they are sent fire-and-forget -
+         never queued, logged or waited for.  Callers just update the setpoint (e.g. from a joystick, or a control
+         loop), as often or as rarely as they like, and one thread sends the latest setpoint to every Tello on each
+         tick.  If a setpoint isn't updated within hold_time (e.g. the control loop has stalled), the Tello is sent
+         NEUTRAL_RC instead, so it hovers rather than carrying on at its last setpoint.
+    """
+
+    def __init__(self, send, rate=20.0, hold_time=0.5):
+        """ :param send: Function send(ip, command) which sends a datagram to a Tello, e.g. CommsManager._send_raw.
+            :param rate: Number of times per second the setpoint is sent to each Tello.
+            :param hold_time: Seconds for which each setpoint is repeated, before falling back to NEUTRAL_RC.
+        """
+        self.send = send
+        self.interval = 1.0 / rate
+        self.hold_time = hold_time
+        # Latest setpoint for each Tello, as {ip: (setpoint, time.monotonic() of update)}.  Each tick is sent whilst
+        #  holding the lock, so nothing more is sent to a Tello once it's released (e.g. just before 'stop')
+        self.setpoints = {}
+        self.lock = threading.Lock()
+        self.terminate = threading.Event()
+        self.thread = threading.Thread(target=self._sender_thread)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def set(self, ips, setpoint):
+        """ Update the setpoint for each of the Tellos, to be sent from the next tick onwards.
+
+            :param ips: List of IP addresses of the Tellos, as strings.
+            :param setpoint: Tuple (left_right, forward_back, up_down, yaw), each in range -100 to +100.
+        """
+        updated = time.monotonic()
+        with self.lock:
+            for ip in ips:
+                self.setpoints[ip] = (setpoint, updated)
+
+    def release(self, ips):
+        """ Stop streaming to each of the Tellos, sending NEUTRAL_RC one last time - e.g. before queuing other moves.
+
+            :param ips: List of IP addresses of the Tellos, as strings.
+        """
+        with self.lock:
+            for ip in ips:
+                if self.setpoints.pop(ip, None) is not None:
+                    self.send(ip, _rc_command(NEUTRAL_RC))
+
+    def close(self):
+        """ Stop the sender thread, sending NEUTRAL_RC to every Tello still being streamed to. """
+        self.terminate.set()
+        self.thread.join()
+        self.release(list(self.setpoints))
+
+    #
+    # THREADS
+    #
+
+    def _sender_thread(self):
+        """ On each tick, send the latest setpoint (or NEUTRAL_RC, if it's older than hold_time) to every Tello. """
+        next_tick = time.monotonic()
+        while not self.terminate.wait(max(0.0, next_tick - time.monotonic())):
+            now = time.monotonic()
+            with self.lock:
+                for ip, (setpoint, updated) in self.setpoints.items():
+                    self.send(ip, _rc_command(setpoint if now - updated <= self.hold_time else NEUTRAL_RC))
+            # Keep to a fixed rate - but if a tick is missed altogether, carry on from now rather than catching up
+            next_tick += self.interval
+            if next_tick < now:
+                next_tick = now + self.interval
+
+
+#
+# FUNCTION DEFINITIONS
+#
+
+def _rc_command(setpoint):
+    return 'rc %d %d %d %d' % setpoint
@@ -0,0 +1,301 @@
+#
+# Memory-mapped recording of every status message received from the Tellos, for post-flight analysis and replay.
+#
+# Enable recording via FlyTello(my_tellos, get_status=True, telemetry_record='flight.tlmrec'), then e.g.:
+#       python telemetry_recorder.py info flight.tlmrec
+#       python telemetry_recorder.py dump flight.tlmrec --start 100 --stop 120
+#       python telemetry_recorder.py replay flight.tlmrec --speed 10
+#
+
+import argparse
+import bisect
+import mmap
+import queue
+import socket
+import struct
+import threading
+import time
+from tello_status import parse_status
+
+
+# File header: magic, format version, frame size.  Then fixed-size frames, each holding one status message: receive
+#  time, IPv4 address of the Tello, message length, then the raw message (zero padded).
+FILE_MAGIC = b'TELLOREC'
+FILE_VERSION = 1
+_HEADER = struct.Struct('<8sHH4x')
+_FRAME_HEADER = struct.Struct('<d4sH')
+FRAME_SIZE = 256
+MAX_MESSAGE_SIZE = FRAME_SIZE - _FRAME_HEADER.size
+
+
+class TelemetryFrame:
+    """ A single recorded status message. """
+
+    __slots__ = ('timestamp', 'ip', 'data')
+
+    def __init__(self, timestamp, ip, data):
+        """ :param timestamp: Time the message was received, as returned by time.time().
+            :param ip: IP address of the Tello which sent it, as a string.
+            :param data: The raw status message, as bytes.
+        """
+        self.timestamp = timestamp
+        self.ip = ip
+        self.data = data
+
+    def __repr__(self):
+        return 'TelemetryFrame(%.3f, %s, %r)' % (self.timestamp, self.ip, self.data)
+
+    def status(self):
+        """ Returns the message parsed into a TelloStatus. """
+        return parse_status(self.data, self.timestamp)
+
+
+class TelemetryRecorder:
+    """ Appends every status message to a memory-mapped file, as fixed-size binary frames, on a background thread.
+
+        record() only copies the message onto a queue, so the status listener is never held up by disk writes.  The
+         file is grown (and re-mapped) in chunks, then trimmed to the frames actually written when closed.
+    """
+
+    def __init__(self, record_file, chunk_frames=4096):
+        """ :param record_file: Path of the recording to create - overwritten if it already exists.
+            :param chunk_frames: Number of frames by which the file is grown each time it fills up.
+        """
+        self.record_file = record_file
+        self.chunk_frames = chunk_frames
+        self.frame_count = 0
+        self.record_queue = queue.SimpleQueue()
+        self.file = open(record_file, 'w+b')
+        self.file.write(_HEADER.pack(FILE_MAGIC, FILE_VERSION, FRAME_SIZE))
+        self.capacity = 0
+        self.map = None
+        self._grow()
+        self.writer_thread = threading.Thread(target=self._writer_thread)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def record(self, ip, data, timestamp=None):
+        """ Queue a status message to be written - safe to call from any thread.
+
+            :param ip: IP address of the Tello which sent the message, as a string.
+            :param data: The raw message - bytes, or a bytes-like object such as a memoryview of the receive buffer.
+            :param timestamp: Time the message was received - defaults to now.
+        """
+        self.record_queue.put((time.time() if timestamp is None else timestamp, ip, bytes(data)))
+
+    def close(self):
+        """ Write any queued frames, then trim the file to the frames recorded and close it. """
+        self.record_queue.put(None)
+        self.writer_thread.join()
+        self.map.close()
+        self.file.truncate(_HEADER.size + self.frame_count * FRAME_SIZE)
+        self.file.close()
+        print('[Recorder]Recorded %d status messages to %s' % (self.frame_count, self.record_file))
+
+    #
+    # PRIVATE HELPER METHODS
+    #
+
+    def _grow(self):
+        """ Extend the file by chunk_frames, and map it again at its new size. """
+        if self.map is not None:
+            self.map.close()
+        self.capacity += self.chunk_frames
+        self.file.truncate(_HEADER.size + self.capacity * FRAME_SIZE)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+    def _writer_thread(self):
+        """ Write each queued message into the next frame of the file - runs in its own thread until closed. """
+        while True:
+            frame = self.record_queue.get()
+            if frame is None:
+                self.map.flush()
+                return
+            timestamp, ip, data = frame
+            if self.frame_count == self.capacity:
+                self._grow()
+            offset = _HEADER.size + self.frame_count * FRAME_SIZE
+            data = data[:MAX_MESSAGE_SIZE]
+            _FRAME_HEADER.pack_into(self.map, offset, timestamp, socket.inet_aton(ip), len(data))
+            self.map[offset + _FRAME_HEADER.size:offset + _FRAME_HEADER.size + len(data)] = data
+            self.frame_count += 1
+
+
+class TelemetryRecording:
+    """ Read-only access to a recording made by TelemetryRecorder, memory-mapped so that multi-hour recordings can be
+        indexed, sliced and streamed without loading them into memory.
+
+        Behaves as a sequence of TelemetryFrame objects, e.g. recording[0], recording[-100:], len(recording).
+    """
+
+    def __init__(self, record_file):
+        """ :param record_file: Path of the recording to open. """
+        self.record_file = record_file
+        self.file = open(record_file, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, frame_size = _HEADER.unpack_from(self.map, 0)
+        if magic != FILE_MAGIC or version != FILE_VERSION or frame_size != FRAME_SIZE:
+            self.close()
+            raise RuntimeError('%s is not a supported Tello telemetry recording' % record_file)
+        self.frame_count = self._count_frames()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.frame_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._read_frame(i) for i in range(*index.indices(self.frame_count))]
+        if index < 0:
+            index += self.frame_count
+        if not 0 <= index < self.frame_count:
+            raise IndexError('Frame %d not in recording of %d frames' % (index, self.frame_count))
+        return self._read_frame(index)
+
+    def __iter__(self):
+        return self.frames()
+
+    def close(self):
+        """ Close the recording. """
+        self.map.close()
+        self.file.close()
+
+    def frames(self, start=0, stop=None, ip=None):
+        """ Stream frames from the recording, one at a time.
+
+            :param start: Index of the first frame.
+            :param stop: Index after the last frame, or None for the end of the recording.
+            :param ip: Only return frames from this Tello, or None for all Tellos.
+        """
+        for index in range(start, self.frame_count if stop is None else min(stop, self.frame_count)):
+            frame = self._read_frame(index)
+            if ip is None or frame.ip == ip:
+                yield frame
+
+    def time_range(self):
+        """ Returns the (first, last) timestamps in the recording, or (None, None) if it is empty. """
+        if self.frame_count == 0:
+            return None, None
+        return self._timestamp(0), self._timestamp(self.frame_count - 1)
+
+    def index_at(self, timestamp):
+        """ Returns the index of the first frame received at or after timestamp, by binary search. """
+        return bisect.bisect_left(_TimestampView(self), timestamp)
+
+    def between(self, start_time, end_time, ip=None):
+        """ Stream the frames received between two timestamps, e.g. the first minute:
+                recording.between(recording.time_range()[0], recording.time_range()[0] + 60)
+        """
+        return self.frames(self.index_at(start_time), self.index_at(end_time), ip)
+
+    def replay(self, speed=1.0, start=0, stop=None, target_ip='127.0.0.1', port=8890, ip_map=None):
+        """ Send the recorded status messages to a CommsManager's status port, at the recorded pace.
+
+            Each message is sent from the IP address of the Tello that recorded it (or ip_map[ip]), so that CommsManager
+             attributes it to the right Tello.  Binding to those addresses only works if they are local, e.g. loopback
+             addresses as used by TelloSimulator, so ip_map can map real Tello addresses onto loopback addresses.
+
+            :param speed: Replay speed, e.g. 1.0 for real time, 10.0 for ten times faster, or None for no delay at all.
+            :param start: Index of the first frame to replay.
+            :param stop: Index after the last frame to replay, or None for the end of the recording.
+            :param target_ip: Address of the CommsManager's status socket.
+            :param port: Port of the CommsManager's status socket.
+            :param ip_map: Optional dict of {recorded_ip: source_ip}.
+            :return: Number of messages sent.
+        """
+        ip_map = ip_map or {}
+        sockets = {}
+        sent = 0
+        first_time = None
+        replay_start = time.perf_counter()
+        try:
+            for frame in self.frames(start, stop):
+                source_ip = ip_map.get(frame.ip, frame.ip)
+                if source_ip not in sockets:
+                    sockets[source_ip] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                    sockets[source_ip].bind((source_ip, 0))
+                if first_time is None:
+                    first_time = frame.timestamp
+                if speed is not None:
+                    delay = replay_start + (frame.timestamp - first_time) / speed - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                sockets[source_ip].sendto(frame.data, (target_ip, port))
+                sent += 1
+        finally:
+            for replay_socket in sockets.values():
+                replay_socket.close()
+        return sent
+
+    #
+    # PRIVATE HELPER METHODS
+    #
+
+    def _count_frames(self):
+        """ Returns the number of frames written - frames beyond those were preallocated but never written, which is
+            only the case if the recorder wasn't closed, and are found by binary search for the first empty frame.
+        """
+        low, high = 0, (len(self.map) - _HEADER.size) // FRAME_SIZE
+        while low < high:
+            mid = (low + high) // 2
+            if self._timestamp(mid) == 0:
+                high = mid
+            else:
+                low = mid + 1
+        return low
+
+    def _timestamp(self, index):
+        return _FRAME_HEADER.unpack_from(self.map, _HEADER.size + index * FRAME_SIZE)[0]
+
+    def _read_frame(self, index):
+        offset = _HEADER.size + index * FRAME_SIZE
+        timestamp, ip, length = _FRAME_HEADER.unpack_from(self.map, offset)
+        data = self.map[offset + _FRAME_HEADER.size:offset + _FRAME_HEADER.size + length]
+        return TelemetryFrame(timestamp, socket.inet_ntoa(ip), data)
+
+
+class _TimestampView:
+    """ Sequence of just the timestamps of a TelemetryRecording, for bisect. """
+
+    def __init__(self, recording):
+        self.recording = recording
+
+    def __len__(self):
+        return len(self.recording)
+
+    def __getitem__(self, index):
+        return self.recording._timestamp(index)
+
+
+#
+# MAIN SCRIPT
+#
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect or replay a Tello telemetry recording.')
+    parser.add_argument('action', choices=['info', 'dump', 'replay'], help='What to do with the recording')
+    parser.add_argument('record_file', help='The recording, as made by TelemetryRecorder')
+    parser.add_argument('--start', type=int, default=0, help='Index of the first frame')
+    parser.add_argument('--stop', type=int, default=None, help='Index after the last frame')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed, e.g. 10 for ten times faster')
+    parser.add_argument('--target', default='127.0.0.1', help='Address to replay status messages to')
+    args = parser.parse_args()
+
+    with TelemetryRecording(args.record_file) as recording:
+        if args.action == 'info':
+            first, last = recording.time_range()
+            tellos = sorted({frame.ip for frame in recording})
+            print('[Recording]%d frames from %d Tello(s): %s' % (len(recording), len(tellos), ', '.join(tellos)))
+            if first is not None:
+                print('[Recording]%s to %s (%.1f secs)' % (time.ctime(first), time.ctime(last), last - first))
+        elif args.action == 'dump':
+            for recorded in recording.frames(args.start, args.stop):
+                print('%.3f %s %s' % (recorded.timestamp, recorded.ip, recorded.status()))
+        else:
+            count = recording.replay(speed=args.speed, start=args.start, stop=args.stop, target_ip=args.target)
+            print('[Recording]Replayed %d status messages' % count)
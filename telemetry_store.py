@@ -0,0 +1,123 @@
+import threading
+import time
+import warnings
+from tello_status import STATUS_FIELDS
+
+# NumPy is only needed if telemetry history is enabled, so is imported when a TelemetryStore is first created
+numpy = None
+
+
+# Status fields recorded in the store - every numeric field, i.e. all except the mpry tuple
+TELEMETRY_FIELDS = tuple(name for name, field_type in STATUS_FIELDS if field_type is not tuple)
+
+
+class TelemetryStore:
+    """ Recent status messages from every Tello, held in one preallocated NumPy array of tellos x frames x fields.
+
+        Each Tello has its own ring buffer of the last `history` frames, so recording a status message is just a copy
+         into the next slot - nothing is allocated as messages arrive.  Queries (history windows, rolling means, fleet
+         min / max) are then computed across all Tellos in a single vectorised call, rather than looping over dicts.
+        Missing values, and slots not yet filled, are NaN.
+    """
+
+    def __init__(self, tellos, history=600):
+        """ :param tellos: Iterable of Tello objects, in the order of the store's rows - usually sorted by num.
+            :param history: Number of frames kept for each Tello, e.g. 600 frames is ~60secs at 10 messages per sec.
+        """
+        global numpy
+        if numpy is None:
+            try:
+                import numpy
+            except ImportError:
+                raise RuntimeError('Telemetry history requires numpy - install it with: pip install numpy')
+
+        tellos = list(tellos)
+        self.history = history
+        self.fields = TELEMETRY_FIELDS
+        self.nums = numpy.array([tello.num for tello in tellos])
+        self.rows = {tello.ip: row for row, tello in enumerate(tellos)}
+        self.frames = numpy.full((len(tellos), history, len(self.fields)), numpy.nan)
+        self.timestamps = numpy.full((len(tellos), history), numpy.nan)
+        # Total number of frames ever recorded for each Tello - the next slot to write is count % history
+        self.count = numpy.zeros(len(tellos), dtype=numpy.int64)
+        self.lock = threading.Lock()
+
+    def append(self, ip, status):
+        """ Record a status message in the ring buffer of the Tello it came from.
+
+            :param ip: IP address of the Tello which sent the status message, as a string.
+            :param status: The TelloStatus parsed from the message.
+        """
+        row = self.rows.get(ip)
+        if row is None:
+            return
+        frame = [getattr(status, field) for field in self.fields]
+        with self.lock:
+            slot = self.count[row] % self.history
+            # None (a missing field) is converted to NaN by the float array
+            self.frames[row, slot] = numpy.array(frame, dtype=float)
+            self.timestamps[row, slot] = status.timestamp
+            self.count[row] += 1
+
+    def field_index(self, field):
+        """ Returns the index of the named status field, in the last dimension of the frames array. """
+        try:
+            return self.fields.index(field)
+        except ValueError:
+            raise RuntimeError('Unknown telemetry field: %s - must be one of %s' % (field, ', '.join(self.fields)))
+
+    def window(self, field=None, secs=None):
+        """ Returns a snapshot of the history of every Tello, in time order (oldest first).
+
+            :param field: Name of a single status field, e.g. 'h', or None for all fields.
+            :param secs: Only include frames received in the last secs seconds, or None for the whole history.
+            :return: Tuple (timestamps, values) - timestamps is tellos x frames, values is tellos x frames (for a single
+                      field) or tellos x frames x fields.  Slots outside the window, or not yet filled, are NaN.
+        """
+        with self.lock:
+            # Index of each slot in time order, for every Tello at once - the oldest slot is the next to be written
+            order = (self.count[:, None] + numpy.arange(self.history)[None, :]) % self.history
+            timestamps = numpy.take_along_axis(self.timestamps, order, axis=1)
+            if field is None:
+                values = numpy.take_along_axis(self.frames, order[:, :, None], axis=1)
+            else:
+                values = numpy.take_along_axis(self.frames[:, :, self.field_index(field)], order, axis=1)
+        if secs is not None:
+            with numpy.errstate(invalid='ignore'):
+                outside = ~(timestamps >= time.time() - secs)
+            timestamps[outside] = numpy.nan
+            values[outside] = numpy.nan
+        return timestamps, values
+
+    def latest(self, field):
+        """ Returns the latest value of the named field for every Tello, as an array (NaN if none received yet). """
+        with self.lock:
+            values = self.frames[numpy.arange(len(self.count)), (self.count - 1) % self.history,
+                                 self.field_index(field)]
+            return numpy.where(self.count > 0, values, numpy.nan)
+
+    def mean(self, field, secs=1.0):
+        """ Returns the mean of the named field over the last secs seconds, for every Tello, as an array. """
+        _, values = self.window(field, secs)
+        with warnings.catch_warnings():
+            # A Tello with no frames in the window has a mean of NaN, which is expected rather than worth a warning
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return numpy.nanmean(values, axis=1)
+
+    def extreme(self, field, secs=None, highest=False):
+        """ Returns the lowest (or highest) value of the named field across all Tellos, and the Tello's num.
+
+            :param field: Name of the status field, e.g. 'bat'.
+            :param secs: Search the last secs seconds of history, or None to use just the latest frame of each Tello.
+            :param highest: True for the highest value, False for the lowest.
+            :return: Tuple (value, num), or (None, None) if no status messages have been received.
+        """
+        if secs is None:
+            values = self.latest(field)[:, None]
+        else:
+            _, values = self.window(field, secs)
+        if numpy.all(numpy.isnan(values)):
+            return None, None
+        flat_index = numpy.nanargmax(values) if highest else numpy.nanargmin(values)
+        row = flat_index // values.shape[1]
+        return values.flat[flat_index].item(), self.nums[row].item()
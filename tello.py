@@ -1,4 +1,44 @@
+import collections
+import json
+import queue
+import re
+import threading
 import time
+from command_timing import DEFAULT_SPEED, LatencyEstimator, command_timeout, estimate_duration
+from tello_status import TelloStatus
+
+
+# Set commands which change the Tello's WiFi settings - not safe to send twice, as the Tello may already have switched
+NON_IDEMPOTENT_SET = ('ap', 'wifi')
+
+# Expected shape of the response to each Read command, and of any Read value - used to recognise a late reply to an
+#  earlier command, rather than attributing it to the current one.  Any command may also respond with an error.
+READ_RESPONSES = {'speed?': r'-?\d+(\.\d+)?$', 'battery?': r'\d+$', 'time?': r'\d+s$', 'height?': r'-?\d+dm$',
+                  'temp?': r'-?\d+~-?\d+C$', 'attitude?': r'pitch:', 'baro?': r'-?\d+(\.\d+)?$',
+                  'acceleration?': r'agx:', 'tof?': r'\d+mm$', 'wifi?': r'\d+$', 'sdk?': r'\d+$', 'sn?': r'\w+$'}
+_READ_RESPONSES = {command: re.compile(pattern) for command, pattern in READ_RESPONSES.items()}
+_READ_VALUE = re.compile(r'-?\d+(\.\d+)?(s|dm|mm|C)?$|-?\d+~-?\d+C$|pitch:|agx:')
+
+
+def _read_fields(response, field_type):
+    """ Parse a response of the form 'pitch:0;roll:-1;yaw:90;' into a dict, e.g. {'pitch': 0, 'roll': -1, ...}. """
+    return {key: field_type(value) for key, value in (field.split(':') for field in response.split(';') if field)}
+
+
+# How to convert the response to each Read command into a value, e.g. '87' -> 87 for 'battery?'.  Distances are in cm,
+#  as elsewhere in FlyTello (the Tello itself reports height in dm, and tof in mm).  Raises ValueError if malformed.
+READ_VALUES = {'speed?': float,
+               'battery?': int,
+               'time?': lambda response: int(response[:-1]),
+               'height?': lambda response: int(response[:-2]) * 10,
+               'temp?': lambda response: tuple(int(temp) for temp in response[:-1].split('~')),
+               'attitude?': lambda response: _read_fields(response, int),
+               'baro?': float,
+               'acceleration?': lambda response: _read_fields(response, float),
+               'tof?': lambda response: int(response[:-2]) / 10,
+               'wifi?': int,
+               'sdk?': int,
+               'sn?': str}
 
 
 class Tello:
@@ -8,22 +48,53 @@ class Tello:
     # CLASS INIT
     #
 
-    def __init__(self, ip):
-        """ Keep track of the IP, SN and Num of each Tello, plus its command_queue and log """
+    def __init__(self, ip, log_size=10000, log_file=None):
+        """ Keep track of the IP, SN and Num of each Tello, plus its command_queue and log
+
+            :param ip: IP address of the Tello, as a string e.g. '192.168.1.51'
+            :param log_size: Max number of log entries kept in memory, or None for no limit.
+            :param log_file: Path of a file to which older log entries are appended, or None to discard them.
+        """
         self.ip = ip
         self.sn = None
         self.num = 0
         self.max_cmd_id = 0
-        self.command_queue = []
-        self.log = []
+        # Thread-safe FIFO, on which the command_handler blocks until a command (or None, to stop) is available
+        self.command_queue = queue.SimpleQueue()
+        # Optional callable, run after each put to command_queue - lets non-threaded command handlers be woken
+        self.on_command_queued = None
+        self.log = TelloLog(log_size, log_file)
         self.flight_complete = False
-        self.status = {}
+        # Latest status message, as an immutable TelloStatus - replaced (never modified) as each message arrives.
+        self.status = TelloStatus()
+        # Count of commands queued but not yet fully processed, i.e. sent and response received (or timed out).
+        self.pending_commands = 0
+        # Shared by this Tello and all of its log entries - notified whenever the log, a response or pending changes.
+        self.condition = threading.Condition()
+        # Estimated time (time.monotonic) at which every queued command will be complete, and the speed setting used
+        #  to estimate the duration of moves.  Used to reject scheduled commands which the Tello couldn't start in time.
+        self.expected_idle = 0.0
+        self.speed = DEFAULT_SPEED
+        # Learned response latency of this Tello, which sets the margin in each command's response timeout
+        self.latency = LatencyEstimator()
+        # Replies which may still arrive late, for commands retransmitted or timed out - and until when (monotonic)
+        self.stale_replies = 0
+        self.stale_until = 0.0
+        # An early 'ok' set aside as probably late, as (log_entry, response) - used if no later reply arrives after all
+        self.held_reply = None
+        # Number of times the command_queue has been flushed (e.g. by priority_command) - a command queued before the
+        #  latest flush must never be sent, even if the command_handler had already taken it from the queue
+        self.flushes = 0
+        # Time (time.monotonic) at which the Tello last became idle, i.e. pending_commands fell to zero, and an
+        #  optional callable run each time it does - lets CommsManager wait on many Tellos at once.
+        self.idle_since = time.monotonic()
+        self.on_idle = None
 
     #
     # COMMAND_QUEUE AND LOG MANAGEMENT
     #
 
-    def add_to_command_queue(self, command, command_type, on_error):
+    def add_to_command_queue(self, command, command_type, on_error, fan_out=None, release_time=None, future=None):
         """ Queues commands, which will be sent via the command_handler thread as soon as the Tello is ready.
 
             Each command in the queue is given a cmd_id, an increasing index, which is then carried over to the log -
@@ -32,27 +103,159 @@ class Tello:
             :param command: The actual command from Tello SDK, e.g. 'battery?', 'forward 50', etc...
             :param command_type: Either 'Control', 'Set' or 'Read' - corresponding to the Tello SDK documentation.
             :param on_error: An alternative Tello SDK string to be sent if command returns an error.
+            :param fan_out: Optionally, the FanOut through which this command is released together with other Tellos.
+            :param release_time: Optionally, the time (time.monotonic) at which the command is to be sent.
+            :param future: Optionally, a concurrent.futures.Future to be resolved with the response - see TelloCommand.
             :return: The cmd_id for this new entry in the queue, to allow calling functions to track the response.
         """
         if not self.flight_complete:
-            self.max_cmd_id += 1
-            self.command_queue.append(TelloCommand(self.max_cmd_id, command, command_type, on_error))
-            return self.max_cmd_id
+            with self.condition:
+                self.max_cmd_id += 1
+                self.pending_commands += 1
+                expected_duration = self._update_expected_idle(command, command_type, release_time)
+                log_entry = TelloCommand(self.max_cmd_id, command, command_type, on_error, self.condition, fan_out,
+                                         release_time, expected_duration, future)
+                log_entry.flushes = self.flushes
+                self.command_queue.put(log_entry)
+                if self.on_command_queued is not None:
+                    self.on_command_queued()
+                return self.max_cmd_id
         else:
             return -1
 
-    def add_to_log(self, cmd_id, command, command_type, on_error):
+    def close_command_queue(self):
+        """ Wake the command_handler with a None entry, telling it to stop once any earlier commands are sent. """
+        self.command_queue.put(None)
+        if self.on_command_queued is not None:
+            self.on_command_queued()
+
+    def flush_command_queue(self):
+        """ Discard every command still waiting in the command_queue, i.e. not yet sent - e.g. ahead of 'emergency'.
+
+            Each command discarded is still added to the log, failed with an empty response (see discard_command), so
+             anything waiting for it returns straight away.  Any command already taken from the queue by the
+             command_handler, but not yet sent, is then never sent either - see send_unless_flushed.
+
+            :return: The number of commands discarded.
+        """
+        with self.condition:
+            self.flushes += 1
+        flushed = 0
+        closed = False
+        while True:
+            try:
+                command = self.command_queue.get_nowait()
+            except queue.Empty:
+                break
+            if command is None:
+                closed = True
+            else:
+                flushed += 1
+                if command.future is not None:
+                    command.future.cancel()
+                with self.condition:
+                    self.log.append(command)
+                    self.discard_command(command)
+        # Keep the command_queue closed, if it was
+        if closed:
+            self.close_command_queue()
+        if flushed:
+            self.command_done(flushed)
+        return flushed
+
+    def discard_command(self, log_entry):
+        """ Give a command which is never to be sent a failed, empty response - waking any threads waiting for it.
+
+            :param log_entry: The TelloCommand, already in the log.
+            :return: True if discarded, or False if it already had a response (e.g. abandoned by priority_command).
+        """
+        with self.condition:
+            if log_entry.response is not None:
+                return False
+            log_entry.attempts = 0
+            log_entry.success = False
+            log_entry.set_response('')
+            return True
+
+    def command_done(self, count=1):
+        """ Called by the command_handler once a command has been sent and its response received (or timed out).
+
+            Any on_error alternative command must already have been queued, so the Tello never appears idle between
+             the original command and its alternative.
+
+            :param count: Number of commands done - more than one if commands were discarded from the queue.
+        """
+        with self.condition:
+            self.pending_commands -= count
+            idle = self.pending_commands == 0
+            if idle:
+                self.idle_since = self.expected_idle = time.monotonic()
+            self.condition.notify_all()
+        if idle and self.on_idle is not None:
+            self.on_idle()
+
+    def _update_expected_idle(self, command, command_type, release_time):
+        """ Extend expected_idle by the estimated duration of a newly queued command - must hold condition.
+
+            :return: The estimated duration of the command, in seconds.
+        """
+        start = max(time.monotonic(), self.expected_idle, release_time or 0.0)
+        duration = estimate_duration(command, command_type, self.speed)
+        self.expected_idle = start + duration
+        if command_type == 'Set' and command.startswith('speed '):
+            self.speed = int(command.split(' ')[1])
+        return duration
+
+    def response_timeout(self, log_entry):
+        """ Seconds to wait for the response to a command - its expected duration, plus this Tello's latency margin.
+
+            :param log_entry: The TelloCommand about to be sent.
+        """
+        return command_timeout(log_entry.expected_duration, self.latency.margin, log_entry.command_type)
+
+    def record_latency(self, log_entry):
+        """ Learn from the latency of a successful response - only for Read and Set commands, which aren't slowed by
+            the Tello having to move first.
+
+            :param log_entry: The TelloCommand whose response has just been received.
+        """
+        # As in Karn's algorithm, retransmitted commands are skipped - the response may be to either transmission
+        if log_entry.command_type in ('Read', 'Set') and log_entry.sent_time is not None and log_entry.attempts == 1:
+            self.latency.update(log_entry.response_time - log_entry.sent_time)
+
+    def expect_stale(self, window):
+        """ Note that a reply to a command already dealt with (retransmitted or timed out) may yet arrive.
+
+            :param window: Max seconds from now in which the late reply might arrive.
+        """
+        with self.condition:
+            self.stale_replies += 1
+            self.stale_until = max(self.stale_until, time.monotonic() + window)
+
+    def take_stale(self):
+        """ Count a reply off against those which may still arrive late.
+
+            :return: True if a late reply was expected, i.e. an ambiguous reply is more likely late than current.
+        """
+        with self.condition:
+            if self.stale_replies == 0 or time.monotonic() > self.stale_until:
+                self.stale_replies = 0
+                return False
+            self.stale_replies -= 1
+            return True
+
+    def add_to_log(self, log_entry):
         """ Logs commands; usually having just been taken out of the command_queue.
 
-            :param cmd_id: The cmd_id that was previously assigned in the command_queue.
-            :param command: The actual command from Tello SDK, e.g. 'battery?', 'forward 50', etc...
-            :param command_type: Either 'Control', 'Set' or 'Read' - corresponding to the Tello SDK documentation.
-            :param on_error: An alternative Tello SDK string to be sent if command returns an error, or None.
-            :return: The new log entry (as a TelloCommand instance)
+            The same TelloCommand instance is used in both the command_queue and the log, so isn't copied here.
+
+            :param log_entry: The TelloCommand instance, as taken out of the command_queue.
+            :return: The new log entry (the same TelloCommand instance)
         """
-        new_log_entry = TelloCommand(cmd_id, command, command_type, on_error)
-        self.log.append(new_log_entry)
-        return new_log_entry
+        with self.condition:
+            self.log.append(log_entry)
+            self.condition.notify_all()
+        return log_entry
 
     def log_entry(self, cmd_id=None, timeout=10):
         """ Return the log entry for specified cmd_id, or latest if cmd_id is None.
@@ -67,13 +270,45 @@ class Tello:
     # PENDING RESPONSE
     #
 
-    def wait_until_idle(self):
-        """ Blocking method, will only return once command_queue is empty and the last response is received. """
-        # TODO: Add timeout to this method?
-        while self.command_queue:
-            time.sleep(0.05)
-        while self.log[-1].response is None:
-            time.sleep(0.05)
+    def send_unless_flushed(self, log_entry, send):
+        """ Call send() to send log_entry - unless it has already been answered (e.g. abandoned by priority_command),
+             or the command_queue has been flushed since it was queued.
+
+            The check and send are made whilst holding the condition, so a flush can't come in between - i.e. once
+             flush_command_queue has returned, nothing queued before it can be sent.
+
+            :param log_entry: The TelloCommand about to be sent.
+            :param send: Function with no arguments, which sends the command.
+            :return: True if sent, otherwise False - in which case it should be given a response, see discard_command.
+        """
+        with self.condition:
+            if log_entry.response is not None or log_entry.flushes != self.flushes:
+                return False
+            send()
+            return True
+
+    def wait_until_idle(self, timeout=None):
+        """ Blocking method, will only return once command_queue is empty and the last response is received.
+
+            :param timeout: Max seconds to wait, or None to wait for as long as it takes.
+            :return: True if the Tello is idle, or False if timeout expired first.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.pending_commands == 0, timeout)
+
+    def unanswered_log_entry(self):
+        """ Returns the log entry which has been (or is about to be) sent and is awaiting its response, or None.
+
+            Commands are sent one at a time, so there is at most one - usually the latest entry, but possibly followed
+             by commands which were discarded without being sent (see flush_command_queue).
+        """
+        with self.condition:
+            for log_entry in reversed(self.log):
+                if log_entry.response is None:
+                    return log_entry
+                if log_entry.attempts:
+                    return None
+            return None
 
     def log_wait_response(self, cmd_id=None, timeout=10):
         """ Blocking method, will return log entry once it's been sent and response is received.
@@ -83,9 +318,7 @@ class Tello:
             :return: Returns the corresponding log entry, which will be a TelloCommand instance.
         """
         log_entry = self._get_log_entry(cmd_id, timeout)
-        while log_entry.response is None:
-            # Sleep briefly whilst waiting for response, to prevent excessive CPU usage
-            time.sleep(0.01)
+        log_entry.wait_response()
         return log_entry
 
     #
@@ -103,28 +336,111 @@ class Tello:
             :return: Returns the corresponding log entry, which will be a TelloCommand object.
         """
         if cmd_id is None:
-            return self.log[-1]
+            return self.log.latest()
         else:
-            timeout_start = time.time()
-            while time.time() - timeout_start < timeout:
-                for log in self.log:
-                    if log.cmd_id == cmd_id:
-                        return log
-                # Sleep briefly at the end of each loop, to prevent excessive CPU usage
-                time.sleep(0.01)
+            # Woken each time a new entry is added to the log, rather than polling
+            with self.condition:
+                if cmd_id <= self.log.max_removed_cmd_id:
+                    raise RuntimeError('Tello log entry no longer held in memory!!')
+                if self.condition.wait_for(lambda: self.log.get(cmd_id) is not None, timeout):
+                    return self.log.get(cmd_id)
             raise RuntimeError('Tello log entry not found!!')
 
 
+class TelloLog:
+    """ The log of commands sent to a Tello, keyed by cmd_id, holding only the most recent entries in memory.
+
+        Once more than max_entries are held, the oldest are removed and (if a log_file was given) appended to that file
+         as JSON Lines.  This keeps memory use bounded on long flights, e.g. with high-rate rc control.
+        Entries should be added via Tello.add_to_log, which holds the Tello's condition whilst appending.
+    """
+
+    def __init__(self, max_entries=10000, log_file=None):
+        """ :param max_entries: Max number of entries kept in memory, or None for no limit.
+            :param log_file: Path of a file to which older entries are appended, or None to discard them.
+        """
+        self.max_entries = max_entries
+        self.log_file = log_file
+        self.max_removed_cmd_id = 0
+        self._entries = collections.OrderedDict()
+        self._file = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        """ Iterate over a snapshot of the entries currently held in memory, oldest first. """
+        return iter(list(self._entries.values()))
+
+    def __reversed__(self):
+        """ Iterate over the entries currently held in memory, newest first - whilst holding the Tello's condition. """
+        return reversed(self._entries.values())
+
+    def append(self, log_entry):
+        """ Add a new entry, then remove (and write to log_file) the oldest entries if over max_entries.
+
+            :param log_entry: The TelloCommand instance to add to the log.
+        """
+        self._entries[log_entry.cmd_id] = log_entry
+        if self.max_entries is not None:
+            while len(self._entries) > self.max_entries:
+                _, old_entry = self._entries.popitem(last=False)
+                self.max_removed_cmd_id = old_entry.cmd_id
+                self._write(old_entry)
+
+    def get(self, cmd_id):
+        """ Returns the entry for the specified cmd_id, or None if not in memory. """
+        return self._entries.get(cmd_id)
+
+    def latest(self):
+        """ Returns the most recently added entry, or None if the log is empty. """
+        return next(reversed(self._entries.values()), None)
+
+    def close(self):
+        """ Close the log_file, if it has been opened. """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, log_entry):
+        """ Append an entry to the log_file as a single line of JSON - ignored if there is no log_file. """
+        if self.log_file is None:
+            return
+        if self._file is None:
+            self._file = open(self.log_file, 'a')
+        self._file.write(json.dumps({'cmd_id': log_entry.cmd_id,
+                                     'command': log_entry.command,
+                                     'command_type': log_entry.command_type,
+                                     'on_error': log_entry.on_error,
+                                     'response': log_entry.response,
+                                     'success': log_entry.success}) + '\n')
+
+
 class TelloCommand:
-    """ Simple class holding data associated with individual commands - used for both command_queue and log. """
+    """ Simple class holding data associated with individual commands - used for both command_queue and log.
+
+        Uses __slots__ to keep each instance compact, as a long flight can log a very large number of commands.
+    """
 
-    def __init__(self, cmd_id, command, command_type, on_error):
+    __slots__ = ('cmd_id', 'command', 'command_type', 'response', 'success', 'on_error', 'condition',
+                 'sent_time', 'response_time', 'fan_out', 'release_time', 'expected_duration', 'attempts', 'future',
+                 'flushes')
+
+    def __init__(self, cmd_id, command, command_type, on_error, condition=None, fan_out=None, release_time=None,
+                 expected_duration=None, future=None):
         """ Create a new instance, with key fields populated at the start.  response and success are updated later.
 
             :param cmd_id: An integer to uniquely identify this command.
             :param command: The actual command from Tello SDK, e.g. 'battery?', 'forward 50', etc...
             :param command_type: Either 'Control', 'Set' or 'Read' - corresponding to the Tello SDK documentation.
             :param on_error: An alternative Tello SDK string to be sent if command returns an error, or None.
+            :param condition: The owning Tello's threading.Condition, used to signal when the response arrives.
+            :param fan_out: The FanOut this command belongs to, if it is to be released together with other Tellos.
+            :param release_time: Time (time.monotonic) at which the command is to be sent, or None to send when ready.
+            :param expected_duration: Estimated seconds the command takes, or None to estimate it here.
+            :param future: Optionally, a concurrent.futures.Future, resolved with the value of the response once it
+                            is received - or failed with RuntimeError if the command fails or times out, or cancelled
+                            if the command is discarded from the queue.
         """
         self.cmd_id = cmd_id
         self.command = command
@@ -132,3 +448,236 @@ class TelloCommand:
         self.response = None
         self.success = None
         self.on_error = on_error
+        self.condition = condition if condition is not None else threading.Condition()
+        # Times (as returned by time.time()) the command was sent, and its response received or timed out
+        self.sent_time = None
+        self.response_time = None
+        self.fan_out = fan_out
+        self.release_time = release_time
+        if expected_duration is None:
+            expected_duration = estimate_duration(command, command_type)
+        self.expected_duration = expected_duration
+        # Number of times the command has been sent, including any retransmissions - or 0 if discarded without sending
+        self.attempts = 1
+        self.future = future
+        # The owning Tello's flushes count when this command was queued - see Tello.send_unless_flushed
+        self.flushes = 0
+
+    @property
+    def retryable(self):
+        """ True if the command is safe to send again, if its response is lost - i.e. Read, and most Set, commands. """
+        if self.command_type == 'Read':
+            return True
+        return self.command_type == 'Set' and self.command.split(' ')[0] not in NON_IDEMPOTENT_SET
+
+    def expects(self, response):
+        """ Returns True if the response has the right shape for this command, e.g. a value (not 'ok') for 'battery?'.
+
+            :param response: The decoded response string.
+        """
+        if response.startswith('error'):
+            return True
+        if self.command_type == 'Read':
+            pattern = _READ_RESPONSES.get(self.command)
+            return response != 'ok' and (pattern is None or pattern.match(response) is not None)
+        return _READ_VALUE.match(response) is None
+
+    def set_response(self, response):
+        """ Save the response, and immediately wake any threads waiting for it.
+
+            :param response: The response string received from the Tello, or '' if the command timed out.
+        """
+        response_time = time.time()
+        with self.condition:
+            self.response_time = response_time
+            self.response = response
+            self.condition.notify_all()
+        if self.future is not None and not self.future.done():
+            self._resolve_future()
+
+    def wait_response(self, timeout=None):
+        """ Blocking method, will return once the response has been received - without using CPU whilst waiting.
+
+            :param timeout: Max seconds to wait for the response, or None to wait indefinitely.
+            :return: True if the response has been received, otherwise False if timeout was reached first.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.response is not None, timeout)
+
+    @property
+    def value(self):
+        """ The response converted to a value per READ_VALUES, e.g. 87 for 'battery?' - or the response string itself
+             for other commands.  Raises ValueError if the response is malformed.
+        """
+        parse = READ_VALUES.get(self.command, str)
+        return parse(self.response)
+
+    #
+    # PRIVATE HELPER METHODS
+    #
+
+    def _resolve_future(self):
+        """ Resolve the future with the value of the response, or fail it if the command wasn't successful. """
+        if not self.success:
+            self.future.set_exception(RuntimeError('No valid response to %s: %r' % (self.command, self.response)))
+            return
+        try:
+            self.future.set_result(self.value)
+        except ValueError:
+            self.future.set_exception(RuntimeError('Malformed response to %s: %r' % (self.command, self.response)))
+
+
+class FanOut:
+    """ A command queued to several Tellos at once, which is then released to all of them together - a barrier.
+
+        Each Tello's command_handler arrives at the FanOut once the command reaches the front of its queue.  The last
+         to arrive sends the command to every waiting Tello, back to back.  If some Tellos haven't arrived within
+         timeout (e.g. still busy with an earlier command), those waiting are released anyway, and any late arrivals
+         are sent straight away.
+    """
+
+    def __init__(self, command, size, timeout=1.0):
+        """ :param command: The Tello SDK string being sent to every Tello.
+            :param size: Number of Tellos the command was queued to.
+            :param timeout: Max seconds the first Tello to arrive waits for the others.
+        """
+        self.command = command
+        self.size = size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.waiting = []
+        self.arrived = 0
+        # Set once the first batch has been sent - after which, Tellos arriving late are sent on arrival
+        self.released = threading.Event()
+        # Time (perf_counter) at which each datagram was sent
+        self.send_times = []
+
+    def arrive(self, tello, log_entry):
+        """ Register a Tello as ready, returning the batch of (tello, log_entry) which the caller should now send.
+
+            :return: Every waiting Tello (including this one) if this is the last to arrive, or only this Tello if the
+                      command has already been released - otherwise an empty list, and the caller should wait.
+        """
+        with self.lock:
+            self.arrived += 1
+            self.waiting.append((tello, log_entry))
+            if self.arrived >= self.size or self.released.is_set():
+                return self._take_waiting()
+            return []
+
+    def flush(self):
+        """ Returns (and removes) the batch of Tellos still waiting - used once timeout has expired. """
+        with self.lock:
+            return self._take_waiting()
+
+    def _take_waiting(self):
+        """ Returns (and removes) the batch of Tellos waiting - must be called with lock held. """
+        batch = self.waiting
+        self.waiting = []
+        return batch
+
+    def sent(self, send_times):
+        """ Record the time each datagram in a batch was sent, then release any Tellos waiting for the batch. """
+        with self.lock:
+            self.send_times.extend(send_times)
+        self.released.set()
+
+    @property
+    def complete(self):
+        """ True once the command has been sent to every Tello. """
+        return len(self.send_times) >= self.size
+
+    @property
+    def skew(self):
+        """ Seconds between the first and last datagrams being sent, or None if none sent yet. """
+        if not self.send_times:
+            return None
+        return max(self.send_times) - min(self.send_times)
+
+
+class SyncResult:
+    """ Outcome of waiting for a group of Tellos to complete their queued commands - as returned by wait_sync.
+
+        True if every Tello finished, so can be used directly as a condition, e.g. "if not fly.wait_sync(10): ...".
+    """
+
+    def __init__(self, finished, timed_out, durations):
+        """ :param finished: Nums of the Tellos which were idle by the deadline, in order.
+            :param timed_out: Nums of the Tellos which still had commands queued or awaiting a response.
+            :param durations: Dict of {num: secs} - how long each finished Tello took to become idle (zero if it
+                               already was), or None for those which timed out.
+        """
+        self.finished = finished
+        self.timed_out = timed_out
+        self.durations = durations
+
+    def __bool__(self):
+        return not self.timed_out
+
+    def __repr__(self):
+        return 'SyncResult(finished=%s, timed_out=%s)' % (self.finished, self.timed_out)
+
+
+class TelloRegistry:
+    """ Holds all active Tello objects, indexed by IP, number and serial number for constant-time lookup.
+
+        Used in place of a plain list of Tellos, as it is consulted for every message received from a Tello.  Lookups
+        and iteration never lock: each change (from e.g. the receive thread) builds new indexes and a new tuple of
+        Tellos, then swaps them in, so other threads always see a consistent snapshot.
+    """
+
+    def __init__(self):
+        """ Create an empty registry, with its lock used only when adding Tellos or re-indexing. """
+        self._lock = threading.Lock()
+        self._tellos = ()
+        self._by_ip = {}
+        self._by_num = {}
+        self._by_sn = {}
+
+    def __iter__(self):
+        """ Iterate over a snapshot of the Tellos, sorted by num once reindex() has been called. """
+        return iter(self._tellos)
+
+    def __len__(self):
+        return len(self._tellos)
+
+    def __getitem__(self, index):
+        return self._tellos[index]
+
+    def add(self, tello):
+        """ Add a new Tello to the registry, unless one with the same IP is already registered.
+
+            :param tello: The Tello object to add.
+            :return: True if the Tello was added, or False if its IP was already registered.
+        """
+        with self._lock:
+            if tello.ip in self._by_ip:
+                return False
+            by_ip = dict(self._by_ip)
+            by_ip[tello.ip] = tello
+            self._by_ip = by_ip
+            self._tellos = self._tellos + (tello,)
+            return True
+
+    def reindex(self):
+        """ Rebuild the num and sn indexes, and sort by num - must be called after changing a Tello's num or sn. """
+        with self._lock:
+            self._tellos = tuple(sorted(self._tellos, key=lambda tello: tello.num))
+            self._by_num = {tello.num: tello for tello in self._tellos}
+            self._by_sn = {tello.sn: tello for tello in self._tellos if tello.sn is not None}
+
+    def has_ip(self, ip):
+        """ Returns True if a Tello with the specified IP address is registered. """
+        return ip in self._by_ip
+
+    def get_by_ip(self, ip):
+        """ Returns the Tello with the specified IP address (as a string), or None if not found. """
+        return self._by_ip.get(ip)
+
+    def get_by_num(self, num):
+        """ Returns the Tello with the specified number (1,2,...), or None if not found. """
+        return self._by_num.get(num)
+
+    def get_by_sn(self, sn):
+        """ Returns the Tello with the specified serial number, or None if not found. """
+        return self._by_sn.get(sn)
@@ -0,0 +1,450 @@
+#
+# Gateway daemon which owns the CommsManager (and so UDP ports 8889 / 8890), shared by any number of local clients.
+#
+# Only one process can bind the Tello ports, so without the gateway a monitoring tool or emergency_stop.py can't run
+#  alongside a flight.  Start the gateway once, then connect from as many processes as needed:
+#       python tello_gateway.py serve 0TQDG2KEDB4F1 0TQDG2KEDBWK3 --get-status
+#       python tello_gateway.py status                  (streams status from every Tello)
+#       python tello_gateway.py land                    (priority lane - discards anything queued)
+#
+# FlyTello always creates its own CommsManager, so a FlyTello script can't run whilst the gateway is running - the
+#  processes sharing the gateway must use GatewayClient instead.
+#
+# Clients talk to the gateway over a Unix socket, one JSON object per line in each direction.  Requests carry an id,
+#  which is echoed in the reply: {"id": 1, "op": "queue", "commands": [{"command": "battery?", "command_type":
+#  "Read", "tello": "All"}]} -> {"id": 1, "result": [[[1, 5], [2, 5]]]}.  Status messages are streamed to subscribed
+#  clients as {"event": "status", "num": 1, "time": ..., "data": "mid:-1;x:0;..."}.  GatewayClient wraps all of this.
+#
+
+import argparse
+import json
+import os
+import queue
+import socket
+import tempfile
+import threading
+from comms_manager import CommsManager
+from async_comms_manager import AsyncCommsManager
+from tello import SyncResult
+from tello_status import parse_status
+
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), 'tello_gateway.sock')
+
+
+#
+# CLASS DEFINITIONS
+#
+
+class TelloGateway:
+    """ Serves a CommsManager to local clients over a Unix socket - see the top of this file for the protocol.
+
+        Each client connection has a reader thread, which carries out requests in order, and a writer thread, which
+         sends replies and status messages.  Requests which may block (wait_sync, response) are carried out on their
+         own threads, so they never hold up the client's other requests, and priority requests never wait behind
+         anything.
+    """
+
+    def __init__(self, tello_mgr, socket_path=DEFAULT_SOCKET_PATH):
+        """ :param tello_mgr: A CommsManager (or AsyncCommsManager), with its Tellos already initialised.
+            :param socket_path: Path of the Unix socket on which to listen for clients.
+        """
+        self.tello_mgr = tello_mgr
+        self.socket_path = socket_path
+        self.connections = []
+        self.lock = threading.Lock()
+        self.terminate = False
+
+        self._remove_stale_socket()
+        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server_socket.bind(socket_path)
+        # Only the owner may fly the Tellos
+        os.chmod(socket_path, 0o600)
+        self.server_socket.listen()
+        self.tello_mgr.status_listeners.append(self._broadcast_status)
+        self.accept_thread = threading.Thread(target=self._accept_thread)
+        self.accept_thread.daemon = True
+        self.accept_thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """ Stop accepting clients, disconnect those connected, and remove the socket - the CommsManager stays open. """
+        self.terminate = True
+        self.tello_mgr.status_listeners.remove(self._broadcast_status)
+        try:
+            self.server_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.server_socket.close()
+        self.accept_thread.join(timeout=1)
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            connection.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    #
+    # PRIVATE HELPER METHODS
+    #
+
+    def _remove_stale_socket(self):
+        """ Remove the socket file left by a gateway which is no longer running - or raise if it is still running. """
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            os.unlink(self.socket_path)
+            return
+        finally:
+            probe.close()
+        raise RuntimeError('A gateway is already running on %s' % self.socket_path)
+
+    def _broadcast_status(self, tello, data):
+        """ Status listener - pass each status message on to every subscribed client. """
+        message = None
+        for connection in self.connections:
+            if connection.subscribed:
+                if message is None:
+                    message = _encode({'event': 'status', 'num': tello.num, 'time': tello.status.timestamp,
+                                       'data': bytes(data).decode()})
+                connection.send_queue.put(message)
+
+    def _handle_request(self, connection, request):
+        """ Carry out a single request, sending the reply (if any) to the client. """
+        try:
+            op = request['op']
+            if op in ('wait_sync', 'response'):
+                thread = threading.Thread(target=self._handle_blocking_request, args=(connection, request))
+                thread.daemon = True
+                thread.start()
+                return
+            if op == 'queue':
+                result = [self.tello_mgr.queue_command(command['command'], command['command_type'],
+                                                       command.get('tello', 'All'), command.get('on_error'),
+                                                       command.get('barrier', False))
+                          for command in request['commands']]
+            elif op == 'priority':
+                result = len(self.tello_mgr.priority_command(request['command'], request.get('tello', 'All')))
+            elif op == 'tellos':
+                result = [{'num': tello.num, 'sn': tello.sn, 'ip': tello.ip} for tello in self.tello_mgr.tellos]
+            elif op == 'subscribe':
+                connection.subscribed = True
+                result = True
+            elif op == 'unsubscribe':
+                connection.subscribed = False
+                result = False
+            else:
+                raise RuntimeError('Unknown op: %s' % op)
+            connection.reply(request, result)
+        except (RuntimeError, KeyError, TypeError) as error:
+            connection.reply_error(request, error)
+
+    def _handle_blocking_request(self, connection, request):
+        """ Carry out a request which may block until the Tellos catch up - runs in its own thread. """
+        try:
+            if request['op'] == 'wait_sync':
+                sync = self.tello_mgr.wait_sync(request.get('timeout'), request.get('tello', 'All'))
+                result = {'finished': sync.finished, 'timed_out': sync.timed_out, 'durations': sync.durations}
+            else:
+                tello = self.tello_mgr.get_tello(request['tello'])
+                timeout = request.get('timeout', 10)
+                log_entry = tello.log_entry(request['cmd_id'], timeout)
+                log_entry.wait_response(timeout)
+                result = {'response': log_entry.response, 'success': log_entry.success}
+            connection.reply(request, result)
+        except (RuntimeError, KeyError, TypeError) as error:
+            connection.reply_error(request, error)
+
+    #
+    # THREADS
+    #
+
+    def _accept_thread(self):
+        """ Accept each new client, starting its reader and writer threads. """
+        while not self.terminate:
+            try:
+                client_socket, _ = self.server_socket.accept()
+            except OSError:
+                return
+            connection = _GatewayConnection(self, client_socket)
+            with self.lock:
+                # Copy-on-write, so the status listener can iterate without the lock
+                self.connections = self.connections + [connection]
+            connection.start()
+
+    def _connection_closed(self, connection):
+        with self.lock:
+            self.connections = [other for other in self.connections if other is not connection]
+
+
+class _GatewayConnection:
+    """ A single client of the TelloGateway. """
+
+    def __init__(self, gateway, client_socket):
+        self.gateway = gateway
+        self.socket = client_socket
+        self.send_queue = queue.SimpleQueue()
+        self.subscribed = False
+        self.reader_thread = threading.Thread(target=self._reader_thread)
+        self.reader_thread.daemon = True
+        self.writer_thread = threading.Thread(target=self._writer_thread)
+        self.writer_thread.daemon = True
+
+    def start(self):
+        self.reader_thread.start()
+        self.writer_thread.start()
+
+    def close(self):
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def reply(self, request, result):
+        self.send_queue.put(_encode({'id': request.get('id'), 'result': result}))
+
+    def reply_error(self, request, error):
+        self.send_queue.put(_encode({'id': request.get('id'), 'error': str(error)}))
+
+    def _reader_thread(self):
+        """ Read each request (one per line) and carry it out, until the client disconnects. """
+        try:
+            with self.socket.makefile('rb') as reader:
+                for line in reader:
+                    try:
+                        request = json.loads(line)
+                    except ValueError as error:
+                        self.reply_error({}, error)
+                        continue
+                    self.gateway._handle_request(self, request)
+        except OSError:
+            pass
+        finally:
+            self.subscribed = False
+            self.gateway._connection_closed(self)
+            self.send_queue.put(None)
+
+    def _writer_thread(self):
+        """ Send queued replies and status messages - everything already queued is sent together, in one write. """
+        try:
+            while True:
+                message = self.send_queue.get()
+                if message is None:
+                    break
+                messages = [message]
+                while True:
+                    try:
+                        message = self.send_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if message is None:
+                        break
+                    messages.append(message)
+                self.socket.sendall(b''.join(messages))
+                if message is None:
+                    break
+        except OSError:
+            pass
+        finally:
+            self.socket.close()
+
+
+class GatewayClient:
+    """ Connects to a TelloGateway, with methods matching those of CommsManager.
+
+        Safe to use from several threads at once - each request waits only for its own reply.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH):
+        """ :param socket_path: Path of the gateway's Unix socket.  Raises OSError if no gateway is running. """
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socket_path)
+        self.lock = threading.Lock()
+        self.next_id = 0
+        # Requests awaiting a reply - {id: [threading.Event, reply]}
+        self.pending = {}
+        self.status_callbacks = []
+        self.reader_thread = threading.Thread(target=self._reader_thread)
+        self.reader_thread.daemon = True
+        self.reader_thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """ Disconnect from the gateway - the gateway, and anything already queued, carries on regardless. """
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.reader_thread.join(timeout=1)
+        self.socket.close()
+
+    def tellos(self):
+        """ Returns the Tellos connected to the gateway, as a list of {'num': ..., 'sn': ..., 'ip': ...}. """
+        return self._request('tellos')
+
+    def queue_command(self, command, command_type, tello_num='All', on_error=None, barrier=False):
+        """ Queue a command, exactly as CommsManager.queue_command - returns a list of (tello_num, cmd_id). """
+        return self.queue_commands([{'command': command, 'command_type': command_type, 'tello': tello_num,
+                                     'on_error': on_error, 'barrier': barrier}])[0]
+
+    def queue_commands(self, commands):
+        """ Queue several commands in a single request - much faster than queuing each separately.
+
+            :param commands: List of dicts, each with 'command' and 'command_type', and optionally 'tello', 'on_error'
+                              and 'barrier' - as the arguments of queue_command.
+            :return: For each command, a list of (tello_num, cmd_id).
+        """
+        return [[tuple(cmd_id) for cmd_id in cmd_ids] for cmd_ids in self._request('queue', commands=commands)]
+
+    def priority_command(self, command, tello_num='All'):
+        """ Send 'emergency', 'stop' or 'land' straight away, via CommsManager.priority_command.
+
+            :return: The number of Tellos the command was sent to.
+        """
+        return self._request('priority', command=command, tello=tello_num)
+
+    def wait_sync(self, timeout=None, tello_num='All'):
+        """ Block until the Tellos are ready, exactly as CommsManager.wait_sync - returns a SyncResult. """
+        result = self._request('wait_sync', timeout=timeout, tello=tello_num)
+        return SyncResult(result['finished'], result['timed_out'],
+                          {int(num): secs for num, secs in result['durations'].items()})
+
+    def get_response(self, tello_num, cmd_id, timeout=10):
+        """ Wait for the response to a queued command, returning (response, success) - or (None, None) if none yet. """
+        result = self._request('response', tello=tello_num, cmd_id=cmd_id, timeout=timeout)
+        return result['response'], result['success']
+
+    def subscribe_status(self, callback):
+        """ Stream status messages from every Tello - callback(tello_num, status) is run for each one, from the
+            client's reader thread, with status as a TelloStatus.
+        """
+        self.status_callbacks.append(callback)
+        if len(self.status_callbacks) == 1:
+            self._request('subscribe')
+
+    def unsubscribe_status(self, callback):
+        """ Stop calling callback for each status message. """
+        self.status_callbacks.remove(callback)
+        if not self.status_callbacks:
+            self._request('unsubscribe')
+
+    #
+    # PRIVATE HELPER METHODS
+    #
+
+    def _request(self, op, **fields):
+        """ Send a request, and block until its reply is received - returning the result, or raising RuntimeError. """
+        reply_event = threading.Event()
+        with self.lock:
+            self.next_id += 1
+            request_id = self.next_id
+            self.pending[request_id] = [reply_event, None]
+            fields.update(id=request_id, op=op)
+            self.socket.sendall(_encode(fields))
+        reply_event.wait()
+        reply = self.pending.pop(request_id)[1]
+        if reply is None:
+            raise RuntimeError('Gateway connection closed')
+        if 'error' in reply:
+            raise RuntimeError('Gateway error: %s' % reply['error'])
+        return reply['result']
+
+    def _reader_thread(self):
+        """ Pass each reply to the request waiting for it, and each status message to the status callbacks. """
+        try:
+            with self.socket.makefile('rb') as reader:
+                for line in reader:
+                    message = json.loads(line)
+                    if message.get('event') == 'status':
+                        status = parse_status(message['data'].encode(), message['time'])
+                        for callback in self.status_callbacks:
+                            callback(message['num'], status)
+                    elif message.get('id') in self.pending:
+                        self.pending[message['id']][1] = message
+                        self.pending[message['id']][0].set()
+        except OSError:
+            pass
+        finally:
+            # Wake any requests still waiting, which will then raise
+            for reply_event, _ in list(self.pending.values()):
+                reply_event.set()
+
+
+#
+# FUNCTION DEFINITIONS
+#
+
+def _encode(message):
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode()
+
+
+def serve(sn_list, socket_path=DEFAULT_SOCKET_PATH, backend='thread', get_status=False, **init_args):
+    """ Find the Tellos, then serve them to gateway clients until interrupted (Ctrl-C).
+
+        :param sn_list: List of serial numbers, in the order we want to number the Tellos.
+        :param socket_path: Path of the Unix socket on which to listen for clients.
+        :param backend: Either 'thread' (CommsManager) or 'asyncio' (AsyncCommsManager).
+        :param get_status: If True, listen for status messages - required for clients to subscribe to status.
+        :param init_args: Any further arguments for CommsManager.init_tellos, e.g. first_ip, last_ip, subnet.
+    """
+    local_ip = init_args.pop('local_ip', '')
+    tello_mgr = AsyncCommsManager(local_ip=local_ip) if backend == 'asyncio' else CommsManager(local_ip=local_ip)
+    try:
+        tello_mgr.init_tellos(sn_list, get_status=get_status, **init_args)
+        with TelloGateway(tello_mgr, socket_path):
+            print('[Gateway]Serving %d Tello(s) on %s - Ctrl-C to stop' % (len(tello_mgr.tellos), socket_path))
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                print('[Gateway]Stopping...')
+    finally:
+        tello_mgr.close_connections()
+
+
+#
+# MAIN SCRIPT
+#
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Share one CommsManager between several local processes.')
+    parser.add_argument('action', choices=['serve', 'status', 'land', 'stop', 'emergency'],
+                        help='Run the gateway, stream status from it, or send a priority command through it')
+    parser.add_argument('serials', nargs='*', help='For serve, serial numbers of the Tellos in order of number')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, help='Path of the gateway\'s Unix socket')
+    parser.add_argument('--tello', default='All', help='For a priority command, the Tello number (or All)')
+    parser.add_argument('--backend', default='thread', choices=['thread', 'asyncio'], help='CommsManager backend')
+    parser.add_argument('--get-status', action='store_true', help='For serve, listen for Tello status messages')
+    parser.add_argument('--first-ip', type=int, default=1, help='For serve, first IP (last octet) to search')
+    parser.add_argument('--last-ip', type=int, default=254, help='For serve, last IP (last octet) to search')
+    parser.add_argument('--local-ip', default='', help='For serve, local address to bind to')
+    parser.add_argument('--subnet', default=None, help='For serve, a /24 network to search, e.g. 127.0.0.0/24')
+    args = parser.parse_args()
+
+    if args.action == 'serve':
+        serve(args.serials, args.socket, args.backend, args.get_status, first_ip=args.first_ip, last_ip=args.last_ip,
+              local_ip=args.local_ip, subnet=args.subnet)
+    else:
+        with GatewayClient(args.socket) as client:
+            if args.action == 'status':
+                client.subscribe_status(lambda num, status: print('[Status %d]%s' % (num, status)))
+                try:
+                    threading.Event().wait()
+                except KeyboardInterrupt:
+                    pass
+            else:
+                tello_num = args.tello if args.tello == 'All' else int(args.tello)
+                print('[Gateway]Sent %s to %d Tello(s)' % (args.action, client.priority_command(args.action,
+                                                                                                  tello_num)))
@@ -0,0 +1,350 @@
+import argparse
+import heapq
+import random
+import selectors
+import socket
+import threading
+import time
+
+
+class TelloSimulator:
+    """ Runs a fleet of virtual Tellos on local addresses, so that FlyTello can be flown without any real drones.
+
+        Each VirtualTello binds its own address (by default 127.0.0.2, 127.0.0.3, ... on the loopback interface) on the
+        control port, answers Tello SDK commands as a Tello would, and once in SDK mode pushes status messages to the
+        status port of whoever sent it 'command'.  Latency, jitter, packet loss and command durations are configurable.
+
+        CommsManager must bind a specific local address so as not to clash with the virtual Tellos, e.g.:
+            with TelloSimulator(num_tellos=2) as sim:
+                with FlyTello(sim.serials, local_ip='127.0.0.1', subnet='127.0.0.0/24') as fly:
+                    fly.takeoff()
+
+        Also runnable as a script, e.g. 'python tello_simulator.py --tellos 20 --latency 0.01'.
+    """
+
+    #
+    # CLASS INIT & CONTEXT HANDLER
+    #
+
+    def __init__(self, num_tellos, first_ip='127.0.0.2', serials=None, latency=0.0, jitter=0.0, loss=0.0,
+                 command_durations=None, status_interval=0.1, control_port=8889, status_port=8890, seed=None,
+                 tello_factory=None):
+        """ Create the virtual Tellos - call start() (or use as a Context Manager) to bring them online.
+
+            :param num_tellos: Number of virtual Tellos to create.
+            :param first_ip: Address of the first virtual Tello - each subsequent Tello takes the next address.
+            :param serials: Optionally, a list of serial numbers to use.  Otherwise 'SIM000001', 'SIM000002', etc.
+            :param latency: Seconds added before each reply or status message is sent, i.e. simulated round-trip time.
+            :param jitter: Max random seconds added on top of latency, for each reply or status message.
+            :param loss: Probability (0-1) that any single datagram, in either direction, is lost.
+            :param command_durations: Dict of seconds each command takes to complete, keyed by the command's first
+                                      word, e.g. {'takeoff': 3, 'forward': 1}.  Commands not included are instant.
+            :param status_interval: Seconds between status messages from each Tello, or None to send no status.
+            :param control_port: Port on which each virtual Tello listens for commands.
+            :param status_port: Port to which each virtual Tello sends its status messages.
+            :param seed: Optional seed for the random number generator, to make loss and jitter repeatable.
+            :param tello_factory: Optionally, a callable(ip, sn) returning each virtual Tello, e.g. a VirtualTello
+                                  subclass with scripted responses.  Defaults to VirtualTello.
+        """
+        if serials is None:
+            serials = ['SIM%06d' % num for num in range(1, num_tellos + 1)]
+        if tello_factory is None:
+            tello_factory = VirtualTello
+        first_ip_parts = [int(part) for part in first_ip.split('.')]
+        self.tellos = []
+        for index in range(num_tellos):
+            ip = '%d.%d.%d.%d' % tuple(first_ip_parts[:3] + [first_ip_parts[3] + index])
+            self.tellos.append(tello_factory(ip, serials[index]))
+
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.command_durations = command_durations if command_durations is not None else {}
+        self.status_interval = status_interval
+        self.control_port = control_port
+        self.status_port = status_port
+        self.random = random.Random(seed)
+
+        self.terminate = False
+        self.selector = None
+        self.threads = []
+
+        # Heap of datagrams waiting to be sent, as (send_time, sequence, tello, data, addr, is_reply), and its Condition
+        self.send_heap = []
+        self.send_sequence = 0
+        self.send_condition = threading.Condition()
+
+    def __enter__(self):
+        """ (ContextManager) Start the simulator when used in a with statement. """
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """ (ContextManager) Stop the simulator when leaving the with statement. """
+        self.stop()
+
+    #
+    # PUBLIC METHODS
+    #
+
+    @property
+    def serials(self):
+        """ List of the serial numbers of all virtual Tellos, in order - as needed to initialise FlyTello. """
+        return [tello.sn for tello in self.tellos]
+
+    def start(self):
+        """ Bind each virtual Tello's socket, then start the receive, send and status threads. """
+        self.selector = selectors.DefaultSelector()
+        for tello in self.tellos:
+            tello.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            tello.socket.bind((tello.ip, self.control_port))
+            tello.socket.setblocking(False)
+            self.selector.register(tello.socket, selectors.EVENT_READ, tello)
+
+        for target in [self._receive_thread, self._send_thread, self._status_thread]:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """ Stop all threads and close all sockets. """
+        self.terminate = True
+        with self.send_condition:
+            self.send_condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.selector.close()
+        for tello in self.tellos:
+            tello.socket.close()
+
+    def get_tello(self, sn):
+        """ Return the VirtualTello with the specified serial number. """
+        for tello in self.tellos:
+            if tello.sn == sn:
+                return tello
+        raise RuntimeError('Virtual Tello not found!')
+
+    #
+    # PRIVATE HELPER METHODS
+    #
+
+    def _lost(self):
+        """ Returns True if a datagram should be dropped, according to the configured loss probability. """
+        return self.loss > 0 and self.random.random() < self.loss
+
+    def _schedule(self, delay, tello, data, addr, is_reply=True):
+        """ Schedule a datagram to be sent from a virtual Tello after delay seconds, plus latency and jitter.
+
+            :param delay: Seconds before the datagram is due, not including latency and jitter.
+            :param tello: The VirtualTello sending the datagram.
+            :param data: The string to send.
+            :param addr: Destination address, as an (ip, port) tuple.
+            :param is_reply: True for a reply to a command (recorded in the Tello's replies), False for a status
+                              message.
+        """
+        if self._lost():
+            return
+        send_time = time.perf_counter() + delay + self.latency + self.random.uniform(0, self.jitter)
+        with self.send_condition:
+            self.send_sequence += 1
+            heapq.heappush(self.send_heap, (send_time, self.send_sequence, tello, data, addr, is_reply))
+            self.send_condition.notify()
+
+    #
+    # THREADS
+    #
+
+    def _receive_thread(self):
+        """ Receive commands for all virtual Tellos, scheduling each reply once the command would be complete. """
+        while not self.terminate:
+            for key, _ in self.selector.select(timeout=0.1):
+                tello = key.data
+                try:
+                    data, addr = tello.socket.recvfrom(1024)
+                except OSError:
+                    continue
+                if self._lost():
+                    continue
+                received = time.perf_counter()
+                command = data.decode().strip()
+                tello.received.append((received, command))
+                if command == 'command':
+                    tello.controller_ip = addr[0]
+                response = tello.respond(command)
+                if response is None:
+                    continue
+                # Commands are processed one at a time, so a command can't start until the previous one has finished
+                #  - except for 'stop' and 'emergency', which take effect immediately.
+                duration = tello.command_duration(command)
+                if duration is None:
+                    duration = self.command_durations.get(command.split(' ')[0], 0)
+                if command in ('stop', 'emergency'):
+                    tello.busy_until = received
+                tello.busy_until = max(tello.busy_until, received) + duration
+                self._schedule(tello.busy_until - received, tello, response, addr)
+
+    def _send_thread(self):
+        """ Send scheduled datagrams (replies and status messages) once they are due. """
+        while True:
+            with self.send_condition:
+                while not self.terminate and (not self.send_heap or self.send_heap[0][0] > time.perf_counter()):
+                    timeout = self.send_heap[0][0] - time.perf_counter() if self.send_heap else None
+                    self.send_condition.wait(timeout)
+                if self.terminate:
+                    return
+                _, _, tello, data, addr, is_reply = heapq.heappop(self.send_heap)
+            try:
+                tello.socket.sendto(data.encode(), addr)
+                if is_reply:
+                    tello.replies.append((time.perf_counter(), data))
+            except OSError:
+                pass
+
+    def _status_thread(self):
+        """ Every status_interval, send a status message from each virtual Tello that is in SDK mode. """
+        if self.status_interval is None:
+            return
+        next_time = time.perf_counter()
+        while not self.terminate:
+            for tello in self.tellos:
+                if tello.controller_ip is not None:
+                    self._schedule(0, tello, tello.status_message(), (tello.controller_ip, self.status_port),
+                                   is_reply=False)
+            next_time += self.status_interval
+            time.sleep(max(0.0, next_time - time.perf_counter()))
+
+
+class VirtualTello:
+    """ State of a single simulated Tello, and its responses to each Tello SDK command. """
+
+    def __init__(self, ip, sn):
+        """ :param ip: Address on which this virtual Tello listens, as a string.
+            :param sn: Serial number reported by this virtual Tello.
+        """
+        self.ip = ip
+        self.sn = sn
+        self.socket = None
+        # IP address of the controller, once 'command' has been received - status messages are only sent once known
+        self.controller_ip = None
+        # Time (perf_counter) at which the current command will be complete
+        self.busy_until = 0.0
+        # Every command received and reply sent, as (perf_counter, string) tuples - useful for timing and benchmarks
+        self.received = []
+        self.replies = []
+
+        self.flying = False
+        self.battery = 100
+        self.speed = 100
+        self.mission_pads = False
+        self.takeoff_time = None
+        self.x, self.y, self.z, self.yaw = 0, 0, 0, 0
+
+    def respond(self, command):
+        """ Update the virtual Tello's state for a command, returning the response it should send.
+
+            :param command: The Tello SDK string received, e.g. 'forward 50'.
+            :return: The response string, or None if the Tello doesn't respond to this command (i.e. 'rc').
+        """
+        parts = command.split(' ')
+        name, args = parts[0], parts[1:]
+
+        # Read commands
+        reads = {'sn?': lambda: self.sn,
+                 'battery?': lambda: '%d' % self.battery,
+                 'speed?': lambda: '%.1f' % self.speed,
+                 'time?': lambda: '%ds' % self.flight_time(),
+                 'wifi?': lambda: '90',
+                 'sdk?': lambda: '20',
+                 'height?': lambda: '%ddm' % (self.z // 10),
+                 'tof?': lambda: '%dmm' % (self.z * 10)}
+        if name in reads:
+            return reads[name]()
+
+        # Control and Set commands
+        if name == 'rc':
+            return None
+        if name in ('command', 'stop', 'mon', 'moff', 'mdirection', 'ap', 'wifi'):
+            self.mission_pads = {'mon': True, 'moff': False}.get(name, self.mission_pads)
+            return 'ok'
+        if name == 'speed':
+            self.speed = int(args[0])
+            return 'ok'
+        if name == 'takeoff':
+            self.flying, self.z, self.takeoff_time = True, 80, time.perf_counter()
+            return 'ok'
+        if name in ('land', 'emergency'):
+            self.flying, self.z = False, 0
+            return 'ok'
+        if not self.flying:
+            return 'error Not flying'
+        moves = {'forward': (1, 0, 0), 'back': (-1, 0, 0), 'left': (0, 1, 0), 'right': (0, -1, 0),
+                 'up': (0, 0, 1), 'down': (0, 0, -1)}
+        if name in moves:
+            dist = int(args[0])
+            self.x += moves[name][0] * dist
+            self.y += moves[name][1] * dist
+            self.z = max(0, self.z + moves[name][2] * dist)
+            return 'ok'
+        if name in ('cw', 'ccw'):
+            self.yaw = (self.yaw + (1 if name == 'cw' else -1) * int(args[0])) % 360
+            return 'ok'
+        if name == 'flip':
+            return 'ok' if self.battery >= 50 else 'error'
+        if name in ('go', 'curve', 'jump'):
+            # Moves end at the x, y, z given (the second point, for a curve) - mission pad moves are approximated as
+            #  relative moves.
+            coords = [int(arg) for arg in args[:6] if arg.lstrip('-').isdigit()]
+            end = coords[3:6] if name == 'curve' else coords[0:3]
+            self.x, self.y, self.z = self.x + end[0], self.y + end[1], max(0, self.z + end[2])
+            return 'ok'
+        return 'error'
+
+    def command_duration(self, command):
+        """ Seconds the command just responded to takes to complete, or None to use the simulator's
+            command_durations.  Overridden by virtual Tellos which script their own timing.
+        """
+        return None
+
+    def flight_time(self):
+        """ Seconds since takeoff, or 0 if not flying. """
+        if not self.flying or self.takeoff_time is None:
+            return 0
+        return int(time.perf_counter() - self.takeoff_time)
+
+    def status_message(self):
+        """ Returns a status message string, in the same format as sent by the Tello to port 8890. """
+        return ('mid:-1;x:0;y:0;z:0;mpry:0,0,0;pitch:0;roll:0;yaw:%d;vgx:0;vgy:0;vgz:0;templ:60;temph:62;'
+                'tof:%d;h:%d;bat:%d;baro:%.2f;time:%d;agx:0.00;agy:0.00;agz:-1000.00;\r\n'
+                % (self.yaw, self.z + 10, self.z, self.battery, self.z / 100, self.flight_time()))
+
+
+#
+# MAIN SCRIPT
+#
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a fleet of virtual Tellos on local addresses.')
+    parser.add_argument('--tellos', type=int, default=2, help='Number of virtual Tellos')
+    parser.add_argument('--first-ip', default='127.0.0.2', help='Address of the first virtual Tello')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added before each reply')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Max random seconds added to latency')
+    parser.add_argument('--loss', type=float, default=0.0, help='Probability (0-1) of losing each datagram')
+    parser.add_argument('--duration', action='append', default=[], metavar='COMMAND=SECS',
+                        help='Seconds a command takes, e.g. --duration takeoff=3 (may be repeated)')
+    args = parser.parse_args()
+
+    durations = {}
+    for duration in args.duration:
+        name, secs = duration.split('=')
+        durations[name] = float(secs)
+
+    with TelloSimulator(args.tellos, first_ip=args.first_ip, latency=args.latency, jitter=args.jitter,
+                        loss=args.loss, command_durations=durations) as simulator:
+        print('[Simulator]Running %d virtual Tello(s) on %s upwards' % (args.tellos, args.first_ip))
+        print('[Simulator]Serial numbers: %s' % ', '.join(simulator.serials))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print('[Simulator]Stopped')
@@ -0,0 +1,135 @@
+import re
+import time
+
+
+# Fields of the Tello status message (port 8890), in the order sent, with the type each value is parsed as.
+#  mid, x, y, z and mpry are only sent by SDK 2.0 (Tello EDU) - they are None for earlier firmware.
+STATUS_FIELDS = (('mid', int), ('x', int), ('y', int), ('z', int), ('mpry', tuple),
+                 ('pitch', int), ('roll', int), ('yaw', int),
+                 ('vgx', int), ('vgy', int), ('vgz', int),
+                 ('templ', int), ('temph', int), ('tof', int), ('h', int), ('bat', int),
+                 ('baro', float), ('time', int),
+                 ('agx', float), ('agy', float), ('agz', float))
+
+# Index of each field's slot, and its type, keyed by the field name as it appears (as bytes) in the status message
+_FIELD_INDEX = {name.encode(): (index, field_type) for index, (name, field_type) in enumerate(STATUS_FIELDS)}
+_FIELD_NAMES = tuple(name for name, _ in STATUS_FIELDS)
+_FIELD_NAME_SET = frozenset(_FIELD_NAMES)
+# Each 'key:value' part of the status message - matched in place, so the message itself is never copied or split
+_STATUS_PART = re.compile(rb'([^:;]+):([^;]*)')
+
+
+# Read commands which can be answered from a status message instead, giving the same response as the Tello itself.
+#  'speed?' is not included - it reads the speed setting, whereas vgx, vgy and vgz are the actual speeds.
+STATUS_READS = {'battery?': lambda status: '%d' % status.bat,
+                'time?': lambda status: '%ds' % status.time,
+                'height?': lambda status: '%ddm' % (status.h // 10),
+                'tof?': lambda status: '%dmm' % (status.tof * 10),
+                'temp?': lambda status: '%d~%dC' % (status.templ, status.temph),
+                'attitude?': lambda status: 'pitch:%d;roll:%d;yaw:%d;' % (status.pitch, status.roll, status.yaw),
+                'baro?': lambda status: '%s' % status.baro,
+                'acceleration?': lambda status: 'agx:%.2f;agy:%.2f;agz:%.2f;' % (status.agx, status.agy, status.agz)}
+
+
+class TelloStatus:
+    """ A single status message from a Tello, parsed into fixed, typed fields - e.g. status.bat, status.baro.
+
+        Each record is created complete and never modified, so the Tello's latest status can be swapped in atomically
+         and readers always see a consistent snapshot.  Fields not included in the message are None.
+        Also behaves as a read-only mapping keyed by the Tello SDK field names, e.g. status['bat'], 'h' in status.
+    """
+
+    __slots__ = tuple(name for name, _ in STATUS_FIELDS) + ('timestamp',)
+
+    def __init__(self, values=(), timestamp=None):
+        """ :param values: Sequence of field values, in the order of STATUS_FIELDS - missing values default to None.
+            :param timestamp: Time (as returned by time.time()) that the status message was received.
+        """
+        values = tuple(values) + (None,) * (len(STATUS_FIELDS) - len(values))
+        for (name, _), value in zip(STATUS_FIELDS, values):
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, 'timestamp', timestamp)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('TelloStatus is read-only')
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in _FIELD_NAME_SET and getattr(self, key) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return 'TelloStatus(%s)' % self.as_dict()
+
+    def __str__(self):
+        return str(self.as_dict())
+
+    def get(self, key, default=None):
+        """ Returns the value of the named field, or default if it wasn't included in the status message. """
+        return getattr(self, key) if key in self else default
+
+    def keys(self):
+        """ Returns the names of all fields included in the status message. """
+        return [name for name in _FIELD_NAMES if getattr(self, name) is not None]
+
+    def as_dict(self):
+        """ Returns the fields included in the status message, as a dict. """
+        return {name: getattr(self, name) for name in self.keys()}
+
+    def age(self):
+        """ Returns the number of seconds since this status message was received. """
+        return time.time() - self.timestamp
+
+
+def parse_status(data, timestamp=None):
+    """ Parse a raw status message from a Tello into a TelloStatus record, without first decoding it to a string - or
+         copying it, so it can be parsed straight from the receive buffer.
+
+        e.g. b'mid:-1;x:0;y:0;z:0;mpry:0,0,0;pitch:0;roll:0;yaw:0;...;agz:-1000.00;\\r\\n'
+
+        :param data: The bytes (or any bytes-like object, e.g. a memoryview of the receive buffer) received.
+        :param timestamp: Time the message was received - defaults to now.
+        :return: TelloStatus, with None for any field which was missing or couldn't be parsed.
+    """
+    values = [None] * len(STATUS_FIELDS)
+    for match in _STATUS_PART.finditer(data):
+        field = _FIELD_INDEX.get(match[1])
+        if field is None:
+            continue
+        index, field_type = field
+        value = match[2]
+        try:
+            if field_type is tuple:
+                values[index] = tuple(int(part) for part in value.split(b','))
+            else:
+                # int() and float() both accept bytes directly, so no decode is needed
+                values[index] = field_type(value)
+        except ValueError:
+            pass
+    return TelloStatus(values, time.time() if timestamp is None else timestamp)
+
+
+def read_from_status(command, status, max_age):
+    """ Returns the response the Tello would give to a Read command, worked out from its latest status instead.
+
+        :param command: The Read command, e.g. 'battery?'.
+        :param status: The Tello's latest TelloStatus.
+        :param max_age: Max age (secs) of the status message for it to be used.
+        :return: The response string, or None if the command isn't in STATUS_READS, or the status is too old (or
+                  doesn't include the fields needed).
+    """
+    if command not in STATUS_READS or status.timestamp is None or status.age() > max_age:
+        return None
+    try:
+        return STATUS_READS[command](status)
+    except TypeError:
+        return None